@@ -1,4 +1,30 @@
 
 __version__ = '0.0.1'
 
+import frappe
 
+
+@frappe.whitelist(allow_guest=True, methods=["GET"])
+def metrics():
+	"""
+	Customer API metrics in Prometheus text format.
+
+	Served at /api/method/customer_api.metrics. With `customer_api_metrics_token`
+	in the site config, scrapers authenticate with "Authorization: Bearer <token>";
+	otherwise a System Manager session or API key is required.
+
+	Returns:
+		Response: text/plain exposition of the histograms
+	"""
+	import hmac
+
+	from werkzeug.wrappers import Response
+
+	from customer_api.monitoring import render_metrics
+
+	token = frappe.conf.get("customer_api_metrics_token")
+	authorization = frappe.get_request_header("Authorization") or ""
+	if not (token and hmac.compare_digest(authorization, f"Bearer {token}")):
+		frappe.only_for("System Manager")
+
+	return Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
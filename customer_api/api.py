@@ -1,14 +1,114 @@
+import json
+import time
+
 import frappe
 from frappe import _
+from frappe.model import no_value_fields
+from frappe.utils.caching import request_cache
+from redis.exceptions import RedisError
+
+from customer_api.cache import (
+	get_customer_by_email,
+	get_customer_summary,
+	get_site_config,
+	get_site_config_by_name
+)
+from customer_api.customer_lookup import find_customer, find_customer_match, find_customer_matches, get_match_key
+from customer_api.item_mapping import map_order_items
+from customer_api.monitoring import finish_trace, increment, observe, set_trace_log, stage, start_trace
+from customer_api.rate_limit import check_rate_limit, get_client_ip, too_many_requests, track_listener_load
+from customer_api.stats import increment_site_stat
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+
+def _commit():
+	"""Commit the transaction unless a batch caller owns it."""
+	if not frappe.flags.customer_api_defer_commit:
+		frappe.db.commit()
+
+
+def _rollback():
+	"""
+	Roll back the transaction unless a batch caller owns it.
+	
+	Batch callers roll back to their own per-order savepoint instead, so one
+	failing order does not discard the rest of the chunk.
+	"""
+	if not frappe.flags.customer_api_defer_commit:
+		frappe.db.rollback()
+
+
+class TransactionLostError(Exception):
+	"""The database rolled back a whole transaction (deadlock, lock wait timeout), savepoints included."""
+
+
+def rollback_to_savepoint(savepoint):
+	"""
+	Roll back to a savepoint.
+	
+	Returns False, after rolling back fully, if the savepoint is gone
+	because the database already rolled back the whole transaction.
+	"""
+	try:
+		frappe.db.rollback(save_point=savepoint)
+		return True
+	except Exception:
+		frappe.db.rollback()
+		return False
+
+
+# Rows inserted per transaction by the bulk endpoints
+BULK_CHUNK_SIZE = 200
+
+
+@request_cache
+def get_selling_defaults():
+	"""Return the default customer group and territory from Selling Settings."""
+	return frappe._dict(
+		customer_group=frappe.db.get_single_value("Selling Settings", "customer_group") or _("All Customer Groups"),
+		territory=frappe.db.get_single_value("Selling Settings", "territory") or _("All Territories")
+	)
+
+
+@request_cache
+def get_default_company():
+	"""Return the default company from Global Defaults, or the first company."""
+	company = frappe.db.get_single_value("Global Defaults", "default_company")
+	if not company:
+		company = frappe.get_all("Company", limit=1, pluck="name")[0]
+	
+	return company
+
+
+@request_cache
+def get_address_country(country=None):
+	"""Return a valid Country for an address, falling back to the system default."""
+	if not country:
+		country = frappe.db.get_single_value("System Settings", "country") or "India"
+	
+	# Validate that country exists in the system
+	if not frappe.db.exists("Country", country):
+		# Try to find a default country
+		default_country = frappe.db.get_value("Country", filters={}, fieldname="name")
+		if default_country:
+			country = default_country
+	
+	return country
 
 
 @frappe.whitelist(allow_guest=False)
-def check_customer_registered(customer_name):
+def check_customer_registered(customer_name, fields=None):
 	"""
 	Check if a customer is registered in the system.
 	
 	Args:
 		customer_name (str): The name of the customer to check
+		fields (list): Customer fields to return (optional, default:
+			customer_group, territory, customer_type, disabled)
 		
 	Returns:
 		dict: Dictionary containing customer registration status
@@ -17,41 +117,142 @@ def check_customer_registered(customer_name):
 			- customer_id: The customer ID if registered, else None
 			- customer_group: The customer group if registered, else None
 			- territory: The territory if registered, else None
+			- one key per requested field instead, when fields is given
 	"""
 	
 	if not customer_name:
 		frappe.throw(_("Customer name is required"))
 	
-	# Check if customer exists
-	customer = frappe.db.exists("Customer", {"customer_name": customer_name})
+	if not fields:
+		# Default fields are served from the customer cache
+		return _registration_result(customer_name, get_customer_summary(customer_name))
+	
+	fields = _parse_registration_fields(fields)
+	
+	# Fetch only the requested columns in a single query
+	customer = frappe.db.get_value(
+		"Customer",
+		{"customer_name": customer_name},
+		["name"] + fields,
+		as_dict=True
+	)
+	
+	return _registration_result(customer_name, customer, fields)
+
+
+# Customer fields returned by the registration checks by default
+REGISTRATION_FIELDS = ["customer_group", "territory", "customer_type", "disabled"]
+
+
+@frappe.whitelist(allow_guest=False)
+def check_customers_registered(customer_names=None, emails=None, mobiles=None, fields=None):
+	"""
+	Check many customers at once by name, email or mobile number.
+	
+	All lookups are answered with a single query on Customer (email and
+	mobile match the customer's primary contact details).
 	
-	if customer:
-		# Get customer details
-		customer_doc = frappe.get_doc("Customer", customer)
+	Args:
+		customer_names (list): Customer names to check (optional)
+		emails (list): Email addresses to check (optional)
+		mobiles (list): Mobile numbers to check (optional)
+		fields (list): Customer fields to return (optional, see check_customer_registered)
 		
-		return {
-			"customer_name": customer_name,
-			"is_registered": True,
-			"customer_id": customer_doc.name,
-			"customer_group": customer_doc.customer_group,
-			"territory": customer_doc.territory,
-			"customer_type": customer_doc.customer_type,
-			"disabled": customer_doc.disabled
-		}
-	else:
-		return {
-			"customer_name": customer_name,
-			"is_registered": False,
-			"customer_id": None,
-			"customer_group": None,
-			"territory": None,
-			"customer_type": None,
-			"disabled": None
-		}
+	Returns:
+		list: One dictionary per value checked, in request order (names,
+			then emails, then mobiles), with the check_customer_registered
+			fields. Email and mobile results also carry the "email" or
+			"mobile" that was checked, with customer_name set to the
+			matched customer's name.
+	"""
+	
+	lookups = {
+		"customer_name": _parse_lookup_values(customer_names),
+		"email_id": _parse_lookup_values(emails),
+		"mobile_no": _parse_lookup_values(mobiles)
+	}
+	
+	if not any(lookups.values()):
+		frappe.throw(_("At least one customer name, email or mobile is required"))
+	
+	fields = _parse_registration_fields(fields)
+	
+	customers = frappe.get_all(
+		"Customer",
+		or_filters=[[field, "in", values] for field, values in lookups.items() if values],
+		fields=list(dict.fromkeys(["name", "customer_name", "email_id", "mobile_no"] + fields)),
+		order_by="creation asc"
+	)
+	
+	# First (oldest) customer wins, like check_customer_registered
+	matches = {field: {} for field in lookups}
+	for customer in customers:
+		for field in lookups:
+			if customer.get(field):
+				matches[field].setdefault(customer.get(field), customer)
+	
+	results = []
+	for value in lookups["customer_name"]:
+		results.append(_registration_result(value, matches["customer_name"].get(value), fields))
+	
+	for field, key in (("email_id", "email"), ("mobile_no", "mobile")):
+		for value in lookups[field]:
+			customer = matches[field].get(value)
+			result = _registration_result(customer.customer_name if customer else None, customer, fields)
+			result[key] = value
+			results.append(result)
+	
+	return results
+
+
+def _parse_lookup_values(values):
+	"""Return lookup values as a list, accepting a list, JSON list or comma-separated string."""
+	if not values:
+		return []
+	
+	if isinstance(values, str):
+		values = frappe.parse_json(values) if values.strip().startswith("[") else values.split(",")
+	
+	return [str(value).strip() for value in values if value and str(value).strip()]
+
+
+def _parse_registration_fields(fields=None):
+	"""Return the Customer fields a registration check should return, validated against the doctype."""
+	if not fields:
+		return list(REGISTRATION_FIELDS)
+	
+	if isinstance(fields, str):
+		fields = frappe.parse_json(fields) if fields.strip().startswith("[") else fields.split(",")
+	
+	fields = [field.strip() for field in fields if field and field.strip()]
+	meta = frappe.get_meta("Customer")
+	for field in fields:
+		if field in ("creation", "modified", "owner", "modified_by"):
+			continue
+		
+		df = meta.get_field(field)
+		if not df or df.fieldtype in no_value_fields or df.fieldtype == "Password":
+			frappe.throw(_("Invalid Customer field: {0}").format(field))
+	
+	return fields
+
+
+def _registration_result(customer_name, customer=None, fields=None):
+	"""Build a registration check result from a Customer row (or None if not registered)."""
+	result = {
+		"customer_name": customer_name,
+		"is_registered": bool(customer),
+		"customer_id": customer.name if customer else None
+	}
+	
+	for field in fields or REGISTRATION_FIELDS:
+		result[field] = customer.get(field) if customer else None
+	
+	return result
 
 
 @frappe.whitelist(allow_guest=False)
-def create_customer(customer_name, customer_type="Individual", customer_group=None, territory=None, email=None, mobile=None, phone=None, address_line1=None, address_line2=None, city=None, state=None, country=None, pincode=None):
+def create_customer(customer_name, customer_type="Individual", customer_group=None, territory=None, email=None, mobile=None, phone=None, address_line1=None, address_line2=None, city=None, state=None, country=None, pincode=None, match_existing=False):
 	"""
 	Create a new customer in the system.
 	
@@ -69,12 +270,15 @@ def create_customer(customer_name, customer_type="Individual", customer_group=No
 		state (str): State (optional)
 		country (str): Country (optional)
 		pincode (str): Postal/ZIP code (optional)
+		match_existing (bool): Also treat a customer with a contact with the
+			same email (or, without email, phone number) as existing (default: False)
 		
 	Returns:
 		dict: Dictionary containing created customer details
 			- success: Boolean indicating success
-			- customer_id: The created customer ID
+			- customer_id: The created customer ID (or the existing one)
 			- customer_name: The customer name
+			- matched_by: "Name", "Email" or "Phone" if the customer already exists
 			- message: Success or error message
 	"""
 	
@@ -84,133 +288,57 @@ def create_customer(customer_name, customer_type="Individual", customer_group=No
 			frappe.throw(_("Customer name is required"))
 		
 		# Check if customer already exists
-		existing_customer = frappe.db.exists("Customer", {"customer_name": customer_name})
+		existing_customer = get_customer_summary(customer_name)
 		if existing_customer:
 			return {
 				"success": False,
-				"customer_id": existing_customer,
+				"customer_id": existing_customer.name,
 				"customer_name": customer_name,
+				"matched_by": "Name",
 				"message": _("Customer already exists with this name")
 			}
 		
+		# Check for a customer with the same email or phone number
+		match = None
+		if frappe.utils.cint(match_existing):
+			match = find_customer_match(email=email, phone=mobile or phone)
+			if not match and not email and mobile and phone:
+				match = find_customer_match(phone=phone)
+		if match:
+			return {
+				"success": False,
+				"customer_id": match.customer,
+				"customer_name": customer_name,
+				"matched_by": match.key_type,
+				"message": _existing_customer_message(match.key_type)
+			}
+		
 		# Validate customer type
 		if customer_type not in ["Individual", "Company"]:
 			frappe.throw(_("Customer type must be 'Individual' or 'Company'"))
 		
-		# Get default customer group if not provided
+		# Get default customer group and territory if not provided
 		if not customer_group:
-			customer_group = frappe.db.get_single_value("Selling Settings", "customer_group")
-			if not customer_group:
-				customer_group = _("All Customer Groups")
+			customer_group = get_selling_defaults().customer_group
 		
-		# Get default territory if not provided
 		if not territory:
-			territory = frappe.db.get_single_value("Selling Settings", "territory")
-			if not territory:
-				territory = _("All Territories")
-		
-		# Create customer document
-		customer_doc = frappe.get_doc({
-			"doctype": "Customer",
-			"customer_name": customer_name,
-			"customer_type": customer_type,
-			"customer_group": customer_group,
-			"territory": territory
-		})
-		
-		# Insert the customer
-		customer_doc.insert(ignore_permissions=False)
-		frappe.db.commit()
+			territory = get_selling_defaults().territory
 		
-		# Create contact if email, mobile, or phone is provided
-		contact_id = None
-		if email or mobile or phone:
-			try:
-				contact_doc = frappe.get_doc({
-					"doctype": "Contact",
-					"first_name": customer_name,
-					"is_primary_contact": 1
-				})
-				
-				# Add email if provided
-				if email:
-					contact_doc.append("email_ids", {
-						"email_id": email,
-						"is_primary": 1
-					})
-				
-				# Add mobile if provided
-				if mobile:
-					contact_doc.append("phone_nos", {
-						"phone": mobile,
-						"is_primary_mobile_no": 1
-					})
-				
-				# Add phone if provided
-				if phone:
-					contact_doc.append("phone_nos", {
-						"phone": phone,
-						"is_primary_phone": 1 if not mobile else 0
-					})
-				
-				# Link contact to customer
-				contact_doc.append("links", {
-					"link_doctype": "Customer",
-					"link_name": customer_doc.name
-				})
-				
-				contact_doc.insert(ignore_permissions=False)
-				frappe.db.commit()
-				contact_id = contact_doc.name
-				
-				# Update customer with primary contact
-				customer_doc.customer_primary_contact = contact_id
-				customer_doc.save(ignore_permissions=False)
-				frappe.db.commit()
-				
-			except Exception as e:
-				# If contact creation fails, log it but don't fail the customer creation
-				frappe.log_error(f"Failed to create contact for customer {customer_doc.name}: {str(e)}")
-		
-		# Create address if address details provided
-		address_id = None
-		if address_line1 or city or country:
-			try:
-				# Get default country if not provided
-				if not country:
-					country = frappe.db.get_single_value("System Settings", "country") or "India"
-				
-				# Validate that country exists in the system
-				if not frappe.db.exists("Country", country):
-					# Try to find a default country
-					default_country = frappe.db.get_value("Country", filters={}, fieldname="name")
-					if default_country:
-						country = default_country
-				
-				address_doc = frappe.get_doc({
-					"doctype": "Address",
-					"address_title": customer_name,
-					"address_type": "Billing",
-					"address_line1": address_line1 or "",
-					"address_line2": address_line2 or "",
-					"city": city or "",
-					"state": state or "",
-					"country": country,
-					"pincode": pincode or ""
-				})
-				
-				# Link address to customer
-				address_doc.append("links", {
-					"link_doctype": "Customer",
-					"link_name": customer_doc.name
-				})
-				
-				address_doc.insert(ignore_permissions=False)
-				frappe.db.commit()
-				address_id = address_doc.name
-			except Exception as e:
-				# If address creation fails, log it but don't fail the customer creation
-				frappe.log_error(f"Failed to create address for customer {customer_doc.name}: {str(e)}")
+		customer_doc, contact_id, address_id = _insert_customer(
+			customer_name,
+			customer_type,
+			customer_group,
+			territory,
+			email=email,
+			mobile=mobile,
+			phone=phone,
+			address_line1=address_line1,
+			address_line2=address_line2,
+			city=city,
+			state=state,
+			country=country,
+			pincode=pincode
+		)
 		
 		return {
 			"success": True,
@@ -225,7 +353,7 @@ def create_customer(customer_name, customer_type="Individual", customer_group=No
 		}
 		
 	except frappe.DuplicateEntryError:
-		frappe.db.rollback()
+		_rollback()
 		return {
 			"success": False,
 			"customer_id": None,
@@ -233,7 +361,7 @@ def create_customer(customer_name, customer_type="Individual", customer_group=No
 			"message": _("Customer with this name already exists")
 		}
 	except Exception as e:
-		frappe.db.rollback()
+		_rollback()
 		frappe.log_error(frappe.get_traceback(), _("Customer Creation Error"))
 		return {
 			"success": False,
@@ -243,6 +371,327 @@ def create_customer(customer_name, customer_type="Individual", customer_group=No
 		}
 
 
+def _insert_customer(customer_name, customer_type, customer_group, territory, email=None, mobile=None, phone=None, address_line1=None, address_line2=None, city=None, state=None, country=None, pincode=None):
+	"""
+	Insert a customer with its optional contact and address.
+	
+	Contact and address failures are logged without failing the customer.
+	
+	Returns:
+		tuple: (customer document, contact ID or None, address ID or None)
+	"""
+	# Create customer document
+	customer_doc = frappe.get_doc({
+		"doctype": "Customer",
+		"customer_name": customer_name,
+		"customer_type": customer_type,
+		"customer_group": customer_group,
+		"territory": territory
+	})
+	
+	# Insert the customer
+	customer_doc.insert(ignore_permissions=False)
+	_commit()
+	
+	# Create contact if email, mobile, or phone is provided
+	contact_id = None
+	if email or mobile or phone:
+		# The contact and the customer's link to it are kept or undone together
+		frappe.db.savepoint("customer_contact")
+		try:
+			contact_doc = frappe.get_doc({
+				"doctype": "Contact",
+				"first_name": customer_name,
+				"is_primary_contact": 1
+			})
+			
+			# Add email if provided
+			if email:
+				contact_doc.append("email_ids", {
+					"email_id": email,
+					"is_primary": 1
+				})
+			
+			# Add mobile if provided
+			if mobile:
+				contact_doc.append("phone_nos", {
+					"phone": mobile,
+					"is_primary_mobile_no": 1
+				})
+			
+			# Add phone if provided
+			if phone:
+				contact_doc.append("phone_nos", {
+					"phone": phone,
+					"is_primary_phone": 1 if not mobile else 0
+				})
+			
+			# Link contact to customer
+			contact_doc.append("links", {
+				"link_doctype": "Customer",
+				"link_name": customer_doc.name
+			})
+			
+			contact_doc.insert(ignore_permissions=False)
+			
+			# Update customer with primary contact
+			customer_doc.customer_primary_contact = contact_doc.name
+			customer_doc.save(ignore_permissions=False)
+			contact_id = contact_doc.name
+			
+		except Exception as e:
+			# If contact creation fails, log it but don't fail the customer creation
+			frappe.db.rollback(save_point="customer_contact")
+			customer_doc.customer_primary_contact = None
+			frappe.log_error(f"Failed to create contact for customer {customer_doc.name}: {str(e)}")
+		
+		_commit()
+	
+	# Create address if address details provided
+	address_id = None
+	if address_line1 or city or country:
+		frappe.db.savepoint("customer_address")
+		try:
+			# Get default country if not provided or unknown
+			country = get_address_country(country)
+			
+			address_doc = frappe.get_doc({
+				"doctype": "Address",
+				"address_title": customer_name,
+				"address_type": "Billing",
+				"address_line1": address_line1 or "",
+				"address_line2": address_line2 or "",
+				"city": city or "",
+				"state": state or "",
+				"country": country,
+				"pincode": pincode or ""
+			})
+			
+			# Link address to customer
+			address_doc.append("links", {
+				"link_doctype": "Customer",
+				"link_name": customer_doc.name
+			})
+			
+			address_doc.insert(ignore_permissions=False)
+			address_id = address_doc.name
+		except Exception as e:
+			# If address creation fails, log it but don't fail the customer creation
+			frappe.db.rollback(save_point="customer_address")
+			frappe.log_error(f"Failed to create address for customer {customer_doc.name}: {str(e)}")
+		
+		_commit()
+	
+	return customer_doc, contact_id, address_id
+
+
+@frappe.whitelist(allow_guest=False)
+def create_customers_bulk(customers=None, chunk_size=BULK_CHUNK_SIZE, match_existing=False):
+	"""
+	Create many customers in one call.
+	
+	Rows are validated up front, defaults are resolved once and existing
+	customers are found with a single query. Valid rows are inserted in
+	chunks, one transaction per chunk; a failing row only rolls back its
+	own savepoint.
+	
+	Args:
+		customers (list): List of customers, each with the create_customer
+			parameters (customer_name required). May also be sent as the
+			request body in NDJSON format (one customer per line).
+		chunk_size (int): Customers inserted per transaction (default: 200)
+		match_existing (bool): Also treat customers with a contact with the
+			same email (or, without email, phone number) as existing, like
+			create_customer (default: False)
+		
+	Returns:
+		dict: Dictionary containing bulk creation results
+			- success: True if every row was created
+			- total: Number of rows received
+			- created: Number of customers created
+			- failed: Number of rows not created
+			- results: Per-row results in request order, each with "row"
+			  (0-based index) and the fields returned by create_customer
+	"""
+	
+	rows = _parse_bulk_rows(customers)
+	chunk_size = max(frappe.utils.cint(chunk_size), 1)
+	results = [None] * len(rows)
+	
+	# Validate all rows up front
+	valid_rows = []
+	seen_names = set()
+	for idx, row in enumerate(rows):
+		error = None
+		customer_name = row.get("customer_name") if isinstance(row, dict) else None
+		
+		if not isinstance(row, dict):
+			error = _("Each customer must be an object")
+		elif not customer_name:
+			error = _("Customer name is required")
+		elif row.get("customer_type", "Individual") not in ["Individual", "Company"]:
+			error = _("Customer type must be 'Individual' or 'Company'")
+		elif customer_name in seen_names:
+			error = _("Customer name is repeated in this request")
+		
+		if error:
+			results[idx] = _bulk_customer_error(idx, customer_name, error)
+			continue
+		
+		seen_names.add(customer_name)
+		valid_rows.append((idx, row))
+	
+	# Check existing customers with a single query
+	existing = {}
+	if seen_names:
+		existing = dict(frappe.get_all(
+			"Customer",
+			filters={"customer_name": ["in", list(seen_names)]},
+			fields=["customer_name", "name"],
+			as_list=True
+		))
+	
+	new_rows = []
+	for idx, row in valid_rows:
+		customer_id = existing.get(row["customer_name"])
+		if customer_id:
+			results[idx] = _bulk_customer_error(
+				idx, row["customer_name"], _("Customer already exists with this name"), customer_id, "Name"
+			)
+		else:
+			new_rows.append((idx, row))
+	
+	# Check existing emails and phone numbers with a single query
+	match_keys = {}
+	if frappe.utils.cint(match_existing) and new_rows:
+		contacts = [(row.get("email"), row.get("mobile") or row.get("phone")) for idx, row in new_rows]
+		unmatched_rows = []
+		for (idx, row), contact, match in zip(new_rows, contacts, find_customer_matches(contacts)):
+			if match:
+				results[idx] = _bulk_customer_error(
+					idx, row["customer_name"], _existing_customer_message(match.key_type), match.customer, match.key_type
+				)
+			else:
+				unmatched_rows.append((idx, row))
+				match_keys[idx] = get_match_key(*contact)
+		new_rows = unmatched_rows
+	
+	# Rows repeating the email or phone number of a row created earlier in this request
+	created_keys = {}
+	
+	# Resolve defaults once for the whole request
+	defaults = get_selling_defaults()
+	
+	frappe.flags.customer_api_defer_commit = True
+	try:
+		for start in range(0, len(new_rows), chunk_size):
+			for idx, row in new_rows[start:start + chunk_size]:
+				key = match_keys.get(idx)
+				if key in created_keys:
+					results[idx] = _bulk_customer_error(
+						idx, row["customer_name"], _existing_customer_message(key[0]), created_keys[key], key[0]
+					)
+					continue
+				
+				savepoint = f"bulk_customer_{idx}"
+				frappe.db.savepoint(savepoint)
+				try:
+					customer_doc, contact_id, address_id = _insert_customer(
+						row["customer_name"],
+						row.get("customer_type") or "Individual",
+						row.get("customer_group") or defaults.customer_group,
+						row.get("territory") or defaults.territory,
+						email=row.get("email"),
+						mobile=row.get("mobile"),
+						phone=row.get("phone"),
+						address_line1=row.get("address_line1"),
+						address_line2=row.get("address_line2"),
+						city=row.get("city"),
+						state=row.get("state"),
+						country=row.get("country"),
+						pincode=row.get("pincode")
+					)
+					results[idx] = {
+						"row": idx,
+						"success": True,
+						"customer_id": customer_doc.name,
+						"customer_name": customer_doc.customer_name,
+						"customer_type": customer_doc.customer_type,
+						"customer_group": customer_doc.customer_group,
+						"territory": customer_doc.territory,
+						"contact_id": contact_id,
+						"address_id": address_id,
+						"message": _("Customer created successfully")
+					}
+					if key:
+						created_keys[key] = customer_doc.name
+				except Exception as e:
+					frappe.db.rollback(save_point=savepoint)
+					frappe.clear_messages()
+					results[idx] = _bulk_customer_error(
+						idx, row["customer_name"], _("Error creating customer: {0}").format(str(e))
+					)
+			
+			frappe.db.commit()
+	finally:
+		frappe.flags.customer_api_defer_commit = False
+	
+	created = sum(1 for result in results if result["success"])
+	
+	return {
+		"success": created == len(results),
+		"total": len(results),
+		"created": created,
+		"failed": len(results) - created,
+		"results": results
+	}
+
+
+def _bulk_customer_error(idx, customer_name, message, customer_id=None, matched_by=None):
+	"""Build the result of a bulk customer row that was not created."""
+	result = {
+		"row": idx,
+		"success": False,
+		"customer_id": customer_id,
+		"customer_name": customer_name,
+		"message": message
+	}
+	if matched_by:
+		result["matched_by"] = matched_by
+	
+	return result
+
+
+def _existing_customer_message(key_type):
+	"""Message for a customer that already exists with this email or phone number."""
+	if key_type == "Email":
+		return _("Customer already exists with this email")
+	return _("Customer already exists with this phone number")
+
+
+def _parse_bulk_rows(rows):
+	"""
+	Return the rows of a bulk request as a list.
+	
+	Accepts a list, a JSON array string, or (when rows is empty) an NDJSON
+	or JSON array request body.
+	"""
+	if rows is None and frappe.request:
+		body = frappe.request.get_data(as_text=True).strip()
+		if body.startswith("["):
+			rows = body
+		else:
+			rows = [frappe.parse_json(line) for line in body.splitlines() if line.strip()]
+	
+	if isinstance(rows, str):
+		rows = frappe.parse_json(rows)
+	
+	if not isinstance(rows, list) or not rows:
+		frappe.throw(_("At least one row is required"))
+	
+	return rows
+
+
 @frappe.whitelist(allow_guest=False)
 def create_sales_invoice(customer, items, due_date=None, posting_date=None, update_stock=1, 
 						set_posting_time=0, company=None, currency=None, taxes_and_charges=None,
@@ -316,9 +765,7 @@ def create_sales_invoice(customer, items, due_date=None, posting_date=None, upda
 		
 		# Get default company if not provided
 		if not company:
-			company = frappe.db.get_single_value("Global Defaults", "default_company")
-			if not company:
-				company = frappe.get_all("Company", limit=1, pluck="name")[0]
+			company = get_default_company()
 		
 		# Set posting date to today if not provided
 		if not posting_date:
@@ -328,134 +775,64 @@ def create_sales_invoice(customer, items, due_date=None, posting_date=None, upda
 		if not due_date:
 			due_date = posting_date
 		
-		# Create sales invoice document
-		invoice_doc = frappe.get_doc({
-			"doctype": "Sales Invoice",
-			"customer": customer,
-			"posting_date": posting_date,
-			"due_date": due_date,
-			"company": company,
-			"update_stock": int(update_stock),
-			"set_posting_time": int(set_posting_time)
-		})
-		
-		# Set POS Profile if provided (enables POS mode)
-		if pos_profile:
-			# Verify POS Profile exists
-			if not frappe.db.exists("POS Profile", pos_profile):
-				return {
-					"success": False,
-					"invoice_id": None,
-					"invoice_name": None,
-					"grand_total": 0,
-					"message": _("POS Profile '{0}' does not exist").format(pos_profile)
-				}
-			invoice_doc.is_pos = 1
-			invoice_doc.pos_profile = pos_profile
-		
-		# Set optional fields
-		if currency:
-			invoice_doc.currency = currency
-		
-		if cost_center:
-			invoice_doc.cost_center = cost_center
-		
-		if project:
-			invoice_doc.project = project
-		
-		if payment_terms_template:
-			invoice_doc.payment_terms_template = payment_terms_template
-		
-		if taxes_and_charges:
-			invoice_doc.taxes_and_charges = taxes_and_charges
+		# Verify POS Profile exists
+		if pos_profile and not frappe.db.exists("POS Profile", pos_profile):
+			return {
+				"success": False,
+				"invoice_id": None,
+				"invoice_name": None,
+				"grand_total": 0,
+				"message": _("POS Profile '{0}' does not exist").format(pos_profile)
+			}
 		
-		# Add items
+		# Verify items exist
 		for item in items:
-			if not item.get("item_code"):
-				frappe.throw(_("Item code is required for all items"))
-			
-			if not item.get("qty"):
-				frappe.throw(_("Quantity is required for item {0}").format(item.get("item_code")))
+			_validate_invoice_item(item)
 			
-			# Verify item exists
 			if not frappe.db.exists("Item", item.get("item_code")):
 				frappe.throw(_("Item '{0}' does not exist").format(item.get("item_code")))
-			
-			item_row = {
-				"item_code": item.get("item_code"),
-				"qty": float(item.get("qty")),
-			}
-			
-			# Add optional item fields
-			if item.get("rate"):
-				item_row["rate"] = float(item.get("rate"))
-			
-			if item.get("warehouse"):
-				item_row["warehouse"] = item.get("warehouse")
-			
-			if item.get("description"):
-				item_row["description"] = item.get("description")
-			
-			if item.get("uom"):
-				item_row["uom"] = item.get("uom")
-			
-			if item.get("conversion_factor"):
-				item_row["conversion_factor"] = float(item.get("conversion_factor"))
-			
-			if item.get("discount_percentage"):
-				item_row["discount_percentage"] = float(item.get("discount_percentage"))
-			
-			if item.get("cost_center"):
-				item_row["cost_center"] = item.get("cost_center")
-			
-			invoice_doc.append("items", item_row)
 		
-		# Insert the invoice
-		invoice_doc.insert(ignore_permissions=False)
-		
-		# Get taxes if template is provided
-		if taxes_and_charges:
-			invoice_doc.set_missing_values()
-		
-		# Calculate totals
-		invoice_doc.calculate_taxes_and_totals()
-		invoice_doc.save()
-		frappe.db.commit()
+		# Create sales invoice document
+		with stage("invoice_insert"):
+			invoice_doc = _build_sales_invoice(
+				customer,
+				items,
+				posting_date,
+				due_date,
+				company,
+				update_stock=update_stock,
+				set_posting_time=set_posting_time,
+				currency=currency,
+				taxes_and_charges=taxes_and_charges,
+				payment_terms_template=payment_terms_template,
+				cost_center=cost_center,
+				project=project,
+				pos_profile=pos_profile
+			)
+			_save_sales_invoice(invoice_doc)
+			_commit()
 		
-		result = {
-			"success": True,
-			"invoice_id": invoice_doc.name,
-			"invoice_name": invoice_doc.name,
-			"customer": invoice_doc.customer,
-			"posting_date": str(invoice_doc.posting_date),
-			"due_date": str(invoice_doc.due_date),
-			"total_qty": invoice_doc.total_qty,
-			"total": invoice_doc.total,
-			"grand_total": invoice_doc.grand_total,
-			"outstanding_amount": invoice_doc.outstanding_amount,
-			"status": invoice_doc.status,
-			"update_stock": invoice_doc.update_stock,
-			"is_pos": invoice_doc.is_pos,
-			"pos_profile": invoice_doc.pos_profile if pos_profile else None,
-			"message": _("Sales invoice created successfully")
-		}
+		result = _sales_invoice_result(invoice_doc)
 		
 		# Submit if requested
 		if int(submit) == 1:
+			frappe.db.savepoint("invoice_submit")
 			try:
-				invoice_doc.submit()
-				frappe.db.commit()
+				with stage("invoice_submit"):
+					invoice_doc.submit()
+					_commit()
 				result["status"] = "Submitted"
 				result["message"] = _("Sales invoice created and submitted successfully")
 			except Exception as e:
-				# If submit fails, return draft invoice info with error
+				# If submit fails, undo its partial writes and return draft invoice info with error
+				frappe.db.rollback(save_point="invoice_submit")
 				result["message"] = _("Invoice created as draft. Submit failed: {0}").format(str(e))
 				result["submit_error"] = str(e)
 		
 		return result
 		
 	except frappe.exceptions.ValidationError as e:
-		frappe.db.rollback()
+		_rollback()
 		return {
 			"success": False,
 			"invoice_id": None,
@@ -464,7 +841,7 @@ def create_sales_invoice(customer, items, due_date=None, posting_date=None, upda
 			"message": _("Validation error: {0}").format(str(e))
 		}
 	except Exception as e:
-		frappe.db.rollback()
+		_rollback()
 		frappe.log_error(frappe.get_traceback(), _("Sales Invoice Creation Error"))
 		return {
 			"success": False,
@@ -475,66 +852,496 @@ def create_sales_invoice(customer, items, due_date=None, posting_date=None, upda
 		}
 
 
+@frappe.whitelist(allow_guest=False)
+def create_sales_invoices_bulk(invoices=None, submit=0, chunk_size=BULK_CHUNK_SIZE):
+	"""
+	Create many sales invoices in one call (e.g. end-of-day POS uploads).
+	
+	Customers, items, POS profiles and tax templates of all invoices are
+	validated with one query each and the default company is resolved once.
+	Invoices are inserted in chunks, one transaction per chunk; submission
+	(if requested) runs as a second phase once all drafts exist.
+	
+	Args:
+		invoices (list): List of invoices, each with the create_sales_invoice
+			parameters (customer and items required; submit is ignored per
+			invoice). May also be sent as an NDJSON request body.
+		submit (int): Submit the created invoices in a second phase (1=Yes, 0=No, default=0)
+		chunk_size (int): Invoices inserted or submitted per transaction (default: 200)
+		
+	Returns:
+		dict: Dictionary containing bulk creation results
+			- success: True if every invoice was created (and submitted, if requested)
+			- total: Number of invoices received
+			- created: Number of invoices created
+			- submitted: Number of invoices submitted
+			- failed: Number of invoices not created
+			- results: Per-invoice results in request order, each with "row"
+			  (0-based index) and the fields returned by create_sales_invoice
+	"""
+	
+	rows = _parse_bulk_rows(invoices)
+	chunk_size = max(frappe.utils.cint(chunk_size), 1)
+	results = [None] * len(rows)
+	
+	# Validate the structure of every invoice
+	valid_rows = []
+	for idx, row in enumerate(rows):
+		try:
+			if not isinstance(row, dict):
+				frappe.throw(_("Each invoice must be an object"))
+			
+			if not row.get("customer"):
+				frappe.throw(_("Customer is required"))
+			
+			items = row.get("items")
+			if isinstance(items, str):
+				items = frappe.parse_json(items)
+			if not items or not isinstance(items, list):
+				frappe.throw(_("At least one item is required"))
+			
+			for item in items:
+				_validate_invoice_item(item)
+			
+			row["items"] = items
+			valid_rows.append((idx, row))
+		except frappe.ValidationError as e:
+			frappe.clear_messages()
+			results[idx] = _bulk_invoice_error(idx, _("Validation error: {0}").format(str(e)))
+	
+	# Check every referenced record with one query per doctype
+	existing = {
+		"Customer": _existing_names("Customer", {row["customer"] for _idx, row in valid_rows}),
+		"Item": _existing_names("Item", {item.get("item_code") for _idx, row in valid_rows for item in row["items"]}),
+		"POS Profile": _existing_names("POS Profile", {row.get("pos_profile") for _idx, row in valid_rows}),
+		"Sales Taxes and Charges Template": _existing_names(
+			"Sales Taxes and Charges Template", {row.get("taxes_and_charges") for _idx, row in valid_rows}
+		)
+	}
+	
+	new_rows = []
+	for idx, row in valid_rows:
+		error = None
+		missing_items = [item.get("item_code") for item in row["items"] if item.get("item_code") not in existing["Item"]]
+		
+		if row["customer"] not in existing["Customer"]:
+			error = _("Customer '{0}' does not exist").format(row["customer"])
+		elif row.get("pos_profile") and row["pos_profile"] not in existing["POS Profile"]:
+			error = _("POS Profile '{0}' does not exist").format(row["pos_profile"])
+		elif row.get("taxes_and_charges") and row["taxes_and_charges"] not in existing["Sales Taxes and Charges Template"]:
+			error = _("Sales Taxes and Charges Template '{0}' does not exist").format(row["taxes_and_charges"])
+		elif missing_items:
+			error = _("Item '{0}' does not exist").format(missing_items[0])
+		
+		if error:
+			results[idx] = _bulk_invoice_error(idx, error)
+		else:
+			new_rows.append((idx, row))
+	
+	# Resolve shared defaults once
+	default_company = get_default_company()
+	today = frappe.utils.nowdate()
+	
+	created_docs = []
+	frappe.flags.customer_api_defer_commit = True
+	try:
+		# Phase 1: insert drafts
+		for start in range(0, len(new_rows), chunk_size):
+			for idx, row in new_rows[start:start + chunk_size]:
+				savepoint = f"bulk_invoice_{idx}"
+				frappe.db.savepoint(savepoint)
+				try:
+					posting_date = row.get("posting_date") or today
+					invoice_doc = _build_sales_invoice(
+						row["customer"],
+						row["items"],
+						posting_date,
+						row.get("due_date") or posting_date,
+						row.get("company") or default_company,
+						update_stock=row.get("update_stock", 1),
+						set_posting_time=row.get("set_posting_time", 0),
+						currency=row.get("currency"),
+						taxes_and_charges=row.get("taxes_and_charges"),
+						payment_terms_template=row.get("payment_terms_template"),
+						cost_center=row.get("cost_center"),
+						project=row.get("project"),
+						pos_profile=row.get("pos_profile")
+					)
+					_save_sales_invoice(invoice_doc)
+					results[idx] = dict(_sales_invoice_result(invoice_doc), row=idx)
+					created_docs.append((idx, invoice_doc))
+				except Exception as e:
+					frappe.db.rollback(save_point=savepoint)
+					frappe.clear_messages()
+					results[idx] = _bulk_invoice_error(idx, _("Error creating sales invoice: {0}").format(str(e)))
+			
+			frappe.db.commit()
+		
+		# Phase 2: submit
+		if frappe.utils.cint(submit):
+			for start in range(0, len(created_docs), chunk_size):
+				for idx, invoice_doc in created_docs[start:start + chunk_size]:
+					savepoint = f"bulk_submit_{idx}"
+					frappe.db.savepoint(savepoint)
+					try:
+						invoice_doc.submit()
+						results[idx]["status"] = "Submitted"
+						results[idx]["message"] = _("Sales invoice created and submitted successfully")
+					except Exception as e:
+						# If submit fails, keep the draft and report the error
+						frappe.db.rollback(save_point=savepoint)
+						frappe.clear_messages()
+						results[idx]["message"] = _("Invoice created as draft. Submit failed: {0}").format(str(e))
+						results[idx]["submit_error"] = str(e)
+				
+				frappe.db.commit()
+	finally:
+		frappe.flags.customer_api_defer_commit = False
+	
+	created = len(created_docs)
+	submitted = sum(1 for result in results if result.get("status") == "Submitted")
+	
+	return {
+		"success": created == len(results) and (not frappe.utils.cint(submit) or submitted == created),
+		"total": len(results),
+		"created": created,
+		"submitted": submitted,
+		"failed": len(results) - created,
+		"results": results
+	}
+
+
+def _bulk_invoice_error(idx, message):
+	"""Build the result of a bulk invoice row that was not created."""
+	return {
+		"row": idx,
+		"success": False,
+		"invoice_id": None,
+		"invoice_name": None,
+		"grand_total": 0,
+		"message": message
+	}
+
+
+def _existing_names(doctype, names):
+	"""Return which of the given names exist for a doctype, with a single query."""
+	names = [name for name in names if name]
+	if not names:
+		return set()
+	
+	return set(frappe.get_all(doctype, filters={"name": ["in", names]}, pluck="name"))
+
+
+def _validate_invoice_item(item):
+	"""Check the required fields of an invoice item row."""
+	if not item.get("item_code"):
+		frappe.throw(_("Item code is required for all items"))
+	
+	if not item.get("qty"):
+		frappe.throw(_("Quantity is required for item {0}").format(item.get("item_code")))
+
+
+def _build_sales_invoice(customer, items, posting_date, due_date, company, update_stock=1, set_posting_time=0,
+						currency=None, taxes_and_charges=None, payment_terms_template=None, cost_center=None,
+						project=None, pos_profile=None):
+	"""Build an unsaved Sales Invoice from already validated values."""
+	invoice_doc = frappe.get_doc({
+		"doctype": "Sales Invoice",
+		"customer": customer,
+		"posting_date": posting_date,
+		"due_date": due_date,
+		"company": company,
+		"update_stock": int(update_stock),
+		"set_posting_time": int(set_posting_time)
+	})
+	
+	# Set POS Profile if provided (enables POS mode)
+	if pos_profile:
+		invoice_doc.is_pos = 1
+		invoice_doc.pos_profile = pos_profile
+	
+	# Set optional fields
+	if currency:
+		invoice_doc.currency = currency
+	
+	if cost_center:
+		invoice_doc.cost_center = cost_center
+	
+	if project:
+		invoice_doc.project = project
+	
+	if payment_terms_template:
+		invoice_doc.payment_terms_template = payment_terms_template
+	
+	if taxes_and_charges:
+		invoice_doc.taxes_and_charges = taxes_and_charges
+	
+	# Add items
+	for item in items:
+		item_row = {
+			"item_code": item.get("item_code"),
+			"qty": float(item.get("qty")),
+		}
+		
+		# Add optional item fields
+		if item.get("rate"):
+			item_row["rate"] = float(item.get("rate"))
+		
+		if item.get("warehouse"):
+			item_row["warehouse"] = item.get("warehouse")
+		
+		if item.get("description"):
+			item_row["description"] = item.get("description")
+		
+		if item.get("uom"):
+			item_row["uom"] = item.get("uom")
+		
+		if item.get("conversion_factor"):
+			item_row["conversion_factor"] = float(item.get("conversion_factor"))
+		
+		if item.get("discount_percentage"):
+			item_row["discount_percentage"] = float(item.get("discount_percentage"))
+		
+		if item.get("cost_center"):
+			item_row["cost_center"] = item.get("cost_center")
+		
+		invoice_doc.append("items", item_row)
+	
+	return invoice_doc
+
+
+def _save_sales_invoice(invoice_doc):
+	"""Insert a built Sales Invoice and compute its taxes and totals."""
+	# Insert the invoice
+	invoice_doc.insert(ignore_permissions=False)
+	
+	# Get taxes if template is provided
+	if invoice_doc.taxes_and_charges:
+		invoice_doc.set_missing_values()
+	
+	# Calculate totals
+	invoice_doc.calculate_taxes_and_totals()
+	invoice_doc.save()
+
+
+def _sales_invoice_result(invoice_doc):
+	"""Build the API result for a created Sales Invoice."""
+	return {
+		"success": True,
+		"invoice_id": invoice_doc.name,
+		"invoice_name": invoice_doc.name,
+		"customer": invoice_doc.customer,
+		"posting_date": str(invoice_doc.posting_date),
+		"due_date": str(invoice_doc.due_date),
+		"total_qty": invoice_doc.total_qty,
+		"total": invoice_doc.total,
+		"grand_total": invoice_doc.grand_total,
+		"outstanding_amount": invoice_doc.outstanding_amount,
+		"status": invoice_doc.status,
+		"update_stock": invoice_doc.update_stock,
+		"is_pos": invoice_doc.is_pos,
+		"pos_profile": invoice_doc.pos_profile if invoice_doc.is_pos else None,
+		"message": _("Sales invoice created successfully")
+	}
+
+
 # ==================== WORDPRESS WEBHOOK LISTENER ====================
 
+# Queue used for background order processing unless the site overrides it
+WEBHOOK_QUEUE = "woocommerce"
+WEBHOOK_JOB_TIMEOUT = 600
+
+# Topic recorded for deliveries without an X-WC-Webhook-Topic header
+DEFAULT_WEBHOOK_TOPIC = "unknown"
+
+# Failed orders are retried after RETRY_BASE_DELAY * 2^(attempts - 1)
+# seconds, at most RETRY_MAX_DELAY apart
+RETRY_BASE_DELAY = 60
+RETRY_MAX_DELAY = 6 * 60 * 60
+
+# Events of one order are processed one at a time (see lock_order); a
+# worker waits up to ORDER_LOCK_WAIT seconds for the lock, which expires
+# after ORDER_LOCK_TIMEOUT seconds if its holder dies
+ORDER_LOCK_KEY = "customer_api:order_lock"
+ORDER_LOCK_WAIT = 30
+ORDER_LOCK_TIMEOUT = WEBHOOK_JOB_TIMEOUT
+
+
 @frappe.whitelist(allow_guest=True)
 def woocommerce_webhook_listener():
 	"""
 	Multi-site webhook listener for WooCommerce orders.
+	
+	Sites in "Background Job" processing mode only get the payload verified
+	and stored as a Pending log; the order itself is processed by
+	process_webhook_log on the site's processing queue and the request is
+	answered with HTTP 202. "Batch Queue" sites are answered the same way
+	and their logs are drained in bulk by customer_api.webhook_queue.
+	
+	The body is read once: its size is checked against the site's limit
+	(Content-Length first), the signature is verified over the raw bytes
+	and only an authentic body is parsed (with orjson when installed).
+	
+	Deliveries over the rate limit of their site and client IP are
+	answered with HTTP 429 and Retry-After; while the listener is shedding
+	load, orders of synchronous sites are queued as background jobs (see
+	customer_api.rate_limit).
 	"""
 	try:
 		# Validate POST request
 		if frappe.request.method != "POST":
 			return {"success": False, "message": "Only POST requests allowed"}
 		
-		# Get webhook data
-		order_data = frappe.request.get_json()
-		if not order_data:
-			return {"success": False, "message": "No data received"}
+		# Identify WordPress site (from the headers, before the body is touched)
+		with stage("site_resolve"):
+			source_url = frappe.request.headers.get("X-WC-Webhook-Source", "")
+			wp_site = get_wordpress_site_by_url(source_url)
 		
-		# Identify WordPress site
-		source_url = frappe.request.headers.get("X-WC-Webhook-Source", "")
-		wp_site = get_wordpress_site_by_url(source_url)
+		# Throttle per site and sender before any further work
+		retry_after = check_rate_limit(wp_site, get_client_ip())
+		if retry_after is not None:
+			increment("customer_api_webhook_events_total", site=wp_site.name if wp_site else "", event="rate_limited")
+			return too_many_requests(retry_after)
 		
 		if not wp_site:
 			return {"success": False, "message": "WordPress site not registered"}
 		
-		# Verify signature
-		if not verify_webhook_signature(wp_site):
-			return {"success": False, "message": "Invalid signature"}
-		
-		# Create log
-		log_doc = create_webhook_log(wp_site, order_data)
-		
-		# Update site stats
-		update_site_stat(wp_site, "received")
-		
-		# Process order
-		result = process_woocommerce_order(order_data, wp_site, log_doc)
-		
-		return result
+		with track_listener_load() as shed_load:
+			return _receive_webhook(wp_site, defer=shed_load)
 		
 	except Exception as e:
 		frappe.log_error(frappe.get_traceback(), "WooCommerce Webhook Error")
 		return {"success": False, "message": str(e)}
 
 
-def get_wordpress_site_by_url(source_url):
-	"""Find WordPress site by URL."""
-	sites = frappe.get_all("WordPress Site", 
-		filters={"enabled": 1},
-		fields=["name", "site_url", "webhook_secret"]
+def _receive_webhook(wp_site, defer=False):
+	"""Check, verify, parse and receive the body of a webhook from a resolved site."""
+	# Reject oversized bodies by their declared length, then by what was sent
+	max_body_size = frappe.utils.cint(wp_site.max_payload_size_kb) * 1024
+	if max_body_size and (frappe.request.content_length or 0) > max_body_size:
+		return payload_too_large(max_body_size)
+	
+	body = frappe.request.get_data()
+	if not body:
+		return {"success": False, "message": "No data received"}
+	if max_body_size and len(body) > max_body_size:
+		return payload_too_large(max_body_size)
+	
+	# Verify signature before parsing anything
+	with stage("signature"):
+		verified = verify_webhook_signature(wp_site, body)
+	if not verified:
+		return {"success": False, "message": "Invalid signature"}
+	
+	# Get webhook data
+	with stage("parse"):
+		try:
+			order_data = parse_json_body(body)
+		except ValueError:
+			return {"success": False, "message": "Invalid JSON payload"}
+	
+	if not order_data or not isinstance(order_data, dict):
+		return {"success": False, "message": "No data received"}
+	
+	topic = frappe.request.headers.get("X-WC-Webhook-Topic") or DEFAULT_WEBHOOK_TOPIC
+	result = receive_woocommerce_order(
+		wp_site,
+		order_data,
+		topic,
+		delivery_id=frappe.request.headers.get("X-WC-Webhook-Delivery-ID"),
+		defer=defer
 	)
 	
-	for site in sites:
-		if site.site_url in source_url:
-			return frappe.get_doc("WordPress Site", site.name)
+	if result.get("queued"):
+		frappe.local.response.http_status_code = 202
 	
-	return None
+	return result
 
 
-def verify_webhook_signature(wp_site):
-	"""Verify WooCommerce webhook signature."""
+def receive_woocommerce_order(wp_site, order_data, topic, delivery_id=None, any_topic=False, defer=False):
+	"""
+	Deduplicate, log and process (or queue) an order received from a shop.
+	
+	Shared by the webhook listener and the pull sync (customer_api.order_sync).
+	
+	Args:
+		wp_site (dict): Cached WordPress Site settings
+		order_data (dict): WooCommerce order
+		topic (str): Webhook topic recorded on the log
+		delivery_id (str): Webhook delivery ID (optional)
+		any_topic (bool): Treat any existing log of the order as a duplicate
+		defer (bool): Queue the order as a background job even if the site
+			processes synchronously (load shedding)
+	
+	Returns:
+		dict: Duplicate, queued ("queued": True) or processing result
+	"""
+	# Short-circuit retries and follow-up events of known orders
+	with stage("dedupe"):
+		duplicate = get_duplicate_delivery(wp_site.name, order_data.get("id"), topic, any_topic=any_topic)
+	if duplicate:
+		increment("customer_api_webhook_events_total", site=wp_site.name, event="deduped")
+		return duplicate
+	
+	# Create log
+	try:
+		with stage("log"):
+			log_doc = create_webhook_log(wp_site, order_data, topic=topic, delivery_id=delivery_id)
+	except (frappe.DuplicateEntryError, frappe.UniqueValidationError):
+		# A concurrent delivery of the same order and topic won the insert
+		frappe.db.rollback()
+		frappe.clear_messages()
+		increment("customer_api_webhook_events_total", site=wp_site.name, event="deduped")
+		return get_duplicate_delivery(wp_site.name, order_data.get("id"), topic)
+	
+	# Update site stats
+	update_site_stat(wp_site.name, "received")
+	
+	# Shed load of synchronous sites to the background queue
+	processing_mode = wp_site.processing_mode
+	if defer and processing_mode not in ("Background Job", "Batch Queue"):
+		increment("customer_api_webhook_events_total", site=wp_site.name, event="shed")
+		processing_mode = "Background Job"
+	
+	# Defer processing to the background queue / batch drainer
+	if processing_mode in ("Background Job", "Batch Queue"):
+		if processing_mode == "Background Job":
+			enqueue_webhook_log(wp_site, log_doc.name)
+		return {
+			"success": True,
+			"queued": True,
+			"message": "Webhook accepted for processing",
+			"woocommerce_order_id": order_data.get("id"),
+			"log_id": log_doc.name
+		}
+	
+	# Process order
+	return process_woocommerce_order(order_data, wp_site, log_doc)
+
+
+def get_wordpress_site_by_url(source_url):
+	"""Find WordPress site by URL (cached settings, see customer_api.cache)."""
+	return get_site_config(source_url)
+
+
+def payload_too_large(max_body_size):
+	"""Answer a webhook whose body exceeds the site's limit with HTTP 413."""
+	frappe.local.response.http_status_code = 413
+	return {
+		"success": False,
+		"message": f"Payload exceeds the limit of {max_body_size // 1024} KB"
+	}
+
+
+def parse_json_body(body):
+	"""Parse a JSON request body, with orjson when it is installed (raises ValueError if invalid)."""
+	if orjson:
+		return orjson.loads(body)
+	return json.loads(body)
+
+
+def verify_webhook_signature(wp_site, body=None):
+	"""Verify WooCommerce webhook signature over the raw request body."""
 	import hmac
 	import hashlib
 	import base64
@@ -544,11 +1351,12 @@ def verify_webhook_signature(wp_site):
 		return True  # Optional verification
 	
 	try:
-		secret = wp_site.get_password("webhook_secret")
+		secret = wp_site.webhook_secret
 		if not secret:
 			return True
 		
-		body = frappe.request.get_data()
+		if body is None:
+			body = frappe.request.get_data()
 		expected = base64.b64encode(
 			hmac.new(secret.encode(), body, hashlib.sha256).digest()
 		).decode()
@@ -558,40 +1366,277 @@ def verify_webhook_signature(wp_site):
 		return False
 
 
-def create_webhook_log(wp_site, order_data):
+def get_duplicate_delivery(wp_site_name, order_id, topic, any_topic=False):
+	"""
+	Return the response for an already known order, or None for a new one.
+	
+	Uses a single lookup on the (site, order id) prefix of the log's unique
+	index. An order that already has an invoice is answered with that
+	invoice whatever the topic; a repeated delivery of the same topic (of
+	any topic with `any_topic`) is answered with the status of the
+	existing log.
+	"""
+	logs = frappe.get_all(
+		"WordPress Webhook Log",
+		filters={"wordpress_site": wp_site_name, "woocommerce_order_id": str(order_id)},
+		fields=["name", "status", "webhook_topic", "created_customer", "created_invoice"]
+	)
+	
+	for log in logs:
+		if log.created_invoice:
+			return {
+				"success": True,
+				"duplicate": True,
+				"message": "Order already processed",
+				"woocommerce_order_id": order_id,
+				"customer_id": log.created_customer,
+				"invoice_id": log.created_invoice,
+				"log_id": log.name
+			}
+	
+	for log in logs:
+		if any_topic or log.webhook_topic == topic:
+			return {
+				"success": log.status != "Failed",
+				"duplicate": True,
+				"message": f"Webhook already received (status: {log.status})",
+				"woocommerce_order_id": order_id,
+				"log_id": log.name
+			}
+	
+	return None
+
+
+def get_existing_invoice(wp_site_name, order_id):
+	"""
+	Return (customer, invoice) already created for a WooCommerce order, if any.
+	
+	A locking read: the order's logs stay locked until the transaction
+	ends, so a concurrent event of the same order waits here and then sees
+	the invoice committed by the first one.
+	"""
+	logs = frappe.db.sql("""
+		select created_customer, created_invoice
+		from `tabWordPress Webhook Log`
+		where wordpress_site = %s and woocommerce_order_id = %s
+		for update
+	""", (wp_site_name, str(order_id)), as_dict=True)
+	
+	for log in logs:
+		if log.created_invoice:
+			return log.created_customer, log.created_invoice
+	
+	return None
+
+
+def lock_order(wp_site_name, order_id):
+	"""
+	Take the Redis lock of a site's order, waiting up to ORDER_LOCK_WAIT seconds.
+	
+	Different topics of one order (e.g. order.created and order.updated)
+	have separate logs and can be processed by two workers at once; the
+	lock makes the second wait for the first one's invoice. It spans the
+	intermediate commits of an order, which the row locks taken by
+	get_existing_invoice do not.
+	
+	Returns:
+		Lock: The held lock, or None if Redis is unavailable (the row locks still apply)
+	
+	Raises:
+		frappe.ValidationError: If the order stays locked by another worker
+	"""
+	cache = frappe.cache()
+	lock = cache.lock(
+		cache.make_key(f"{ORDER_LOCK_KEY}:{wp_site_name}:{order_id}"),
+		timeout=ORDER_LOCK_TIMEOUT,
+		blocking_timeout=ORDER_LOCK_WAIT
+	)
+	
+	try:
+		acquired = lock.acquire()
+	except RedisError:
+		return None
+	
+	if not acquired:
+		frappe.throw(_("Order {0} is being processed by another worker").format(order_id))
+	
+	return lock
+
+
+def release_order_lock(lock):
+	"""Release a lock taken by lock_order (an expired lock is ignored)."""
+	if not lock:
+		return
+	
+	try:
+		lock.release()
+	except RedisError:
+		pass
+
+
+def create_webhook_log(wp_site, order_data, topic=None, delivery_id=None):
 	"""Create webhook log entry."""
 	log = frappe.get_doc({
 		"doctype": "WordPress Webhook Log",
 		"wordpress_site": wp_site.name,
 		"woocommerce_order_id": str(order_data.get("id")),
+		"webhook_topic": topic or DEFAULT_WEBHOOK_TOPIC,
+		"delivery_id": delivery_id,
 		"status": "Pending",
-		"webhook_payload": frappe.as_json(order_data, indent=2),
 		"timestamp": frappe.utils.now()
 	})
+	log.set_payload(order_data)
 	log.insert(ignore_permissions=True)
-	frappe.db.commit()
+	_commit()
 	return log
 
 
-def update_site_stat(wp_site_name, stat_type):
-	"""Update WordPress site statistics."""
-	site = frappe.get_doc("WordPress Site", wp_site_name)
-	
-	if stat_type == "received":
-		site.total_webhooks_received = (site.total_webhooks_received or 0) + 1
-		site.last_webhook_received = frappe.utils.now()
-	elif stat_type == "success":
-		site.successful_invoices = (site.successful_invoices or 0) + 1
-	elif stat_type == "failed":
-		site.failed_webhooks = (site.failed_webhooks or 0) + 1
-	
-	site.save(ignore_permissions=True)
+def get_processing_queue(wp_site):
+	"""Return the queue for a site's order jobs, falling back to "default" if it is not configured."""
+	return get_configured_queue(wp_site.processing_queue or WEBHOOK_QUEUE)
+
+
+def get_configured_queue(queue):
+	"""Return a queue if it is configured (see get_queues_timeout), otherwise "default"."""
+	from frappe.utils.background_jobs import get_queues_timeout
+	
+	return queue if queue in get_queues_timeout() else "default"
+
+
+def enqueue_webhook_log(wp_site, log_name):
+	"""Enqueue background processing of a stored webhook log."""
+	frappe.enqueue(
+		"customer_api.api.process_webhook_log",
+		queue=get_processing_queue(wp_site),
+		timeout=WEBHOOK_JOB_TIMEOUT,
+		enqueue_after_commit=True,
+		log_name=log_name
+	)
+
+
+def claim_webhook_log(log_name):
+	"""
+	Lock a Pending webhook log and mark it as Processing.
+	
+	Returns the log document, or None if the log was already picked up by
+	another worker (e.g. a duplicate job).
+	"""
+	status = frappe.db.get_value("WordPress Webhook Log", log_name, "status", for_update=True)
+	if status != "Pending":
+		frappe.db.rollback()
+		return None
+	
+	frappe.db.set_value(
+		"WordPress Webhook Log",
+		log_name,
+		{"status": "Processing", "claimed_at": frappe.utils.now()},
+		update_modified=False
+	)
 	frappe.db.commit()
+	
+	return frappe.get_doc("WordPress Webhook Log", log_name)
+
+
+def process_webhook_log(log_name):
+	"""Background job: process the order stored in a Pending webhook log."""
+	log_doc = claim_webhook_log(log_name)
+	if not log_doc:
+		return
+	
+	wp_site = get_site_config_by_name(log_doc.wordpress_site)
+	if not wp_site:
+		log_doc.db_set({"status": "Failed", "error_message": "WordPress site not registered"})
+		return
+	
+	order_data = log_doc.get_payload()
+	
+	try:
+		process_woocommerce_order(order_data, wp_site, log_doc)
+	except Exception:
+		# process_woocommerce_order has already marked the log as Failed
+		frappe.log_error(frappe.get_traceback(), "WooCommerce Webhook Error")
+
+
+def update_site_stat(wp_site_name, stat_type):
+	"""Update WordPress site statistics (buffered in Redis, see customer_api.stats)."""
+	increment_site_stat(wp_site_name, stat_type)
 
 
 def process_woocommerce_order(order_data, wp_site, log_doc):
-	"""Process WooCommerce order and create invoice."""
+	"""
+	Process WooCommerce order and create invoice.
+	
+	With the site's Single Transaction option (the default), the customer,
+	contact, address, invoice and log update are written in one transaction
+	that is committed once, also when the order fails. Batch callers already
+	own the transaction and keep it; if the database rolls it back as a
+	whole, TransactionLostError is raised for them to retry the batch.
+	
+	Orders processed outside a traced request get their own trace (see
+	customer_api.monitoring).
+	"""
+	trace = start_trace("process_woocommerce_order")
+	set_trace_log(log_doc.name)
+	started = time.perf_counter()
+	if log_doc.timestamp and not frappe.utils.cint(log_doc.attempts):
+		# First attempts only: the wait of a retry is its backoff
+		observe(
+			"customer_api_order_queue_wait_seconds",
+			max(frappe.utils.time_diff_in_seconds(frappe.utils.now_datetime(), log_doc.timestamp), 0),
+			site=wp_site.name
+		)
+	
 	try:
+		if not wp_site.single_transaction or frappe.flags.customer_api_defer_commit:
+			return _process_woocommerce_order(order_data, wp_site, log_doc)
+		
+		frappe.flags.customer_api_defer_commit = True
+		try:
+			return _process_woocommerce_order(order_data, wp_site, log_doc)
+		except TransactionLostError as e:
+			# Only this order was lost: its log (committed before) is retried like any failure
+			mark_order_failed(log_doc, wp_site, str(e))
+			raise
+		finally:
+			frappe.flags.customer_api_defer_commit = False
+			frappe.db.commit()
+	finally:
+		observe("customer_api_order_processing_seconds", time.perf_counter() - started, site=wp_site.name)
+		finish_trace(trace)
+
+
+def _process_woocommerce_order(order_data, wp_site, log_doc):
+	"""Create the customer (if new) and the invoice of an order and update its log."""
+	savepoint = None
+	if frappe.flags.customer_api_defer_commit:
+		# Batch or single-transaction mode: a failing order must only undo its own writes
+		savepoint = f"wc_order_{frappe.generate_hash(length=10)}"
+		frappe.db.savepoint(savepoint)
+	
+	lock = None
+	try:
+		# Another event of this order may be in progress or invoiced since the log was stored
+		lock = lock_order(wp_site.name, order_data.get("id"))
+		existing = get_existing_invoice(wp_site.name, order_data.get("id"))
+		if existing:
+			customer_id, invoice_id = existing
+			log_doc.status = "Success"
+			log_doc.created_customer = customer_id
+			log_doc.created_invoice = invoice_id
+			log_doc.response_message = "Order already invoiced"
+			log_doc.save(ignore_permissions=True)
+			increment("customer_api_webhook_events_total", site=wp_site.name, event="deduped")
+			_commit()
+			
+			return {
+				"success": True,
+				"duplicate": True,
+				"message": "Order already processed",
+				"woocommerce_order_id": order_data.get("id"),
+				"customer_id": customer_id,
+				"invoice_id": invoice_id
+			}
+		
 		# Get customer info
 		billing = order_data.get("billing", {})
 		customer_name = f"{billing.get('first_name', '')} {billing.get('last_name', '')}".strip()
@@ -601,40 +1646,50 @@ def process_woocommerce_order(order_data, wp_site, log_doc):
 			customer_name = f"WC Customer {order_data.get('id')}"
 		
 		# Find or create customer
-		customer_id = None
-		if customer_email:
-			customer_id = frappe.db.get_value("Customer", {"email_id": customer_email}, "name")
-		
-		if not customer_id:
-			customer_result = create_customer(
-				customer_name=customer_name,
-				customer_type="Individual",
-				customer_group=wp_site.default_customer_group,
-				territory=wp_site.default_territory,
-				email=customer_email or None,
-				mobile=billing.get("phone") or None,
-				address_line1=billing.get("address_1"),
-				city=billing.get("city"),
-				state=billing.get("state"),
-				country=billing.get("country"),
-				pincode=billing.get("postcode")
-			)
-			
-			if not customer_result.get("success"):
-				raise Exception(f"Customer creation failed: {customer_result.get('message')}")
+		with stage("customer"):
+			customer_id = None
+			# Phone numbers are only matched without email (shared and placeholder numbers)
+			if customer_email:
+				customer_id = get_customer_by_email(customer_email)
+			elif billing.get("phone"):
+				customer_id = find_customer(phone=billing.get("phone"))
 			
-			customer_id = customer_result.get("customer_id")
-			log_doc.created_customer = customer_id
-			log_doc.save(ignore_permissions=True)
+			if not customer_id:
+				customer_result = create_customer(
+					customer_name=customer_name,
+					customer_type="Individual",
+					customer_group=wp_site.default_customer_group,
+					territory=wp_site.default_territory,
+					email=customer_email or None,
+					mobile=billing.get("phone") or None,
+					address_line1=billing.get("address_1"),
+					city=billing.get("city"),
+					state=billing.get("state"),
+					country=billing.get("country"),
+					pincode=billing.get("postcode"),
+					match_existing=True
+				)
+				
+				if customer_result.get("matched_by") in ("Email", "Phone"):
+					# Created by a concurrent order since the lookup above
+					customer_id = customer_result.get("customer_id")
+				elif not customer_result.get("success"):
+					raise Exception(f"Customer creation failed: {customer_result.get('message')}")
+				else:
+					customer_id = customer_result.get("customer_id")
+					log_doc.created_customer = customer_id
+					log_doc.save(ignore_permissions=True)
 		
 		# Map items
 		line_items = order_data.get("line_items", [])
 		if not line_items:
 			raise Exception("No items in order")
 		
+		with stage("mapping"):
+			item_codes = map_woocommerce_items(line_items, wp_site)
+		
 		invoice_items = []
-		for wc_item in line_items:
-			item_code = map_woocommerce_item(wc_item, wp_site)
+		for wc_item, item_code in zip(line_items, item_codes):
 			if item_code:
 				item_dict = {
 					"item_code": item_code,
@@ -664,15 +1719,16 @@ def process_woocommerce_order(order_data, wp_site, log_doc):
 			raise Exception(f"Invoice creation failed: {invoice_result.get('message')}")
 		
 		# Update log
-		log_doc.status = "Success"
-		log_doc.created_invoice = invoice_result.get("invoice_id")
-		log_doc.response_message = "Invoice created successfully"
-		log_doc.save(ignore_permissions=True)
+		with stage("log_update"):
+			log_doc.status = "Success"
+			log_doc.created_invoice = invoice_result.get("invoice_id")
+			log_doc.response_message = "Invoice created successfully"
+			log_doc.save(ignore_permissions=True)
 		
 		# Update stats
 		update_site_stat(wp_site.name, "success")
 		
-		frappe.db.commit()
+		_commit()
 		
 		return {
 			"success": True,
@@ -683,59 +1739,62 @@ def process_woocommerce_order(order_data, wp_site, log_doc):
 		}
 		
 	except Exception as e:
-		# Update log with error
-		log_doc.status = "Failed"
-		log_doc.error_message = str(e)
-		log_doc.save(ignore_permissions=True)
-		
-		# Update stats
-		update_site_stat(wp_site.name, "failed")
+		if savepoint and not rollback_to_savepoint(savepoint):
+			# The writes of the caller's other orders are gone too
+			raise TransactionLostError(str(e)) from e
 		
-		frappe.db.commit()
+		mark_order_failed(log_doc, wp_site, str(e))
+		_commit()
 		
 		raise
+	
+	finally:
+		release_order_lock(lock)
+
+
+def mark_order_failed(log_doc, wp_site, error_message):
+	"""Mark the log of a failed order and schedule its retry (db_set: the in-memory log may be ahead of the rolled back row)."""
+	attempts = frappe.utils.cint(log_doc.attempts) + 1
+	log_doc.db_set({
+		"status": "Failed",
+		"error_message": error_message,
+		"attempts": attempts,
+		"next_retry_at": get_next_retry_at(attempts, wp_site.max_retry_attempts)
+	})
+	
+	# Update stats
+	update_site_stat(wp_site.name, "failed")
+
+
+def get_next_retry_at(attempts, max_attempts):
+	"""Return when a log that failed `attempts` times is retried, or None once max_attempts are used up."""
+	if attempts >= frappe.utils.cint(max_attempts):
+		return None
+	
+	delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+	return frappe.utils.add_to_date(frappe.utils.now_datetime(), seconds=delay)
 
 
 def map_woocommerce_item(wc_item, wp_site):
 	"""Map WooCommerce item to ERPNext item."""
-	mapping_method = wp_site.item_mapping_method
+	return map_woocommerce_items([wc_item], wp_site)[0]
+
+
+def map_woocommerce_items(line_items, wp_site):
+	"""
+	Map all WooCommerce items of an order to ERPNext items in one pass.
 	
-	# Method 1: Custom Mapping
-	if mapping_method == "Custom Mapping":
-		item = frappe.db.get_value(
-			"WooCommerce Item Mapping",
-			{
-				"wordpress_site": wp_site.name,
-				"woocommerce_product_id": str(wc_item.get("product_id")),
-				"enabled": 1
-			},
-			"erp_item_code"
-		)
-		if item:
-			return item
-	
-	# Method 2: SKU
-	if mapping_method in ["SKU", "Custom Mapping"]:
-		sku = wc_item.get("sku")
-		if sku:
-			if frappe.db.exists("Item", {"item_code": sku}):
-				return sku
-			item = frappe.db.get_value("Item", {"item_name": sku}, "name")
-			if item:
-				return item
-	
-	# Method 3: Product Name
-	if mapping_method in ["Product Name", "Custom Mapping"]:
-		name = wc_item.get("name")
-		if name:
-			item = frappe.db.get_value("Item", {"item_name": name}, "name")
-			if item:
-				return item
-	
-	# Log unmapped item
-	frappe.log_error(
-		f"Site: {wp_site.name}\nMethod: {mapping_method}\nItem: {frappe.as_json(wc_item)}",
-		"WooCommerce Item Mapping Failed"
-	)
+	Uses the per-site item index (see customer_api.item_mapping), so an
+	order costs one Redis read plus at most one query for unseen products.
+	"""
+	item_codes = map_order_items(line_items, wp_site)
 	
-	return None
+	# Log unmapped items
+	for wc_item, item_code in zip(line_items, item_codes):
+		if not item_code:
+			frappe.log_error(
+				f"Site: {wp_site.name}\nMethod: {wp_site.item_mapping_method}\nItem: {frappe.as_json(wc_item)}",
+				"WooCommerce Item Mapping Failed"
+			)
+	
+	return item_codes
@@ -0,0 +1,487 @@
+"""
+Load test of the Customer API endpoints and the WooCommerce webhook listener.
+
+seed() creates a benchmark WordPress Site (SKU mapping, no stock updates, no
+auto submit), items and customers, all named with BENCH_PREFIX. run() then
+calls every endpoint `requests` times from `concurrency` threads, each with
+its own database connection, and reports per endpoint:
+
+- throughput (calls per second of wall time)
+- p50/p95/p99 latency in milliseconds
+- database statements per call (mean and p95)
+- errors
+
+The listener is called with a real werkzeug request (signed JSON body and
+WooCommerce headers), so parsing, site resolution and signature checks are
+measured too. Its payloads mix returning customers, new customers and
+repeated deliveries like a live shop.
+
+	bench --site <site> customer-api-benchmark --requests 500 --concurrency 8
+	bench --site <site> customer-api-benchmark --save-baseline
+	bench --site <site> customer-api-benchmark --compare
+	bench --site <site> customer-api-benchmark --cleanup
+
+Baselines are JSON files (private/benchmarks/customer_api.json by default);
+--compare exits with status 1 when an endpoint got slower, lost throughput
+or runs more statements per call than the baseline allows. Results depend
+on the machine, so compare against baselines saved on the same one.
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+import frappe
+from frappe.utils import now
+from frappe.utils.password import get_decrypted_password
+
+
+BENCH_PREFIX = "CAPI Bench"
+BENCH_SITE_URL = "https://capi-bench.example.com"
+
+ENDPOINTS = ("check_customer_registered", "create_customer", "create_sales_invoice", "woocommerce_webhook_listener")
+
+# Share of listener payloads for a customer that is not seeded
+NEW_CUSTOMER_RATIO = 0.2
+
+# Share of listener payloads that repeat an earlier delivery
+DUPLICATE_RATIO = 0.1
+
+# Allowed relative regression of latency, throughput and statements per call
+DEFAULT_TOLERANCE = 0.2
+
+BASELINE_FILE = "customer_api.json"
+
+
+def seed(customers=200, items=50):
+	"""
+	Create (or complete) the benchmark site, items and customers.
+
+	Returns:
+		dict: WordPress Site name, item codes and customer names
+	"""
+	site_name = frappe.db.get_value("WordPress Site", {"site_url": BENCH_SITE_URL})
+	if not site_name:
+		site = frappe.get_doc({
+			"doctype": "WordPress Site",
+			"site_name": f"{BENCH_PREFIX} Shop",
+			"site_url": BENCH_SITE_URL,
+			"enabled": 1,
+			"webhook_secret": frappe.generate_hash(length=32),
+			"item_mapping_method": "SKU",
+			"processing_mode": "Synchronous",
+			"auto_submit_invoices": 0,
+			"update_stock_on_invoice": 0,
+			"rate_limit_per_second": 0
+		})
+		site.insert(ignore_permissions=True)
+		site_name = site.name
+	elif frappe.db.get_value("WordPress Site", site_name, "rate_limit_per_second"):
+		# The benchmark measures the listener, not the rate limiter
+		site = frappe.get_doc("WordPress Site", site_name)
+		site.rate_limit_per_second = 0
+		site.save(ignore_permissions=True)
+
+	item_codes = [f"{BENCH_PREFIX} Item {i:04d}" for i in range(1, items + 1)]
+	existing = set(frappe.get_all("Item", filters={"name": ["in", item_codes]}, pluck="name"))
+	for item_code in item_codes:
+		if item_code not in existing:
+			frappe.get_doc({
+				"doctype": "Item",
+				"item_code": item_code,
+				"item_name": item_code,
+				"item_group": frappe.db.get_value("Item Group", {"is_group": 0}) or "All Item Groups",
+				"stock_uom": "Nos",
+				"is_stock_item": 0
+			}).insert(ignore_permissions=True)
+
+	from customer_api.api import create_customers_bulk
+
+	customer_rows = [get_customer_row(i) for i in range(1, customers + 1)]
+	create_customers_bulk(customers=customer_rows)
+	frappe.db.commit()
+
+	return frappe._dict(
+		wordpress_site=site_name,
+		item_codes=item_codes,
+		customer_names=[row["customer_name"] for row in customer_rows]
+	)
+
+
+def get_customer_row(number):
+	"""Seeded customer number `number`."""
+	return {
+		"customer_name": f"{BENCH_PREFIX} Customer {number:05d}",
+		"email": f"capi.bench.{number:05d}@example.com",
+		"mobile": f"+1 555 {number:07d}",
+		"address_line1": f"{number} Benchmark Street",
+		"city": "Springfield",
+		"country": frappe.db.get_default("country")
+	}
+
+
+def run(requests=200, concurrency=4, endpoints=None, customers=200, items=50):
+	"""
+	Seed the benchmark data and load every endpoint.
+
+	Args:
+		requests (int): Calls per endpoint
+		concurrency (int): Threads calling an endpoint at the same time
+		endpoints (list): Endpoints to load (default: all of ENDPOINTS)
+		customers (int): Seeded customers
+		items (int): Seeded items
+
+	Returns:
+		dict: Results per endpoint, plus the run parameters under "_meta"
+	"""
+	data = seed(customers=customers, items=items)
+	data.secret = get_decrypted_password("WordPress Site", data.wordpress_site, "webhook_secret")
+	run_id = frappe.generate_hash(length=6)
+
+	results = {
+		"_meta": {
+			"timestamp": now(),
+			"requests": requests,
+			"concurrency": concurrency,
+			"customers": customers,
+			"items": items
+		}
+	}
+	for endpoint in endpoints or ENDPOINTS:
+		if endpoint not in ENDPOINTS:
+			frappe.throw(frappe._("Unknown benchmark endpoint {0}").format(endpoint))
+
+		calls = [make_call(endpoint, data, run_id, i) for i in range(requests)]
+		results[endpoint] = load(calls, concurrency)
+
+	return results
+
+
+def make_call(endpoint, data, run_id, number):
+	"""Return the (function, kwargs) of one call of an endpoint."""
+	rng = random.Random(f"{run_id}:{endpoint}:{number}")
+
+	if endpoint == "check_customer_registered":
+		return call_api, {"method": endpoint, "customer_name": rng.choice(data.customer_names)}
+
+	if endpoint == "create_customer":
+		return call_api, {
+			"method": endpoint,
+			"customer_name": f"{BENCH_PREFIX} New {run_id} {number:06d}",
+			"email": f"capi.bench.new.{run_id}.{number}@example.com",
+			"address_line1": f"{number} New Street",
+			"city": "Springfield",
+			"country": frappe.db.get_default("country")
+		}
+
+	if endpoint == "create_sales_invoice":
+		return call_api, {
+			"method": endpoint,
+			"customer": rng.choice(data.customer_names),
+			"items": [
+				{"item_code": item_code, "qty": rng.randint(1, 5), "rate": rng.randint(5, 200)}
+				for item_code in rng.sample(data.item_codes, min(3, len(data.item_codes)))
+			],
+			"update_stock": 0
+		}
+
+	# Repeat an earlier order now and then, as WooCommerce does on timeouts
+	order_number = rng.randrange(number) if number and rng.random() < DUPLICATE_RATIO else number
+	return call_listener, {
+		"order_data": get_order_payload(data, run_id, order_number),
+		"site_url": BENCH_SITE_URL,
+		"secret": data.secret
+	}
+
+
+def get_order_payload(data, run_id, number):
+	"""A WooCommerce order (REST API v3 shape) for the seeded customers and items."""
+	rng = random.Random(f"{run_id}:order:{number}")
+	order_id = int(run_id, 16) % 10**6 * 10**6 + number
+
+	if rng.random() < NEW_CUSTOMER_RATIO:
+		first_name, last_name = f"{BENCH_PREFIX} New", f"{run_id} Order {number:06d}"
+		email, phone = f"capi.bench.order.{run_id}.{number}@example.com", ""
+	else:
+		customer = get_customer_row(rng.randint(1, len(data.customer_names)))
+		first_name, last_name = customer["customer_name"].rsplit(" ", 1)
+		email, phone = customer["email"], customer["mobile"]
+
+	line_items = []
+	for index, item_code in enumerate(rng.sample(data.item_codes, min(rng.randint(1, 4), len(data.item_codes)))):
+		quantity, price = rng.randint(1, 3), rng.randint(5, 200)
+		line_items.append({
+			"id": order_id * 10 + index,
+			"name": item_code,
+			"product_id": 900000 + data.item_codes.index(item_code),
+			"variation_id": 0,
+			"quantity": quantity,
+			"sku": item_code,
+			"price": price,
+			"subtotal": str(quantity * price),
+			"total": str(quantity * price)
+		})
+
+	return {
+		"id": order_id,
+		"status": "processing",
+		"currency": "USD",
+		"date_created_gmt": now().replace(" ", "T")[:19],
+		"date_modified_gmt": now().replace(" ", "T")[:19],
+		"total": str(sum(float(item["total"]) for item in line_items)),
+		"billing": {
+			"first_name": first_name,
+			"last_name": last_name,
+			"email": email,
+			"phone": phone,
+			"address_1": f"{number} Order Street",
+			"city": "Springfield",
+			"postcode": "12345",
+			"country": "US"
+		},
+		"line_items": line_items,
+		"meta_data": [{"id": number, "key": "_benchmark", "value": run_id}]
+	}
+
+
+def call_api(method, **kwargs):
+	"""Call a Customer API endpoint like the request handler would."""
+	result = frappe.get_attr(f"customer_api.api.{method}")(**kwargs)
+	if isinstance(result, dict) and result.get("success") is False and "already exists" not in (result.get("message") or ""):
+		raise Exception(result.get("message"))
+
+
+def call_listener(order_data, site_url, secret):
+	"""POST a signed order to the webhook listener through a werkzeug request."""
+	import base64
+	import hashlib
+	import hmac
+
+	from werkzeug.test import EnvironBuilder
+	from werkzeug.wrappers import Request, Response
+
+	from customer_api.api import woocommerce_webhook_listener
+
+	body = json.dumps(order_data).encode()
+	signature = base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+
+	frappe.local.request = Request(EnvironBuilder(
+		path="/api/method/customer_api.api.woocommerce_webhook_listener",
+		method="POST",
+		data=body,
+		content_type="application/json",
+		headers={
+			"X-WC-Webhook-Source": site_url,
+			"X-WC-Webhook-Topic": "order.created",
+			"X-WC-Webhook-Signature": signature,
+			"X-WC-Webhook-Delivery-ID": frappe.generate_hash(length=10)
+		}
+	).get_environ())
+	frappe.local.response = frappe._dict(docs=[])
+
+	result = woocommerce_webhook_listener()
+	if isinstance(result, Response):
+		# Answered without processing, e.g. HTTP 429 from the rate limiter
+		raise Exception(f"HTTP {result.status_code}")
+	if not result.get("success"):
+		raise Exception(result.get("message"))
+
+
+def load(calls, concurrency):
+	"""Run calls on `concurrency` threads and summarize their timings."""
+	jobs = queue.Queue()
+	for call in calls:
+		jobs.put(call)
+
+	samples = []
+	errors = []
+	site = (frappe.local.site, frappe.local.sites_path)
+	user = frappe.session.user
+
+	threads = [
+		threading.Thread(target=_worker, args=(site, user, jobs, samples, errors), name=f"customer_api_bench_{i}")
+		for i in range(max(int(concurrency), 1))
+	]
+	started = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	return summarize(samples, errors, time.perf_counter() - started)
+
+
+def _worker(site, user, jobs, samples, errors):
+	"""Benchmark thread: its own site connection, one committed transaction per call."""
+	site, sites_path = site
+	frappe.init(site=site, sites_path=sites_path)
+	frappe.connect()
+	frappe.set_user(user)
+	counter = count_statements()
+
+	try:
+		while True:
+			try:
+				function, kwargs = jobs.get_nowait()
+			except queue.Empty:
+				break
+
+			counter.count = 0
+			started = time.perf_counter()
+			try:
+				function(**kwargs)
+				frappe.db.commit()
+			except Exception as e:
+				frappe.db.rollback()
+				errors.append(str(e))
+			samples.append((time.perf_counter() - started, counter.count))
+	finally:
+		frappe.destroy()
+
+
+def count_statements():
+	"""Count the statements run through this thread's database connection."""
+	counter = frappe._dict(count=0)
+	sql = frappe.db.sql
+
+	def counting_sql(*args, **kwargs):
+		counter.count += 1
+		return sql(*args, **kwargs)
+
+	frappe.db.sql = counting_sql
+	return counter
+
+
+def summarize(samples, errors, elapsed):
+	"""Throughput, latency percentiles (ms) and statements per call of a load run."""
+	latencies = sorted(latency * 1000 for latency, _count in samples)
+	statements = sorted(count for _latency, count in samples)
+
+	return {
+		"calls": len(samples),
+		"errors": len(errors),
+		"sample_errors": sorted(set(errors))[:5],
+		"throughput": round(len(samples) / elapsed, 2) if elapsed else 0,
+		"p50_ms": percentile(latencies, 50),
+		"p95_ms": percentile(latencies, 95),
+		"p99_ms": percentile(latencies, 99),
+		"max_ms": round(latencies[-1], 2) if latencies else 0,
+		"queries_per_call": round(sum(statements) / len(statements), 2) if statements else 0,
+		"p95_queries": percentile(statements, 95)
+	}
+
+
+def percentile(values, p):
+	"""Nearest-rank percentile of sorted values."""
+	if not values:
+		return 0
+	return round(values[max(-(-len(values) * p // 100) - 1, 0)], 2)
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+	"""
+	Compare results with a baseline.
+
+	Returns:
+		list: Regression messages, empty if every endpoint is within tolerance
+	"""
+	regressions = []
+	for endpoint, result in results.items():
+		base = baseline.get(endpoint)
+		if endpoint.startswith("_") or not base:
+			continue
+
+		for metric in ("p95_ms", "p99_ms", "queries_per_call"):
+			# Statement counts are nearly exact, so one more per call is allowed at most
+			limit = base[metric] * (1 + tolerance) if metric != "queries_per_call" else \
+				max(base[metric] * (1 + tolerance), base[metric] + 1)
+			if result[metric] > limit:
+				regressions.append(f"{endpoint}: {metric} {result[metric]} > baseline {base[metric]}")
+
+		if result["throughput"] < base["throughput"] * (1 - tolerance):
+			regressions.append(f"{endpoint}: throughput {result['throughput']}/s < baseline {base['throughput']}/s")
+
+		if result["errors"] > base["errors"]:
+			regressions.append(f"{endpoint}: {result['errors']} errors (baseline {base['errors']})")
+
+	return regressions
+
+
+def get_baseline_path(path=None):
+	"""Return the baseline file, defaulting to the site's private/benchmarks folder."""
+	return path or frappe.get_site_path("private", "benchmarks", BASELINE_FILE)
+
+
+def save_baseline(results, path=None):
+	"""Write results as the new baseline and return its path."""
+	path = get_baseline_path(path)
+	os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+	with open(path, "w") as f:
+		json.dump(results, f, indent=1, sort_keys=True)
+
+	return path
+
+
+def load_baseline(path=None):
+	"""Return a saved baseline, or None."""
+	path = get_baseline_path(path)
+	if not os.path.exists(path):
+		return None
+
+	with open(path) as f:
+		return json.load(f)
+
+
+def format_results(results):
+	"""Results as a text table."""
+	lines = [
+		f"{'endpoint':<30}{'calls':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}",
+	]
+	for endpoint, result in results.items():
+		if endpoint.startswith("_"):
+			continue
+		lines.append(
+			f"{endpoint:<30}{result['calls']:>7}{result['errors']:>8}{result['throughput']:>9}"
+			f"{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}{result['queries_per_call']:>9}"
+		)
+		lines.extend(f"    {error}" for error in result["sample_errors"])
+
+	return "\n".join(lines)
+
+
+def cleanup():
+	"""Delete everything the benchmark created (draft invoices, logs, customers, items, site)."""
+	customers = frappe.get_all("Customer", filters={"customer_name": ["like", f"{BENCH_PREFIX} %"]}, pluck="name")
+	site_name = frappe.db.get_value("WordPress Site", {"site_url": BENCH_SITE_URL})
+
+	if customers:
+		for invoice in frappe.get_all(
+			"Sales Invoice", filters={"customer": ["in", customers], "docstatus": 0}, pluck="name"
+		):
+			frappe.delete_doc("Sales Invoice", invoice, ignore_permissions=True, force=True)
+
+		for parenttype, parent in frappe.get_all(
+			"Dynamic Link",
+			filters={"link_doctype": "Customer", "link_name": ["in", customers], "parenttype": ["in", ["Contact", "Address"]]},
+			fields=["parenttype", "parent"],
+			as_list=True,
+			distinct=True
+		):
+			if frappe.db.exists(parenttype, parent):
+				frappe.delete_doc(parenttype, parent, ignore_permissions=True, force=True)
+
+		for customer in customers:
+			frappe.delete_doc("Customer", customer, ignore_permissions=True, force=True)
+		frappe.db.commit()
+
+	for item_code in frappe.get_all("Item", filters={"item_code": ["like", f"{BENCH_PREFIX} Item %"]}, pluck="name"):
+		frappe.delete_doc("Item", item_code, ignore_permissions=True, force=True)
+
+	if site_name:
+		frappe.db.delete("WordPress Webhook Log", {"wordpress_site": site_name})
+		frappe.delete_doc("WordPress Site", site_name, ignore_permissions=True, force=True)
+
+	frappe.db.commit()
@@ -0,0 +1,157 @@
+"""
+Query plans of the webhook log lookups, without and with the indexes.
+
+Builds a synthetic copy of the WordPress Webhook Log table, fills it with
+`rows` logs spread over ten sites (1% Pending, 1% Failed, the rest
+invoiced), then runs EXPLAIN and times the queue and listener queries
+before and after adding the indexes of the doctype. MariaDB/MySQL only.
+
+	bench --site <site> execute customer_api.benchmarks.webhook_log_indexes.run
+	bench --site <site> execute customer_api.benchmarks.webhook_log_indexes.run --kwargs "{'rows': 100000}"
+
+The benchmark table is dropped afterwards.
+"""
+
+import time
+
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+from customer_api.customer_api.doctype.wordpress_webhook_log.wordpress_webhook_log import add_log_indexes
+
+
+BENCH_DOCTYPE = "WordPress Webhook Log Index Benchmark"
+BENCH_TABLE = f"tab{BENCH_DOCTYPE}"
+
+# Timed executions per query
+REPEAT = 5
+
+QUERIES = {
+	"claim_pending_logs": """
+		select name from `{table}`
+		where status = 'Pending' and wordpress_site in ('Bench Site 1', 'Bench Site 2')
+		order by creation
+		limit 50
+	""",
+	"get_duplicate_delivery": """
+		select name, status, created_customer, created_invoice from `{table}`
+		where wordpress_site = 'Bench Site 3' and woocommerce_order_id = '500003'
+			and webhook_topic = 'order.created'
+	""",
+	"get_existing_invoice": """
+		select created_customer, created_invoice from `{table}`
+		where wordpress_site = 'Bench Site 3' and woocommerce_order_id = '500003'
+			and created_invoice is not null
+	""",
+	"release_stale_claims": """
+		select name, wordpress_site from `{table}`
+		where status = 'Processing' and claimed_at < %(cutoff)s
+	""",
+	"failed_logs_list": """
+		select name from `{table}`
+		where status = 'Failed'
+		order by timestamp desc
+		limit 20
+	"""
+}
+
+
+def run(rows=1_000_000):
+	"""Run the benchmark and print the plans; returns {"before": ..., "after": ...}."""
+	create_bench_table()
+	try:
+		fill_bench_table(int(rows))
+
+		results = {"before": explain_queries()}
+		print_results("Without indexes", results["before"])
+
+		frappe.db.add_unique(
+			BENCH_DOCTYPE,
+			["wordpress_site", "woocommerce_order_id", "webhook_topic"],
+			constraint_name="unique_site_order_topic"
+		)
+		add_log_indexes(BENCH_DOCTYPE)
+		frappe.db.sql(f"analyze table `{BENCH_TABLE}`")
+
+		results["after"] = explain_queries()
+		print_results("With indexes", results["after"])
+
+		return results
+
+	finally:
+		frappe.db.sql_ddl(f"drop table if exists `{BENCH_TABLE}`")
+
+
+def create_bench_table():
+	"""Copy the log table structure, keeping only the primary key."""
+	frappe.db.sql_ddl(f"drop table if exists `{BENCH_TABLE}`")
+	frappe.db.sql_ddl(f"create table `{BENCH_TABLE}` like `tabWordPress Webhook Log`")
+
+	for index_name in {row.Key_name for row in frappe.db.sql(f"show index from `{BENCH_TABLE}`", as_dict=True)}:
+		if index_name != "PRIMARY":
+			frappe.db.sql_ddl(f"alter table `{BENCH_TABLE}` drop index `{index_name}`")
+
+
+def fill_bench_table(rows):
+	"""Insert `rows` synthetic logs with one INSERT ... SELECT over a generated sequence."""
+	digits = "(select 0 d union all select 1 union all select 2 union all select 3 union all select 4 "\
+		"union all select 5 union all select 6 union all select 7 union all select 8 union all select 9)"
+	sequence = " cross join ".join(f"{digits} d{i}" for i in range(7))
+	number = " + ".join(f"d{i}.d * {10 ** i}" for i in range(7))
+
+	frappe.db.sql(f"""
+		insert into `{BENCH_TABLE}` (
+			name, creation, modified, owner, modified_by, docstatus,
+			wordpress_site, woocommerce_order_id, webhook_topic, status,
+			timestamp, created_customer, created_invoice
+		)
+		select
+			concat('BENCH-', n), now() - interval n second, now() - interval n second,
+			'Administrator', 'Administrator', 0,
+			concat('Bench Site ', n %% 10), n, 'order.created',
+			case n %% 100 when 0 then 'Pending' when 1 then 'Failed' else 'Success' end,
+			now() - interval n second,
+			if(n %% 100 > 1, concat('CUST-', n), null),
+			if(n %% 100 > 1, concat('SINV-', n), null)
+		from (select {number} as n from {sequence}) seq
+		where n < %(rows)s
+	""", {"rows": rows})
+	frappe.db.commit()
+	frappe.db.sql(f"analyze table `{BENCH_TABLE}`")
+
+
+def explain_queries():
+	"""EXPLAIN and time every benchmark query."""
+	values = {"cutoff": add_to_date(now_datetime(), minutes=-30)}
+	results = {}
+
+	for label, query in QUERIES.items():
+		query = query.format(table=BENCH_TABLE)
+		plan = frappe.db.sql(f"explain {query}", values, as_dict=True)
+
+		started = time.perf_counter()
+		for _ in range(REPEAT):
+			frappe.db.sql(query, values)
+		elapsed_ms = (time.perf_counter() - started) * 1000 / REPEAT
+
+		results[label] = {
+			"plan": [
+				{"type": row.get("type"), "key": row.get("key"), "rows": row.get("rows"), "extra": row.get("Extra")}
+				for row in plan
+			],
+			"avg_ms": round(elapsed_ms, 2)
+		}
+
+	return results
+
+
+def print_results(title, results):
+	"""Print one line per query: access type, index, examined rows and timing."""
+	print(f"\n{title}")
+	print(f"{'query':<24} {'type':<8} {'key':<30} {'rows':>10} {'avg ms':>9}  extra")
+	for label, result in results.items():
+		for row in result["plan"]:
+			print(
+				f"{label:<24} {row['type'] or '':<8} {row['key'] or '-':<30} "
+				f"{row['rows'] or 0:>10} {result['avg_ms']:>9}  {row['extra'] or ''}"
+			)
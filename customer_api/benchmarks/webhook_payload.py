@@ -0,0 +1,133 @@
+"""
+Cost of reading, verifying and parsing large webhook bodies.
+
+Builds a WooCommerce order with `line_items` line items and times, over
+`repeat` werkzeug requests each:
+
+- parse_then_verify: the former listener (get_json, then the signature
+  over a second get_data)
+- verify_then_parse: the current listener path (one get_data, signature
+  over the raw bytes, then parse_json_body)
+- reject_bad_signature: the current path for a forged body, which is
+  never parsed
+
+No database access; the WordPress Site is a plain dict.
+
+	bench --site <site> execute customer_api.benchmarks.webhook_payload.run
+	bench --site <site> execute customer_api.benchmarks.webhook_payload.run --kwargs "{'line_items': 2000}"
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+import frappe
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from customer_api import api
+from customer_api.api import parse_json_body, verify_webhook_signature
+
+
+SECRET = "benchmark-secret"
+
+
+def run(line_items=500, repeat=200):
+	"""Run the benchmark and print milliseconds per request; returns {case: ms}."""
+	body = json.dumps(get_large_order(line_items)).encode()
+	signature = sign(body)
+	wp_site = frappe._dict(webhook_secret=SECRET)
+
+	cases = {
+		"parse_then_verify": lambda: parse_then_verify(body, signature, wp_site),
+		"verify_then_parse": lambda: verify_then_parse(body, signature, wp_site),
+		"reject_bad_signature": lambda: verify_then_parse(body, sign(b"forged"), wp_site)
+	}
+
+	decoder = "orjson" if api.orjson else "json"
+	print(f"Order with {line_items} line items: {len(body) / 1024:.0f} KB, {decoder} decoder")
+	results = {}
+	for name, case in cases.items():
+		started = time.perf_counter()
+		for _i in range(repeat):
+			case()
+		results[name] = round((time.perf_counter() - started) * 1000 / repeat, 3)
+		print(f"{name:<24}{results[name]:>10} ms")
+
+	return results
+
+
+def parse_then_verify(body, signature, wp_site):
+	"""The listener before: parse the JSON, then read the body again for the signature."""
+	set_request(body, signature)
+	order_data = frappe.request.get_json()
+	if verify_webhook_signature(wp_site):
+		return order_data
+
+
+def verify_then_parse(body, signature, wp_site):
+	"""The listener now: read once, verify the raw bytes, parse only authentic bodies."""
+	set_request(body, signature)
+	data = frappe.request.get_data()
+	if verify_webhook_signature(wp_site, data):
+		return parse_json_body(data)
+
+
+def set_request(body, signature):
+	"""Make a fresh request for the body, as the request handler would."""
+	frappe.local.request = Request(EnvironBuilder(
+		method="POST",
+		data=body,
+		content_type="application/json",
+		headers={"X-WC-Webhook-Signature": signature}
+	).get_environ())
+
+
+def sign(body):
+	"""WooCommerce signature of a body."""
+	return base64.b64encode(hmac.new(SECRET.encode(), body, hashlib.sha256).digest()).decode()
+
+
+def get_large_order(line_items):
+	"""A WooCommerce order (REST API v3 shape) with many line items and their metadata."""
+	return {
+		"id": 424242,
+		"status": "processing",
+		"currency": "USD",
+		"date_created_gmt": "2026-10-18T10:00:00",
+		"billing": {
+			"first_name": "Large",
+			"last_name": "Order",
+			"email": "large.order@example.com",
+			"phone": "+1 555 0100",
+			"address_1": "1 Benchmark Street",
+			"city": "Springfield",
+			"postcode": "12345",
+			"country": "US"
+		},
+		"line_items": [
+			{
+				"id": 100000 + i,
+				"name": f"Product {i} - Variant",
+				"product_id": 5000 + i,
+				"variation_id": 9000 + i,
+				"quantity": i % 5 + 1,
+				"tax_class": "",
+				"subtotal": f"{(i % 5 + 1) * 19.99:.2f}",
+				"subtotal_tax": "0.00",
+				"total": f"{(i % 5 + 1) * 19.99:.2f}",
+				"total_tax": "0.00",
+				"taxes": [],
+				"meta_data": [
+					{"id": 200000 + i, "key": "pa_size", "value": "large", "display_key": "Size", "display_value": "Large"},
+					{"id": 300000 + i, "key": "pa_color", "value": "blue", "display_key": "Color", "display_value": "Blue"}
+				],
+				"sku": f"SKU-{i:05d}",
+				"price": 19.99,
+				"image": {"id": 7000 + i, "src": f"https://shop.example.com/wp-content/uploads/product-{i}.jpg"}
+			}
+			for i in range(line_items)
+		]
+	}
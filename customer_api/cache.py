@@ -0,0 +1,297 @@
+"""
+Caches for hot lookups of the Customer API.
+
+WordPress Site settings are kept in Redis as one map of normalized site URL
+to settings (including the decrypted webhook secret), and mirrored in a
+per-process copy that is revalidated against a version key on every read,
+so resolving the site of a webhook costs one Redis GET and no queries.
+
+Customer lookups by name and by email are read-through Redis entries,
+invalidated by Customer and Contact doc_events (see hooks.py). Misses are
+cached as well, for a short time only. Emails are looked up in the
+Customer Lookup Key table (see customer_lookup.py).
+"""
+
+from urllib.parse import urlsplit
+
+import frappe
+from frappe.utils.password import get_decrypted_password
+from redis.exceptions import RedisError
+
+
+SITE_MAP_CACHE_KEY = "customer_api:wordpress_site_map"
+SITE_MAP_VERSION_KEY = "customer_api:wordpress_site_map_version"
+
+# WordPress Site fields kept in the cached settings
+SITE_FIELDS = [
+	"name",
+	"site_url",
+	"enabled",
+	"default_customer_group",
+	"default_territory",
+	"item_mapping_method",
+	"default_warehouse",
+	"auto_submit_invoices",
+	"update_stock_on_invoice",
+	"default_company",
+	"default_cost_center",
+	"processing_mode",
+	"processing_queue",
+	"max_retry_attempts",
+	"single_transaction",
+	"max_payload_size_kb",
+	"rate_limit_per_second",
+	"rate_limit_burst"
+]
+
+# Per-process copies of the site map: {frappe site: (version, site_map)}
+_site_maps = {}
+
+
+def normalize_site_url(url):
+	"""
+	Normalize a shop URL to "host[:port][/path]" for exact matching.
+
+	The scheme, a leading "www.", default ports and trailing slashes are
+	dropped and the result is lowercased.
+	"""
+	url = (url or "").strip().lower()
+	if not url:
+		return ""
+
+	if "://" not in url:
+		url = f"//{url}"
+
+	parts = urlsplit(url)
+	host = parts.hostname or ""
+	if host.startswith("www."):
+		host = host[4:]
+
+	try:
+		port = parts.port
+	except ValueError:
+		port = None
+	if port and port not in (80, 443):
+		host = f"{host}:{port}"
+
+	return host + parts.path.rstrip("/")
+
+
+def get_site_config(source_url):
+	"""
+	Return the cached settings of the enabled site a webhook source URL belongs to.
+
+	The longest registered URL wins, so shops living in sub-directories of
+	the same host are told apart.
+	"""
+	site_map = get_site_map()
+	key = normalize_site_url(source_url)
+
+	while key:
+		site_name = site_map["urls"].get(key)
+		if site_name:
+			return site_map["sites"][site_name]
+
+		if "/" not in key:
+			break
+		key = key.rsplit("/", 1)[0]
+
+	return None
+
+
+def get_site_config_by_name(site_name):
+	"""Return the cached settings of a WordPress Site by name."""
+	return get_site_map()["sites"].get(site_name)
+
+
+def get_site_map():
+	"""Return the site map, from the process copy if Redis still has the same version."""
+	version = frappe.cache().get_value(SITE_MAP_VERSION_KEY)
+	cached = _site_maps.get(frappe.local.site)
+	if version and cached and cached[0] == version:
+		return cached[1]
+
+	site_map = frappe.cache().get_value(SITE_MAP_CACHE_KEY)
+	if site_map is None or not version:
+		site_map = build_site_map()
+		frappe.cache().set_value(SITE_MAP_CACHE_KEY, site_map)
+		if not version:
+			version = frappe.generate_hash(length=10)
+			frappe.cache().set_value(SITE_MAP_VERSION_KEY, version)
+
+	_site_maps[frappe.local.site] = (version, site_map)
+	return site_map
+
+
+def build_site_map():
+	"""Load all WordPress Sites with their decrypted secrets."""
+	site_map = {"urls": {}, "sites": {}}
+
+	for site in frappe.get_all("WordPress Site", fields=SITE_FIELDS):
+		site.webhook_secret = get_decrypted_password(
+			"WordPress Site", site.name, "webhook_secret", raise_exception=False
+		)
+		site_map["sites"][site.name] = site
+
+		url_key = normalize_site_url(site.site_url)
+		if site.enabled and url_key:
+			site_map["urls"][url_key] = site.name
+
+	return site_map
+
+
+def clear_site_cache():
+	"""Invalidate the site map in Redis and, through the version key, in every process."""
+	frappe.cache().delete_value(SITE_MAP_CACHE_KEY)
+	frappe.cache().set_value(SITE_MAP_VERSION_KEY, frappe.generate_hash(length=10))
+	_site_maps.pop(frappe.local.site, None)
+
+
+# ==================== CUSTOMER LOOKUPS ====================
+
+CUSTOMER_CACHE_TTL = 60 * 60
+
+# Misses are cached briefly: a customer created by another process shows
+# up after this many seconds at the latest
+CUSTOMER_NEGATIVE_TTL = 30
+
+CUSTOMER_BY_NAME_KEY = "customer_api:customer_by_name"
+CUSTOMER_BY_EMAIL_KEY = "customer_api:customer_by_email"
+CUSTOMER_CACHE_STATS_KEY = "customer_api:customer_cache_stats"
+
+# Customer fields kept in a cached summary
+CUSTOMER_SUMMARY_FIELDS = ["name", "customer_name", "customer_group", "territory", "customer_type", "disabled"]
+
+# Cached in place of a missing customer
+NOT_FOUND = "__not_found__"
+
+
+def get_customer_summary(customer_name):
+	"""Return the summary of the customer with this customer_name, or None."""
+	return _read_through(
+		_customer_key(CUSTOMER_BY_NAME_KEY, customer_name),
+		lambda: frappe.db.get_value(
+			"Customer", {"customer_name": customer_name}, CUSTOMER_SUMMARY_FIELDS, as_dict=True
+		)
+	)
+
+
+def get_customer_by_email(email):
+	"""Return the ID of the customer with a contact with this email, or None."""
+	from customer_api.customer_lookup import find_customer
+
+	return _read_through(
+		_customer_key(CUSTOMER_BY_EMAIL_KEY, email),
+		lambda: find_customer(email=email)
+	)
+
+
+def _customer_key(prefix, value):
+	"""Cache key for a lookup value (lowercased like the database collation compares it)."""
+	return f"{prefix}:{(value or '').strip().lower()}"
+
+
+def _read_through(key, load):
+	"""Return a cached value, loading and caching it (or its absence) on a miss."""
+	cached = frappe.cache().get_value(key)
+	if cached is not None:
+		_count_lookup("hits")
+		return None if cached == NOT_FOUND else cached
+
+	_count_lookup("misses")
+	value = load()
+	frappe.cache().set_value(
+		key,
+		value or NOT_FOUND,
+		expires_in_sec=CUSTOMER_CACHE_TTL if value else CUSTOMER_NEGATIVE_TTL
+	)
+	return value
+
+
+def _count_lookup(counter):
+	"""Increment a customer cache hit/miss counter."""
+	try:
+		cache = frappe.cache()
+		cache.hincrby(cache.make_key(CUSTOMER_CACHE_STATS_KEY), counter, 1)
+	except RedisError:
+		pass
+
+
+@frappe.whitelist()
+def get_customer_cache_stats():
+	"""
+	Return the customer cache hit and miss counters.
+
+	Returns:
+		dict: hits, misses and hit_ratio since the counters were last reset
+	"""
+	frappe.only_for("System Manager")
+
+	cache = frappe.cache()
+	hits, misses = (int(value or 0) for value in cache.hmget(cache.make_key(CUSTOMER_CACHE_STATS_KEY), ["hits", "misses"]))
+
+	return {
+		"hits": hits,
+		"misses": misses,
+		"hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None
+	}
+
+
+def clear_customer_cache(doc, method=None, *args, **kwargs):
+	"""
+	doc_events handler: drop cached lookups of a Customer (old and new values).
+
+	A deleted or renamed customer also drops the email lookups of its
+	contacts, which would otherwise keep returning the old customer ID.
+	"""
+	names = {doc.customer_name}
+	emails = {doc.get("email_id")}
+
+	before = doc.get_doc_before_save() if method == "on_update" else None
+	if before:
+		names.add(before.customer_name)
+		emails.add(before.get("email_id"))
+
+	if method in ("on_trash", "after_rename"):
+		emails.update(get_linked_contact_emails(doc.name))
+
+	_delete_customer_keys(names, emails)
+
+
+def get_linked_contact_emails(customer):
+	"""Return the email addresses of the contacts linked to a customer (from its lookup keys)."""
+	from customer_api.customer_lookup import LOOKUP_DOCTYPE
+
+	return frappe.get_all(
+		LOOKUP_DOCTYPE, filters={"customer": customer, "key_type": "Email"}, pluck="normalized_value"
+	)
+
+
+def clear_contact_cache(doc, method=None, *args, **kwargs):
+	"""doc_events handler: drop cached email lookups of a Contact's addresses (old and new)."""
+	emails = {row.email_id for row in doc.get("email_ids") or []}
+	emails.add(doc.get("email_id"))
+
+	before = doc.get_doc_before_save() if method == "on_update" else None
+	if before:
+		emails.update(row.email_id for row in before.get("email_ids") or [])
+
+	_delete_customer_keys(set(), emails)
+
+
+def _delete_customer_keys(names, emails):
+	"""Delete cached lookups now and again after commit, so a reader racing the transaction cannot keep stale data."""
+	keys = [_customer_key(CUSTOMER_BY_NAME_KEY, name) for name in names if name]
+	keys += [_customer_key(CUSTOMER_BY_EMAIL_KEY, email) for email in emails if email]
+	if not keys:
+		return
+
+	def delete():
+		for key in keys:
+			frappe.cache().delete_value(key)
+
+	delete()
+
+	after_commit = getattr(frappe.db, "after_commit", None)
+	if after_commit:
+		after_commit.add(delete)
@@ -0,0 +1,98 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("import-woocommerce-orders")
+@click.argument("wordpress_site", required=False)
+@click.argument("path", required=False, type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", type=int, default=100, help="Orders committed together")
+@click.option("--resume", "import_id", help="ID of an interrupted import to resume")
+@pass_context
+def import_woocommerce_orders(context, wordpress_site=None, path=None, batch_size=100, import_id=None):
+	"""Import historical WooCommerce orders from an NDJSON or JSON array file."""
+	import frappe
+	from customer_api.order_import import run_import, start_import
+
+	if not import_id and not (wordpress_site and path):
+		raise click.UsageError("Pass WORDPRESS_SITE and PATH, or --resume IMPORT_ID")
+
+	def report(state):
+		percent = state.offset * 100 // state.size if state.size else 100
+		click.echo(
+			f"{percent:>3}%  processed {state.processed}, created {state.created}, "
+			f"duplicates {state.duplicates}, failed {state.failed}"
+		)
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		if not import_id:
+			import_id = start_import(wordpress_site, path, batch_size=batch_size).import_id
+			click.echo(f"Import {import_id} started (resume with --resume {import_id})")
+
+		state = run_import(import_id, progress=report)
+		click.secho(f"Import {import_id} {state.status.lower()}", fg="green")
+	finally:
+		frappe.destroy()
+
+
+@click.command("customer-api-benchmark")
+@click.option("--requests", "requests_per_endpoint", type=int, default=200, help="Calls per endpoint")
+@click.option("--concurrency", type=int, default=4, help="Threads calling an endpoint at the same time")
+@click.option("--endpoint", "endpoints", multiple=True, help="Endpoint to load (repeatable, default: all)")
+@click.option("--customers", type=int, default=200, help="Seeded customers")
+@click.option("--items", type=int, default=50, help="Seeded items")
+@click.option("--baseline", "baseline_path", help="Baseline JSON file (default: private/benchmarks/customer_api.json)")
+@click.option("--save-baseline", is_flag=True, help="Save the results as the new baseline")
+@click.option("--compare", is_flag=True, help="Exit with status 1 if the results regressed from the baseline")
+@click.option("--tolerance", type=float, default=0.2, help="Allowed relative regression (default: 0.2)")
+@click.option("--cleanup", is_flag=True, help="Delete the benchmark data and exit")
+@pass_context
+def customer_api_benchmark(context, requests_per_endpoint=200, concurrency=4, endpoints=None, customers=200,
+		items=50, baseline_path=None, save_baseline=False, compare=False, tolerance=0.2, cleanup=False):
+	"""Load the Customer API endpoints and the webhook listener and report latency and query counts."""
+	import json
+
+	import frappe
+	from customer_api.benchmarks import load_test
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	frappe.set_user("Administrator")
+	try:
+		if cleanup:
+			load_test.cleanup()
+			click.secho("Benchmark data deleted", fg="green")
+			return
+
+		results = load_test.run(
+			requests=requests_per_endpoint,
+			concurrency=concurrency,
+			endpoints=list(endpoints) or None,
+			customers=customers,
+			items=items
+		)
+		click.echo(load_test.format_results(results))
+
+		baseline = load_test.load_baseline(baseline_path)
+		regressions = load_test.compare(results, baseline, tolerance=tolerance) if baseline else []
+
+		if save_baseline:
+			click.echo(f"Baseline saved to {load_test.save_baseline(results, baseline_path)}")
+		elif compare:
+			if not baseline:
+				raise click.ClickException(f"No baseline at {load_test.get_baseline_path(baseline_path)}")
+			if regressions:
+				click.secho("\n".join(["Regressions:"] + regressions), fg="red")
+				raise SystemExit(1)
+			click.secho("No regressions", fg="green")
+		elif regressions:
+			click.secho("\n".join(["Slower than the baseline:"] + regressions), fg="yellow")
+
+		if context.verbose:
+			click.echo(json.dumps(results, indent=1))
+	finally:
+		frappe.destroy()
+
+
+commands = [import_woocommerce_orders, customer_api_benchmark]
@@ -0,0 +1,15 @@
+# Copyright (c) 2025, Your Company and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class CustomerLookupKey(Document):
+	pass
+
+
+def on_doctype_update():
+	"""Index the lookup (type, value) and the per-contact/per-customer cleanups."""
+	frappe.db.add_index("Customer Lookup Key", ["key_type", "normalized_value"], index_name="key_type_value_index")
+	frappe.db.add_index("Customer Lookup Key", ["contact"], index_name="contact_index")
+	frappe.db.add_index("Customer Lookup Key", ["customer"], index_name="customer_index")
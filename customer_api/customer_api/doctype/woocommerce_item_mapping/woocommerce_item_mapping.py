@@ -7,3 +7,17 @@ from frappe.model.document import Document
 class WooCommerceItemMapping(Document):
 	pass
 
+
+def on_doctype_update():
+	"""Index the per-site product and SKU lookups (see customer_api.item_mapping)."""
+	frappe.db.add_index(
+		"WooCommerce Item Mapping",
+		["wordpress_site", "woocommerce_product_id", "enabled"],
+		index_name="site_product_index"
+	)
+	frappe.db.add_index(
+		"WooCommerce Item Mapping",
+		["wordpress_site", "woocommerce_sku", "enabled"],
+		index_name="site_sku_index"
+	)
+
@@ -4,6 +4,8 @@
 import frappe
 from frappe.model.document import Document
 
+from customer_api.cache import clear_site_cache
+
 class WordPressSite(Document):
 	def validate(self):
 		"""Set the webhook URL automatically"""
@@ -12,6 +14,23 @@ class WordPressSite(Document):
 			self.webhook_url = f"{site_url}/api/method/customer_api.api.woocommerce_webhook_listener"
 	
 	def on_update(self):
-		"""Clear password cache when updated"""
-		pass
+		"""
+		Clear cached site settings and password on every save.
+		
+		The webhook secret is masked before on_update, so a rotation to a
+		secret of the same length cannot be detected as a change.
+		"""
+		clear_site_cache()
+	
+	def after_rename(self, old, new, merge=False):
+		"""Clear cached site settings"""
+		clear_site_cache()
+	
+	def on_trash(self):
+		"""Clear cached site settings"""
+		clear_site_cache()
+
 
+def on_doctype_update():
+	"""Index the site URL lookup of webhooks that miss the site cache."""
+	frappe.db.add_index("WordPress Site", ["site_url", "enabled"], index_name="site_url_enabled_index")
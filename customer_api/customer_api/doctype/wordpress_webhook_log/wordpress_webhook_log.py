@@ -1,9 +1,105 @@
 # Copyright (c) 2025, Your Company and contributors
 # For license information, please see license.txt
 
+import base64
+import gzip
+import zlib
+
 import frappe
 from frappe.model.document import Document
+from frappe.utils import cint
+
+# index name -> columns, matching the filters of the queue and listener queries
+LOG_INDEXES = {
+	# claim_pending_logs: status = 'Pending' and wordpress_site in (...) order by creation
+	"status_site_creation_index": ["status", "wordpress_site", "creation"],
+	# release_stale_claims: status = 'Processing' and claimed_at < cutoff
+	"status_claimed_at_index": ["status", "claimed_at"],
+	# List view and reports: status filter, newest first
+	"status_timestamp_index": ["status", "timestamp"],
+	# requeue_due_retries: status = 'Failed' and next_retry_at <= now
+	"status_next_retry_index": ["status", "next_retry_at"]
+}
+
+# Payloads larger than this many bytes are stored zlib-compressed
+# (site config `woocommerce_payload_compress_threshold`)
+PAYLOAD_COMPRESS_THRESHOLD = 2048
+
+# Payloads larger than this many bytes go to a private gzip File
+# (site config `woocommerce_payload_file_threshold`, 0 = never)
+PAYLOAD_FILE_THRESHOLD = 0
 
 class WordPressWebhookLog(Document):
-	pass
+	def onload(self):
+		"""Show the stored payload, whatever its encoding, pretty-printed in Desk"""
+		payload = self.get_payload()
+		if payload is not None:
+			self.webhook_payload = frappe.as_json(payload, indent=2)
+	
+	def after_insert(self):
+		"""Write a payload too large for the row to its private File"""
+		content = self.flags.pop("payload_file_content", None)
+		if content is None:
+			return
+		
+		file_doc = frappe.get_doc({
+			"doctype": "File",
+			"file_name": f"{self.name}-payload.json.gz",
+			"attached_to_doctype": self.doctype,
+			"attached_to_name": self.name,
+			"is_private": 1,
+			"content": gzip.compress(content)
+		})
+		file_doc.insert(ignore_permissions=True)
+		self.db_set("payload_file", file_doc.file_url, update_modified=False)
+	
+	def set_payload(self, payload):
+		"""Store a payload compact, compressed or (after insert) in a File depending on its size"""
+		data = frappe.as_json(payload, indent=None, separators=(",", ":")).encode()
+		file_threshold = cint(frappe.conf.get("woocommerce_payload_file_threshold", PAYLOAD_FILE_THRESHOLD))
+		compress_threshold = cint(frappe.conf.get("woocommerce_payload_compress_threshold", PAYLOAD_COMPRESS_THRESHOLD))
+		
+		self.webhook_payload = None
+		self.compressed_payload = None
+		self.payload_encoding = None
+		
+		if file_threshold and len(data) > file_threshold:
+			self.payload_encoding = "File"
+			self.flags.payload_file_content = data
+		elif len(data) > compress_threshold:
+			self.payload_encoding = "zlib"
+			self.compressed_payload = base64.b64encode(zlib.compress(data)).decode()
+		else:
+			self.webhook_payload = data.decode()
+	
+	def get_payload(self):
+		"""Return the stored payload as a dict"""
+		if self.payload_encoding == "zlib":
+			data = zlib.decompress(base64.b64decode(self.compressed_payload))
+		elif self.payload_encoding == "File":
+			content = frappe.get_doc("File", {"file_url": self.payload_file}).get_content()
+			data = gzip.decompress(content)
+		else:
+			data = self.webhook_payload
+		
+		return frappe.parse_json(frappe.safe_decode(data)) if data else None
+
+
+def on_doctype_update():
+	"""
+	One log per site, order and topic: repeated deliveries are deduplicated
+	against it. The unique key also serves the per-order lookups
+	(get_duplicate_delivery, get_existing_invoice).
+	"""
+	frappe.db.add_unique(
+		"WordPress Webhook Log",
+		["wordpress_site", "woocommerce_order_id", "webhook_topic"],
+		constraint_name="unique_site_order_topic"
+	)
+	add_log_indexes("WordPress Webhook Log")
+
 
+def add_log_indexes(doctype):
+	"""Add the LOG_INDEXES to a log table (also used by the index benchmark)."""
+	for index_name, fields in LOG_INDEXES.items():
+		frappe.db.add_index(doctype, fields, index_name=index_name)
@@ -0,0 +1,35 @@
+// Copyright (c) 2025, Your Company and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings["WordPress Webhook Log"] = {
+	get_indicator(doc) {
+		const colors = {
+			Pending: "orange",
+			Processing: "blue",
+			Success: "green",
+			Failed: "red",
+		};
+		return [__(doc.status), colors[doc.status] || "gray", "status,=," + doc.status];
+	},
+
+	onload(listview) {
+		listview.page.add_actions_menu_item(__("Reprocess"), () => {
+			const log_names = listview.get_checked_items(true);
+
+			frappe.call({
+				method: "customer_api.webhook_queue.reprocess_logs",
+				args: { log_names },
+				freeze: true,
+				callback(r) {
+					if (!r.message) return;
+					frappe.show_alert({
+						message: __("{0} failed logs queued for reprocessing", [r.message.queued]),
+						indicator: "green",
+					});
+					listview.clear_checked_items();
+					listview.refresh();
+				},
+			});
+		});
+	},
+};
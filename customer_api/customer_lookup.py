@@ -0,0 +1,153 @@
+"""
+Lookup of existing customers by email address and phone number.
+
+ERPNext keeps a customer's email addresses and phone numbers on its linked
+Contacts (Contact Email / Contact Phone), which can only be searched with
+joins over unindexed columns. The Customer Lookup Key table holds one row
+per normalized email or phone number and linked customer, maintained by
+Contact and Customer doc_events (see hooks.py) and backfilled by the
+build_customer_lookup_keys patch, so a match is one indexed query.
+"""
+
+import re
+
+import frappe
+
+
+LOOKUP_DOCTYPE = "Customer Lookup Key"
+
+# Phone numbers are matched on their last digits, so local ("077 123 4567")
+# and international ("+94 77 123 4567") forms of a number match
+PHONE_MATCH_DIGITS = 9
+
+# Shorter numbers (extensions, placeholders) are not matched
+PHONE_MIN_DIGITS = 7
+
+
+def normalize_email(email):
+	"""Return an email address stripped and lowercased, or None."""
+	email = (email or "").strip().lower()
+	return email if "@" in email else None
+
+
+def normalize_phone(phone):
+	"""Return the last PHONE_MATCH_DIGITS digits of a phone number, or None if it is too short."""
+	digits = re.sub(r"\D", "", phone or "")
+	return digits[-PHONE_MATCH_DIGITS:] if len(digits) >= PHONE_MIN_DIGITS else None
+
+
+def find_customer(email=None, phone=None):
+	"""Return the customer with this email address (or phone number, without email), or None."""
+	match = find_customer_match(email=email, phone=phone)
+	return match.customer if match else None
+
+
+def find_customer_match(email=None, phone=None):
+	"""
+	Return the customer with this email address or phone number and what matched.
+
+	See find_customer_matches.
+
+	Returns:
+		dict: customer and key_type ("Email" or "Phone"), or None
+	"""
+	return find_customer_matches([(email, phone)])[0]
+
+
+def find_customer_matches(contacts):
+	"""
+	Return the existing customer of each (email, phone) pair, with one query.
+
+	A pair with an email address is matched on the email only: phone
+	numbers are compared on their last digits, and shared or placeholder
+	numbers are common, so a different email means a different customer.
+	The phone number is matched when no email is given. Among several
+	customers the oldest key wins.
+
+	Returns:
+		list: dict with customer and key_type ("Email" or "Phone"), or None, per pair
+	"""
+	keys = [get_match_key(email, phone) for email, phone in contacts]
+	values = {
+		key_type: {key[1] for key in keys if key and key[0] == key_type}
+		for key_type in ("Email", "Phone")
+	}
+	if not any(values.values()):
+		return [None] * len(keys)
+
+	conditions = " or ".join(
+		f"(key_type = '{key_type}' and normalized_value in %({key_type.lower()})s)"
+		for key_type in values if values[key_type]
+	)
+	matches = {}
+	for row in frappe.db.sql(f"""
+		select customer, key_type, normalized_value
+		from `tabCustomer Lookup Key`
+		where {conditions}
+		order by creation asc
+	""", {key_type.lower(): tuple(value) for key_type, value in values.items() if value}, as_dict=True):
+		matches.setdefault((row.key_type, row.normalized_value), frappe._dict(customer=row.customer, key_type=row.key_type))
+
+	return [matches.get(key) if key else None for key in keys]
+
+
+def get_match_key(email=None, phone=None):
+	"""Return the (key type, normalized value) an email address or phone number is matched on, or None."""
+	if normalize_email(email):
+		return ("Email", normalize_email(email))
+	if normalize_phone(phone):
+		return ("Phone", normalize_phone(phone))
+	return None
+
+
+def get_contact_keys(contact):
+	"""Return the (key type, normalized value) pairs of a Contact document."""
+	keys = {("Email", normalize_email(row.email_id)) for row in contact.get("email_ids") or []}
+	keys.add(("Email", normalize_email(contact.get("email_id"))))
+
+	keys.update(("Phone", normalize_phone(row.phone)) for row in contact.get("phone_nos") or [])
+	keys.add(("Phone", normalize_phone(contact.get("mobile_no"))))
+	keys.add(("Phone", normalize_phone(contact.get("phone"))))
+
+	return {(key_type, value) for key_type, value in keys if value}
+
+
+def update_contact_keys(doc, method=None, *args, **kwargs):
+	"""doc_events handler for Contact: replace the contact's keys with its current emails and phones."""
+	delete_keys({"contact": doc.name})
+	if method == "on_trash":
+		return
+
+	customers = {
+		link.link_name for link in doc.get("links") or []
+		if link.link_doctype == "Customer" and link.link_name
+	}
+	insert_keys([
+		(key_type, value, customer, doc.name)
+		for key_type, value in get_contact_keys(doc)
+		for customer in customers
+	])
+
+
+def delete_customer_keys(doc, method=None, *args, **kwargs):
+	"""doc_events handler for Customer: drop the keys of a deleted customer."""
+	delete_keys({"customer": doc.name})
+
+
+def delete_keys(filters):
+	"""Delete lookup keys."""
+	frappe.db.delete(LOOKUP_DOCTYPE, filters)
+
+
+def insert_keys(rows):
+	"""Insert (key type, normalized value, customer, contact) rows in one statement."""
+	if not rows:
+		return
+
+	now = frappe.utils.now()
+	user = frappe.session.user
+	frappe.db.bulk_insert(
+		LOOKUP_DOCTYPE,
+		["name", "creation", "modified", "owner", "modified_by", "key_type", "normalized_value", "customer", "contact"],
+		[(frappe.generate_hash(length=12), now, now, user, user, *row) for row in rows]
+	)
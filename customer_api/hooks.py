@@ -85,7 +85,7 @@ required_apps = ["frappe", "erpnext"]
 # ------------
 
 # before_install = "customer_api.install.before_install"
-# after_install = "customer_api.install.after_install"
+after_install = "customer_api.install.after_install"
 
 # Uninstallation
 # ------------
@@ -139,34 +139,62 @@ required_apps = ["frappe", "erpnext"]
 # ---------------
 # Hook on document methods and events
 
-# doc_events = {
-# 	"*": {
-# 		"on_update": "method",
-# 		"on_cancel": "method",
-# 		"on_trash": "method"
-# 	}
-# }
+doc_events = {
+	"Customer": {
+		"after_insert": "customer_api.cache.clear_customer_cache",
+		"on_update": "customer_api.cache.clear_customer_cache",
+		"after_rename": "customer_api.cache.clear_customer_cache",
+		"on_trash": [
+			"customer_api.cache.clear_customer_cache",
+			"customer_api.customer_lookup.delete_customer_keys"
+		]
+	},
+	"Contact": {
+		"after_insert": "customer_api.cache.clear_contact_cache",
+		"on_update": [
+			"customer_api.cache.clear_contact_cache",
+			"customer_api.customer_lookup.update_contact_keys"
+		],
+		"after_rename": [
+			"customer_api.cache.clear_contact_cache",
+			"customer_api.customer_lookup.update_contact_keys"
+		],
+		"on_trash": [
+			"customer_api.cache.clear_contact_cache",
+			"customer_api.customer_lookup.update_contact_keys"
+		]
+	},
+	"WooCommerce Item Mapping": {
+		"after_insert": "customer_api.item_mapping.clear_site_item_index",
+		"on_update": "customer_api.item_mapping.clear_site_item_index",
+		"after_rename": "customer_api.item_mapping.clear_site_item_index",
+		"on_trash": "customer_api.item_mapping.clear_site_item_index"
+	},
+	"Item": {
+		"after_insert": "customer_api.item_mapping.clear_item_from_indexes",
+		"on_update": "customer_api.item_mapping.clear_item_from_indexes",
+		"after_rename": "customer_api.item_mapping.clear_item_from_indexes",
+		"on_trash": "customer_api.item_mapping.clear_item_from_indexes"
+	}
+}
 
 # Scheduled Tasks
 # ---------------
 
-# scheduler_events = {
-# 	"all": [
-# 		"customer_api.tasks.all"
-# 	],
-# 	"daily": [
-# 		"customer_api.tasks.daily"
-# 	],
-# 	"hourly": [
-# 		"customer_api.tasks.hourly"
-# 	],
-# 	"weekly": [
-# 		"customer_api.tasks.weekly"
-# 	],
-# 	"monthly": [
-# 		"customer_api.tasks.monthly"
-# 	],
-# }
+scheduler_events = {
+	"cron": {
+		"* * * * *": [
+			"customer_api.webhook_queue.schedule_drain",
+			"customer_api.stats.flush_site_stats"
+		],
+		"*/5 * * * *": [
+			"customer_api.order_sync.schedule_order_sync"
+		]
+	},
+	"daily_long": [
+		"customer_api.retention.prune_webhook_logs"
+	]
+}
 
 # Testing
 # -------
@@ -194,12 +222,12 @@ required_apps = ["frappe", "erpnext"]
 # Ignore links to specified DocTypes when deleting documents
 # -----------------------------------------------------------
 
-# ignore_links_on_delete = ["Communication", "ToDo"]
+ignore_links_on_delete = ["Customer Lookup Key"]
 
 # Request Events
 # ----------------
-# before_request = ["customer_api.utils.before_request"]
-# after_request = ["customer_api.utils.after_request"]
+before_request = ["customer_api.monitoring.before_request"]
+after_request = ["customer_api.monitoring.after_request"]
 
 # Job Events
 # ----------
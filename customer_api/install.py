@@ -0,0 +1,11 @@
+def after_install():
+	"""Apply the index and lookup patches, which are only marked as done on a fresh install."""
+	from customer_api.patches.v1_0 import (
+		add_customer_lookup_indexes,
+		add_webhook_lookup_indexes,
+		build_customer_lookup_keys
+	)
+
+	add_customer_lookup_indexes.execute()
+	add_webhook_lookup_indexes.execute()
+	build_customer_lookup_keys.execute()
@@ -0,0 +1,228 @@
+"""
+Per-site index of WooCommerce products to ERPNext items.
+
+Each WordPress Site has a Redis hash holding:
+
+- p:<product id>  -> item from WooCommerce Item Mapping (loaded in full when
+  the index is built)
+- c:<sku>         -> item whose item code is the SKU
+- n:<text>        -> item whose item name is the SKU or product name
+
+c: and n: entries are filled lazily; an empty value caches a miss. All
+line items of an order are mapped with one HMGET and, for keys not cached
+yet, one set-based query on Item. Mapping and Item doc_events (see
+hooks.py) drop the affected entries. While Redis is unavailable, items are
+mapped with the same queries, uncached.
+"""
+
+import frappe
+from redis.exceptions import RedisError
+
+from customer_api.monitoring import add_increment
+
+
+ITEM_INDEX_KEY = "customer_api:item_index"
+ITEM_INDEX_TTL = 24 * 60 * 60
+
+# Marks an index whose p: entries are loaded
+INDEX_BUILT = "__built__"
+
+
+def map_order_items(line_items, wp_site):
+	"""
+	Map all line items of a WooCommerce order in one pass.
+
+	Returns:
+		list: ERPNext item code per line item, None where no item matched
+	"""
+	candidates = [_candidate_fields(wc_item, wp_site.item_mapping_method) for wc_item in line_items]
+	fields = list(dict.fromkeys(field for item_fields in candidates for field in item_fields))
+
+	try:
+		values = get_index_values(wp_site.name, fields)
+	except RedisError:
+		values = query_index_values(wp_site.name, fields)
+
+	item_codes = [
+		next((values[field] for field in item_fields if values.get(field)), None)
+		for item_fields in candidates
+	]
+	count_lookups(wp_site.name, len(item_codes), item_codes.count(None))
+
+	return item_codes
+
+
+def get_index_values(wp_site_name, fields):
+	"""Read index fields of a site, building the index and resolving uncached fields as needed."""
+	cache = frappe.cache()
+	key = cache.make_key(f"{ITEM_INDEX_KEY}:{wp_site_name}")
+
+	fields = [INDEX_BUILT] + fields
+	values = {
+		field: frappe.safe_decode(value) if value is not None else None
+		for field, value in zip(fields, cache.hmget(key, fields))
+	}
+
+	if values[INDEX_BUILT] is None:
+		mappings = build_site_index(key, wp_site_name)
+		for field in fields:
+			if field.startswith("p:"):
+				values[field] = mappings.get(field, "")
+
+	missing = [field for field in fields if values[field] is None and not field.startswith("p:")]
+	if missing:
+		values.update(_resolve_missing(key, missing))
+
+	return values
+
+
+def query_index_values(wp_site_name, fields):
+	"""Resolve index fields of a site from the database only (Redis unavailable)."""
+	product_ids = [field[2:] for field in fields if field.startswith("p:")]
+	values = {f"p:{product_id}": "" for product_id in product_ids}
+	if product_ids:
+		for row in frappe.get_all(
+			"WooCommerce Item Mapping",
+			filters={"wordpress_site": wp_site_name, "enabled": 1, "woocommerce_product_id": ["in", product_ids]},
+			fields=["woocommerce_product_id", "erp_item_code"]
+		):
+			values[f"p:{_normalize(row.woocommerce_product_id)}"] = row.erp_item_code
+
+	values.update(_query_items([field for field in fields if not field.startswith("p:")]))
+	return values
+
+
+def count_lookups(wp_site_name, lookups, misses):
+	"""Add to the item mapping lookup and miss counters of the metrics endpoint."""
+	try:
+		pipe = frappe.cache().pipeline()
+		add_increment(pipe, "customer_api_item_mapping_lookups_total", {"site": wp_site_name}, lookups)
+		# Also when 0, so the miss rate of a site without misses exists
+		add_increment(pipe, "customer_api_item_mapping_misses_total", {"site": wp_site_name}, misses)
+		pipe.execute()
+	except RedisError:
+		pass
+
+
+def _normalize(value):
+	"""Normalize a SKU or name for keys (case-insensitive, like the database collation)."""
+	return str(value).strip().lower()
+
+
+def _candidate_fields(wc_item, mapping_method):
+	"""Index fields to try for a line item, in the priority order of the mapping method."""
+	mapping_method = mapping_method or "SKU"
+	product_id = wc_item.get("product_id")
+	sku = wc_item.get("sku")
+	name = wc_item.get("name")
+	fields = []
+
+	# Method 1: Custom Mapping
+	if mapping_method == "Custom Mapping" and product_id:
+		fields.append(f"p:{_normalize(product_id)}")
+
+	# Method 2: SKU (as item code, then as item name)
+	if mapping_method in ["SKU", "Custom Mapping"] and sku:
+		fields += [f"c:{_normalize(sku)}", f"n:{_normalize(sku)}"]
+
+	# Method 3: Product Name
+	if mapping_method in ["Product Name", "Custom Mapping"] and name:
+		fields.append(f"n:{_normalize(name)}")
+
+	return fields
+
+
+def build_site_index(key, wp_site_name):
+	"""(Re)build a site's index with all its enabled WooCommerce Item Mappings."""
+	mappings = frappe.get_all(
+		"WooCommerce Item Mapping",
+		filters={"wordpress_site": wp_site_name, "enabled": 1},
+		fields=["woocommerce_product_id", "erp_item_code"]
+	)
+	values = {f"p:{_normalize(row.woocommerce_product_id)}": row.erp_item_code for row in mappings}
+
+	pipe = frappe.cache().pipeline()
+	pipe.delete(key)
+	pipe.hset(key, mapping=dict(values, **{INDEX_BUILT: "1"}))
+	pipe.expire(key, ITEM_INDEX_TTL)
+	pipe.execute()
+
+	return values
+
+
+def _resolve_missing(key, fields):
+	"""Resolve c: and n: fields with one query on Item and cache the answers (misses as "")."""
+	resolved = _query_items(fields)
+
+	pipe = frappe.cache().pipeline()
+	pipe.hset(key, mapping=resolved)
+	pipe.execute()
+
+	return resolved
+
+
+def _query_items(fields):
+	"""Resolve c: and n: fields with one query on Item ("" for a miss)."""
+	if not fields:
+		return {}
+
+	codes = tuple(field[2:] for field in fields if field.startswith("c:")) or ("",)
+	names = tuple(field[2:] for field in fields if field.startswith("n:")) or ("",)
+
+	rows = frappe.db.sql("""
+		select 'c', name, name from `tabItem` where name in %(codes)s
+		union all
+		select 'n', item_name, name from `tabItem` where item_name in %(names)s
+	""", {"codes": codes, "names": names})
+
+	resolved = dict.fromkeys(fields, "")
+	for kind, value, item_code in rows:
+		field = f"{kind}:{_normalize(value)}"
+		if field in resolved and not resolved[field]:
+			resolved[field] = item_code
+
+	return resolved
+
+
+def clear_site_item_index(doc, method=None, *args, **kwargs):
+	"""doc_events handler for WooCommerce Item Mapping: drop the index of the mapping's site(s)."""
+	sites = {doc.wordpress_site}
+	before = doc.get_doc_before_save() if method == "on_update" else None
+	if before:
+		sites.add(before.wordpress_site)
+
+	cache = frappe.cache()
+	pipe = cache.pipeline()
+	for site in filter(None, sites):
+		pipe.delete(cache.make_key(f"{ITEM_INDEX_KEY}:{site}"))
+	pipe.execute()
+
+
+def clear_item_from_indexes(doc, method=None, *args, **kwargs):
+	"""
+	doc_events handler for Item: drop the code and name entries of the item from every site's index.
+
+	Saves that keep the item name are skipped: the index only maps item codes
+	and names, which an update cannot otherwise change (codes change by rename).
+	"""
+	from customer_api.cache import get_site_map
+
+	codes = {doc.name}
+	names = {doc.item_name}
+
+	before = doc.get_doc_before_save() if method == "on_update" else None
+	if before:
+		if before.item_name == doc.item_name:
+			return
+		names.add(before.item_name)
+	if method == "after_rename" and args:
+		codes.add(args[0])
+
+	fields = [f"c:{_normalize(code)}" for code in codes if code]
+	fields += [f"n:{_normalize(name)}" for name in names if name]
+
+	cache = frappe.cache()
+	pipe = cache.pipeline()
+	for site in get_site_map()["sites"]:
+		pipe.hdel(cache.make_key(f"{ITEM_INDEX_KEY}:{site}"), *fields)
+	pipe.execute()
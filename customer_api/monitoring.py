@@ -0,0 +1,367 @@
+"""
+Timing and query-count instrumentation of the Customer API.
+
+A trace is opened for every HTTP call of a customer_api method (see the
+before_request/after_request hooks) and for every order processed outside
+a request (background job, batch drain, pull sync, import). Code marks its
+stages with
+
+	with stage("customer"):
+		...
+
+which records the wall time and the number of SQL statements run through
+frappe.db.sql during the stage. Stages may nest; each is reported with its
+own totals.
+
+When a trace finishes, its observations are added to Redis histograms with
+one pipeline. For a sample of orders (site config
+`customer_api_trace_sample_rate`, default 0.05), and for every order slower
+than `customer_api_slow_trace_ms` (default 2000), the breakdown is stored on
+the WordPress Webhook Log.
+
+Pipeline health is kept in Redis as well: monotonic per-site counters
+(webhook events, item mapping lookups and misses), gauges written by
+scheduled jobs (queue depth, sync lag) and per-site latency histograms.
+render_metrics (served by customer_api.metrics) reads them all with one
+pipeline and never queries the database, so it can be scraped often.
+"""
+
+import json
+import random
+import re
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import flt, now
+from redis.exceptions import RedisError
+
+
+METRICS_KEY_PREFIX = "customer_api:metrics"
+
+TRACE_SAMPLE_RATE = 0.05
+SLOW_TRACE_MS = 2000
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+WAIT_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 900, 1800, 3600, 6 * 3600, 24 * 3600)
+
+# name -> help
+COUNTERS = {
+	"customer_api_webhook_events_total": "Orders received, succeeded, failed, deduplicated, rate limited and shed per site",
+	"customer_api_item_mapping_lookups_total": "WooCommerce line items mapped per site",
+	"customer_api_item_mapping_misses_total": "WooCommerce line items without an ERPNext item per site"
+}
+
+# name -> help
+GAUGES = {
+	"customer_api_webhook_queue_depth": "Webhook logs waiting (Pending) or being processed (Processing) per site",
+	"customer_api_webhook_queue_depth_updated": "Unix time of the last queue depth snapshot",
+	"customer_api_order_sync_lag_seconds": "Age of the order sync cursor at the end of the last sync run per site",
+	"customer_api_order_sync_last_run": "Unix time of the last order sync run per site"
+}
+
+# name -> (help, buckets)
+HISTOGRAMS = {
+	"customer_api_trace_duration_seconds": ("Wall time of API calls and processed orders", DURATION_BUCKETS),
+	"customer_api_trace_queries": ("SQL statements per API call or processed order", QUERY_BUCKETS),
+	"customer_api_stage_duration_seconds": ("Wall time of order processing stages", DURATION_BUCKETS),
+	"customer_api_stage_queries": ("SQL statements per order processing stage", QUERY_BUCKETS),
+	"customer_api_order_processing_seconds": ("Time to process an order per site", DURATION_BUCKETS),
+	"customer_api_order_queue_wait_seconds": ("Time from receiving an order to processing it per site", WAIT_BUCKETS)
+}
+
+# Paths of traced HTTP calls
+METHOD_PATH = re.compile(r"^/api/(?:v\d+/)?method/(customer_api\.[\w.]+)")
+
+# Not traced: scraping the metrics must not change them
+UNTRACED_METHODS = {"customer_api.metrics"}
+
+
+class Trace:
+	"""Timings and statement counts of one API call or processed order."""
+
+	def __init__(self, name):
+		self.name = name
+		self.started = time.perf_counter()
+		self.queries = 0
+		self.stages = []
+		self.log_name = None
+
+	def get_breakdown(self, elapsed):
+		"""The trace as stored on a WordPress Webhook Log."""
+		return {
+			"trace": self.name,
+			"recorded_at": now(),
+			"total_ms": round(elapsed * 1000, 2),
+			"queries": self.queries,
+			"stages": [
+				{"stage": name, "ms": round(seconds * 1000, 2), "queries": queries}
+				for name, seconds, queries in self.stages
+			]
+		}
+
+
+def get_trace():
+	"""Return the trace of the current request or job, or None."""
+	return getattr(frappe.local, "customer_api_trace", None)
+
+
+def start_trace(name):
+	"""
+	Open a trace unless one is already open.
+
+	Returns:
+		Trace: the new trace, to be passed to finish_trace, or None if the
+		current request or job is already traced
+	"""
+	if get_trace():
+		return None
+
+	_install_query_counter()
+	trace = frappe.local.customer_api_trace = Trace(name)
+	return trace
+
+
+def finish_trace(trace):
+	"""Close a trace opened by start_trace: record its histograms and store a sampled breakdown."""
+	if not trace:
+		return
+
+	frappe.local.customer_api_trace = None
+	elapsed = time.perf_counter() - trace.started
+
+	record_histograms(trace, elapsed)
+	if trace.log_name and is_sampled(elapsed):
+		save_breakdown(trace, elapsed)
+
+
+@contextmanager
+def stage(name):
+	"""Time a stage of the current trace and count its SQL statements."""
+	trace = get_trace()
+	if not trace:
+		yield
+		return
+
+	started, queries = time.perf_counter(), trace.queries
+	try:
+		yield
+	finally:
+		trace.stages.append((name, time.perf_counter() - started, trace.queries - queries))
+
+
+def set_trace_log(log_name):
+	"""Attach the WordPress Webhook Log of the order being processed to the current trace."""
+	trace = get_trace()
+	if trace:
+		trace.log_name = log_name
+
+
+def _install_query_counter():
+	"""Count the statements of this connection on the current trace (once per connection)."""
+	db = frappe.db
+	if not db or getattr(db.sql, "customer_api_counter", False):
+		return
+
+	sql = db.sql
+
+	def counting_sql(*args, **kwargs):
+		trace = get_trace()
+		if trace:
+			trace.queries += 1
+		return sql(*args, **kwargs)
+
+	counting_sql.customer_api_counter = True
+	db.sql = counting_sql
+
+
+def is_sampled(elapsed):
+	"""Whether the breakdown of a trace is stored: slow ones always, others at the sample rate."""
+	slow_ms = flt(frappe.conf.get("customer_api_slow_trace_ms") or SLOW_TRACE_MS)
+	sample_rate = frappe.conf.get("customer_api_trace_sample_rate")
+	sample_rate = TRACE_SAMPLE_RATE if sample_rate is None else flt(sample_rate)
+
+	return elapsed * 1000 >= slow_ms or random.random() < sample_rate
+
+
+def save_breakdown(trace, elapsed):
+	"""Store the breakdown on the trace's log (committed with the caller's transaction when deferred)."""
+	try:
+		frappe.db.set_value(
+			"WordPress Webhook Log",
+			trace.log_name,
+			"performance_breakdown",
+			json.dumps(trace.get_breakdown(elapsed), indent=1),
+			update_modified=False
+		)
+		if not frappe.flags.customer_api_defer_commit:
+			frappe.db.commit()
+	except Exception:
+		frappe.log_error(frappe.get_traceback(), "Customer API Trace Error")
+
+
+def record_histograms(trace, elapsed):
+	"""Add a finished trace and its stages to the Redis histograms (one pipeline)."""
+	observations = [
+		("customer_api_trace_duration_seconds", {"trace": trace.name}, elapsed),
+		("customer_api_trace_queries", {"trace": trace.name}, trace.queries)
+	]
+	for name, seconds, queries in trace.stages:
+		observations.append(("customer_api_stage_duration_seconds", {"stage": name}, seconds))
+		observations.append(("customer_api_stage_queries", {"stage": name}, queries))
+
+	observe_many(observations)
+
+
+def observe_many(observations):
+	"""Add (histogram, labels, value) observations to their Redis histograms."""
+	try:
+		cache = frappe.cache()
+		pipe = cache.pipeline()
+		for metric, labels, value in observations:
+			add_observation(pipe, metric, labels, value)
+		pipe.execute()
+
+	except RedisError:
+		pass
+
+
+def observe(metric, value, **labels):
+	"""Add one observation to a histogram."""
+	observe_many([(metric, labels, value)])
+
+
+def add_observation(pipe, metric, labels, value):
+	"""Queue the writes of a histogram observation on a Redis pipeline."""
+	key = frappe.cache().make_key(f"{METRICS_KEY_PREFIX}:{metric}")
+	label_text = format_labels(labels)
+	buckets = HISTOGRAMS[metric][1]
+
+	bucket = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+	pipe.hincrby(key, f"{label_text}|{bucket}", 1)
+	pipe.hincrby(key, f"{label_text}|count", 1)
+	pipe.hincrbyfloat(key, f"{label_text}|sum", value)
+
+
+def increment(metric, value=1, **labels):
+	"""Add to a monotonic counter."""
+	try:
+		cache = frappe.cache()
+		pipe = cache.pipeline()
+		add_increment(pipe, metric, labels, value)
+		pipe.execute()
+	except RedisError:
+		pass
+
+
+def add_increment(pipe, metric, labels, value=1):
+	"""Queue a counter increment on a Redis pipeline (for callers batching their Redis writes)."""
+	if metric not in COUNTERS:
+		raise KeyError(metric)
+	pipe.hincrby(frappe.cache().make_key(f"{METRICS_KEY_PREFIX}:{metric}"), format_labels(labels), int(value))
+
+
+def set_gauge(metric, values, replace=False):
+	"""
+	Set a gauge for several label sets.
+
+	Args:
+		metric (str): Gauge name
+		values (list): (labels dict, value) pairs
+		replace (bool): Drop label sets not in `values`
+	"""
+	try:
+		cache = frappe.cache()
+		key = cache.make_key(f"{METRICS_KEY_PREFIX}:{metric}")
+		pipe = cache.pipeline()
+		if replace:
+			pipe.delete(key)
+		if values:
+			pipe.hset(key, mapping={format_labels(labels): value for labels, value in values})
+		pipe.execute()
+	except RedisError:
+		pass
+
+
+def format_labels(labels):
+	"""Prometheus label text of a dict: key="value",..."""
+	return ",".join(
+		'{0}="{1}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+		for key, value in sorted(labels.items())
+	)
+
+
+def render_metrics():
+	"""All Customer API metrics in Prometheus text exposition format (one Redis round trip)."""
+	cache = frappe.cache()
+	pipe = cache.pipeline()
+	for metric in (*COUNTERS, *GAUGES, *HISTOGRAMS):
+		pipe.hgetall(cache.make_key(f"{METRICS_KEY_PREFIX}:{metric}"))
+	values = iter(pipe.execute())
+
+	lines = []
+	for metric_type, metrics in (("counter", COUNTERS), ("gauge", GAUGES)):
+		for metric, help_text in metrics.items():
+			lines += render_series(metric, help_text, metric_type, next(values))
+	for metric, (help_text, buckets) in HISTOGRAMS.items():
+		lines += render_histogram(metric, help_text, buckets, next(values))
+
+	return "\n".join(lines) + "\n"
+
+
+def render_series(metric, help_text, metric_type, values):
+	"""Prometheus text of a counter or gauge stored as {label text: value}."""
+	lines = [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+	for label_text, value in sorted((frappe.safe_decode(k), frappe.safe_decode(v)) for k, v in values.items()):
+		value = flt(value)
+		lines.append(f"{metric}{format_labels(label_text)} {int(value) if value.is_integer() else value}")
+
+	return lines
+
+
+def render_histogram(metric, help_text, buckets, values):
+	"""Prometheus text of a histogram stored as {label text|bucket, sum or count: value}."""
+	lines = [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+
+	series = {}
+	for field, value in values.items():
+		label_text, _sep, suffix = frappe.safe_decode(field).rpartition("|")
+		series.setdefault(label_text, {})[suffix] = frappe.safe_decode(value)
+
+	for label_text, fields in sorted(series.items()):
+		separator = "," if label_text else ""
+		cumulative = 0
+		for i, bound in enumerate(buckets):
+			cumulative += int(fields.get(str(i), 0))
+			lines.append(f'{metric}_bucket{{{label_text}{separator}le="{bound}"}} {cumulative}')
+		lines.append(f'{metric}_bucket{{{label_text}{separator}le="+Inf"}} {int(fields.get("count", 0))}')
+		lines.append(f"{metric}_sum{format_labels(label_text)} {flt(fields.get('sum'))}")
+		lines.append(f"{metric}_count{format_labels(label_text)} {int(fields.get('count', 0))}")
+
+	return lines
+
+
+def format_labels(label_text):
+	"""Wrap label text in braces; unlabeled series have none (`name value`)."""
+	return f"{{{label_text}}}" if label_text else ""
+
+
+def reset_metrics():
+	"""Delete all stored metrics (counters restart from zero, which Prometheus treats as a reset)."""
+	cache = frappe.cache()
+	for metric in (*COUNTERS, *GAUGES, *HISTOGRAMS):
+		cache.delete(cache.make_key(f"{METRICS_KEY_PREFIX}:{metric}"))
+
+
+def before_request():
+	"""Request hook: open a trace for calls of customer_api methods."""
+	match = METHOD_PATH.match(frappe.request.path or "") if getattr(frappe.local, "request", None) else None
+	if match and match.group(1) not in UNTRACED_METHODS:
+		start_trace(match.group(1))
+
+
+def after_request(response=None, request=None):
+	"""Request hook: finish the request's trace (order traces are always finished by their owner)."""
+	finish_trace(get_trace())
@@ -0,0 +1,345 @@
+"""
+Backfill of historical WooCommerce orders.
+
+An import reads an NDJSON or JSON array file of WooCommerce orders (as
+returned by the WooCommerce REST API) incrementally, never holding more
+than one read chunk and the order being parsed in memory. Orders are
+processed in batches with one commit per batch, through the same
+deduplication, logging and process_woocommerce_order path as webhooks.
+
+The byte offset of the last processed order is committed together with
+each batch (as a global default), so an interrupted import resumes right
+after the last committed batch without creating anything twice.
+"""
+
+import codecs
+import io
+import json
+import os
+import shutil
+
+import frappe
+from frappe import _
+from frappe.utils import cint, now
+
+from customer_api.api import (
+	TransactionLostError,
+	create_webhook_log,
+	get_duplicate_delivery,
+	process_woocommerce_order,
+	rollback_to_savepoint
+)
+from customer_api.cache import get_site_config_by_name
+
+
+# Orders committed together
+IMPORT_BATCH_SIZE = 100
+
+# Bytes read from the file at a time
+IMPORT_READ_SIZE = 64 * 1024
+
+# Largest raw request body accepted (site config
+# `woocommerce_import_max_body_size`); larger files are uploaded as
+# multipart `file` or as a File
+IMPORT_MAX_BODY_SIZE = 50 * 1024 * 1024
+
+# Topic of the logs of imported orders
+IMPORT_TOPIC = "order.imported"
+
+IMPORT_STATE_KEY = "customer_api:woocommerce_order_import"
+IMPORT_FOLDER = "woocommerce_imports"
+
+
+@frappe.whitelist(methods=["POST"])
+def import_woocommerce_orders(wordpress_site=None, file_url=None, import_id=None, batch_size=IMPORT_BATCH_SIZE):
+	"""
+	Import historical WooCommerce orders in the background.
+
+	The orders are sent as an NDJSON or JSON array file: uploaded as the
+	multipart field `file`, as the raw request body (up to
+	IMPORT_MAX_BODY_SIZE), or as the URL of a private File. Pass
+	`import_id` alone to resume an interrupted import.
+
+	Args:
+		wordpress_site (str): WordPress Site the orders belong to
+		file_url (str): URL of an uploaded File with the orders (optional)
+		import_id (str): Import to resume (optional)
+		batch_size (int): Orders committed together (default: 100)
+
+	Returns:
+		dict: Import ID and state; progress via get_order_import_status
+	"""
+	frappe.only_for("System Manager")
+
+	if import_id:
+		state = get_import_state(import_id)
+	else:
+		if not get_site_config_by_name(wordpress_site):
+			frappe.throw(_("WordPress Site {0} not found").format(wordpress_site))
+
+		state = start_import(wordpress_site, save_import_file(file_url), batch_size=batch_size)
+
+	frappe.enqueue(
+		"customer_api.order_import.run_import",
+		queue="long",
+		timeout=24 * 60 * 60,
+		enqueue_after_commit=True,
+		import_id=state.import_id
+	)
+
+	frappe.local.response.http_status_code = 202
+	return {"success": True, "import_id": state.import_id, "state": state}
+
+
+@frappe.whitelist()
+def get_order_import_status(import_id):
+	"""
+	Return the progress of an order import.
+
+	Returns:
+		dict: status, offset and size in bytes, processed/created/duplicate/failed counts
+	"""
+	frappe.only_for("System Manager")
+	return get_import_state(import_id)
+
+
+def save_import_file(file_url=None):
+	"""
+	Copy the orders of the request (upload, body or File) to a private import file, chunk by chunk.
+
+	Uploads and Files are streamed. A raw body has already been read into
+	memory by Frappe's request handling, so it is limited to
+	`woocommerce_import_max_body_size` bytes.
+	"""
+	if file_url:
+		source = open(frappe.get_doc("File", {"file_url": file_url}).get_full_path(), "rb")
+	elif frappe.request.files.get("file"):
+		# Werkzeug spools large uploads to a temporary file
+		source = frappe.request.files["file"].stream
+	else:
+		source = io.BytesIO(get_request_body())
+
+	folder = frappe.get_site_path("private", "files", IMPORT_FOLDER)
+	os.makedirs(folder, exist_ok=True)
+	path = os.path.join(folder, f"{frappe.generate_hash(length=12)}.json")
+
+	with source, open(path, "wb") as target:
+		shutil.copyfileobj(source, target, IMPORT_READ_SIZE)
+
+	if not os.path.getsize(path):
+		os.remove(path)
+		frappe.throw(_("No orders to import"))
+
+	return path
+
+
+def get_request_body():
+	"""Return the raw request body, refusing bodies above the configured size."""
+	max_size = cint(frappe.conf.get("woocommerce_import_max_body_size") or IMPORT_MAX_BODY_SIZE)
+	if (frappe.request.content_length or 0) > max_size:
+		throw_body_too_large(max_size)
+
+	body = frappe.request.get_data(cache=False)
+	if len(body) > max_size:
+		throw_body_too_large(max_size)
+
+	return body
+
+
+def throw_body_too_large(max_size):
+	"""Refuse a raw request body that is too large to import."""
+	frappe.throw(
+		_("Request bodies over {0} MB cannot be imported, upload the orders as the multipart field 'file' or pass a file_url").format(
+			max_size // (1024 * 1024)
+		),
+		frappe.ValidationError
+	)
+
+
+def start_import(wordpress_site, path, batch_size=IMPORT_BATCH_SIZE):
+	"""Register a new import of a file and return its state."""
+	state = frappe._dict(
+		import_id=frappe.generate_hash(length=10),
+		wordpress_site=wordpress_site,
+		path=os.path.abspath(path),
+		size=os.path.getsize(path),
+		batch_size=cint(batch_size) or IMPORT_BATCH_SIZE,
+		offset=0,
+		processed=0,
+		created=0,
+		duplicates=0,
+		failed=0,
+		status="Queued",
+		started=now()
+	)
+	save_import_state(state)
+	frappe.db.commit()
+
+	return state
+
+
+def run_import(import_id, progress=None):
+	"""
+	Process an import from its last committed offset to the end of its file.
+
+	Args:
+		import_id (str): Import to run
+		progress (callable): Called with the state after every batch (optional)
+
+	Returns:
+		dict: Final import state
+	"""
+	state = get_import_state(import_id)
+	wp_site = get_site_config_by_name(state.wordpress_site)
+	if not wp_site:
+		frappe.throw(_("WordPress Site {0} not found").format(state.wordpress_site))
+
+	state.status = "Running"
+	batch = []
+
+	try:
+		for order_data, offset in iter_orders(state.path, state.offset):
+			batch.append(order_data)
+			if len(batch) >= state.batch_size:
+				import_batch(batch, wp_site, state, offset)
+				batch = []
+				publish_progress(state, progress)
+
+		state.status = "Completed"
+		import_batch(batch, wp_site, state, state.size)
+		publish_progress(state, progress)
+
+	except Exception:
+		# Keep the state of the last committed batch to resume from
+		frappe.db.rollback()
+		state = get_import_state(import_id)
+		state.status = "Interrupted"
+		save_import_state(state)
+		frappe.db.commit()
+		frappe.log_error(frappe.get_traceback(), "WooCommerce Order Import Error")
+		raise
+
+	return state
+
+
+def import_batch(orders, wp_site, state, offset):
+	"""
+	Process a batch of orders and commit it together with the new offset.
+
+	A row that is not an order or cannot be logged is counted as failed
+	(and recorded in the Error Log) without stopping the import. If the
+	database rolls back the whole transaction, the import is interrupted
+	and resumes from the last committed batch.
+	"""
+	frappe.flags.customer_api_defer_commit = True
+	try:
+		for order_data in orders:
+			state.processed += 1
+			frappe.db.savepoint("import_order")
+			log_doc = None
+
+			try:
+				if not isinstance(order_data, dict):
+					raise ValueError(f"Not a WooCommerce order: {frappe.as_json(order_data, indent=None)[:140]}")
+
+				# Orders already received by webhook or sync count as duplicates too
+				if get_duplicate_delivery(wp_site.name, order_data.get("id"), IMPORT_TOPIC, any_topic=True):
+					state.duplicates += 1
+					continue
+
+				log_doc = create_webhook_log(wp_site, order_data, topic=IMPORT_TOPIC)
+				process_woocommerce_order(order_data, wp_site, log_doc)
+				state.created += 1
+			except TransactionLostError:
+				raise
+			except Exception as e:
+				# A processed order's writes are rolled back and its log is marked Failed
+				state.failed += 1
+				if not log_doc:
+					if not rollback_to_savepoint("import_order"):
+						raise TransactionLostError(str(e)) from e
+					frappe.clear_messages()
+					frappe.log_error(frappe.get_traceback(), "WooCommerce Order Import Error")
+
+		state.offset = offset
+		save_import_state(state)
+		frappe.db.commit()
+
+	finally:
+		frappe.flags.customer_api_defer_commit = False
+
+
+def iter_orders(path, offset=0):
+	"""
+	Yield (order, end offset) for every order of an NDJSON or JSON array file.
+
+	Parses incrementally from a byte offset that must lie between two
+	orders; separators ("[", ",", "]", whitespace) around orders are skipped,
+	so both formats, and resuming in the middle of an array, work alike.
+
+	A value is only taken once something follows it in the buffer (or at
+	the end of the file): a scalar such as 123 split across two chunks
+	would otherwise decode early as 12.
+	"""
+	decoder = json.JSONDecoder()
+	text_decoder = codecs.getincrementaldecoder("utf-8")()
+	buffer = ""
+
+	with open(path, "rb") as f:
+		f.seek(offset)
+		eof = False
+
+		while True:
+			start = _skip_separators(buffer)
+			offset += len(buffer[:start].encode())
+			buffer = buffer[start:]
+
+			if buffer:
+				try:
+					order_data, end = decoder.raw_decode(buffer)
+				except json.JSONDecodeError:
+					if eof:
+						raise
+				else:
+					if end < len(buffer) or eof:
+						offset += len(buffer[:end].encode())
+						buffer = buffer[end:]
+						yield order_data, offset
+						continue
+
+			if eof:
+				break
+
+			chunk = f.read(IMPORT_READ_SIZE)
+			eof = not chunk
+			buffer += text_decoder.decode(chunk, final=eof)
+
+
+def _skip_separators(buffer):
+	"""Index of the first character of a buffer that is not an array bracket, comma or whitespace."""
+	index = 0
+	while index < len(buffer) and (buffer[index] in "[],\ufeff" or buffer[index].isspace()):
+		index += 1
+	return index
+
+
+def publish_progress(state, progress=None):
+	"""Report the progress of an import to the caller and to Desk."""
+	if progress:
+		progress(state)
+
+	frappe.publish_realtime("woocommerce_order_import_progress", state, user=frappe.session.user)
+
+
+def get_import_state(import_id):
+	"""Return the stored state of an import."""
+	state = frappe.db.get_global(f"{IMPORT_STATE_KEY}:{import_id}")
+	if not state:
+		frappe.throw(_("Order import {0} not found").format(import_id))
+
+	return frappe._dict(json.loads(state))
+
+
+def save_import_state(state):
+	"""Store the state of an import (committed by the caller)."""
+	frappe.db.set_global(f"{IMPORT_STATE_KEY}:{state.import_id}", json.dumps(state))
@@ -0,0 +1,365 @@
+"""
+Pull sync of WooCommerce orders.
+
+Shops whose WP-cron stalls do not send webhooks. For WordPress Sites with
+"Sync Orders" enabled, sync_all_sites pulls the orders modified since the
+site's cursor from the WooCommerce REST API, oldest first, and feeds them
+through receive_woocommerce_order like the webhook listener does. Orders
+that already have a log (from a webhook or an earlier sync) are skipped,
+so overlapping a page or a webhook is harmless.
+
+All sites are synced in one run: REST API pages are fetched on a bounded
+thread pool (HTTP only, no database access), while the orders are
+received on the job's own thread. Pages are keyset-paged: every request
+asks for the orders modified after the last received one, so an order
+modified during the sync moves behind the cursor instead of shifting the
+pages after it. A site therefore has one request in flight at a time;
+requests are handed out round-robin, one per site per pass, within each
+site's requests-per-second limit, so a shop with thousands of pages
+cannot starve the small ones. A run fetches at most
+SYNC_MAX_PAGES_PER_RUN pages per site and the next run continues.
+
+The cursor is advanced and committed after every page, so an interrupted
+sync resumes where it stopped.
+"""
+
+import datetime
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import frappe
+import requests
+from frappe.utils import cint, flt, get_datetime, now
+from frappe.utils.password import get_decrypted_password
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from customer_api.api import receive_woocommerce_order
+from customer_api.cache import get_site_config_by_name
+from customer_api.monitoring import set_gauge
+
+
+# Topic of the logs of pulled orders
+SYNC_TOPIC = "order.synced"
+
+# Orders per REST API page (WooCommerce allows at most 100)
+SYNC_PAGE_SIZE = 100
+
+# How far back the first sync of a site goes
+SYNC_INITIAL_DAYS = 7
+
+# Seconds the cursor is moved back on every request: orders modified in
+# the same second as the last received one (which may have been cut off by
+# the end of its page) are fetched again, and skipped if already known
+SYNC_CURSOR_OVERLAP = 1
+
+SYNC_REQUEST_TIMEOUT = 30
+
+# Pages fetched per site and run
+SYNC_MAX_PAGES_PER_RUN = 50
+
+# HTTP threads shared by all sites (site config `woocommerce_sync_workers`)
+SYNC_WORKERS = 8
+
+SYNC_LOCK_TIMEOUT = 60 * 60
+SYNC_LOCK_KEY = "customer_api:order_sync_lock"
+
+# Connection pool shared by all syncs of the process
+_session = None
+
+
+def get_session():
+	"""Return the pooled HTTP session, retrying idempotent requests on transient errors."""
+	global _session
+	if _session is None:
+		retry = Retry(
+			total=3,
+			backoff_factor=0.5,
+			status_forcelist=(500, 502, 503, 504),
+			allowed_methods=["GET"]
+		)
+		adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+
+		session = requests.Session()
+		session.mount("https://", adapter)
+		session.mount("http://", adapter)
+		_session = session
+
+	return _session
+
+
+def schedule_order_sync():
+	"""Scheduler entry point: run the sync of all sites on the long queue."""
+	if get_sync_sites():
+		frappe.enqueue("customer_api.order_sync.sync_all_sites", queue="long", timeout=SYNC_LOCK_TIMEOUT)
+
+
+def get_sync_sites():
+	"""Return the enabled WordPress Sites with order sync turned on."""
+	return frappe.get_all("WordPress Site", filters={"enabled": 1, "sync_enabled": 1}, pluck="name")
+
+
+def sync_all_sites():
+	"""Sync the orders of every site concurrently."""
+	return run_sync(get_sync_sites())
+
+
+def sync_site_orders(site_name):
+	"""
+	Pull and receive the orders of one site modified since its cursor.
+
+	Returns:
+		dict: received, duplicates and failed counts, or None if the site is
+		already being synced by another job
+	"""
+	return run_sync([site_name]).get(site_name)
+
+
+def run_sync(site_names):
+	"""
+	Sync several sites, fetching their pages concurrently and receiving each site's pages in order.
+
+	Sites already locked by another job are skipped.
+
+	Returns:
+		dict: counts per synced site
+	"""
+	syncs = []
+	for site_name in site_names:
+		if acquire_sync_lock(site_name):
+			try:
+				syncs.append(SiteSync(site_name))
+			except Exception:
+				release_sync_lock(site_name)
+				frappe.log_error(frappe.get_traceback(), "WooCommerce Order Sync Error")
+
+	if not syncs:
+		return {}
+
+	get_session()
+	workers = cint(frappe.conf.get("woocommerce_sync_workers")) or SYNC_WORKERS
+
+	try:
+		with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="woocommerce_sync") as pool:
+			futures = {}
+			turn = 0
+
+			while True:
+				# Round-robin: at most one new request per site per pass
+				submitted = True
+				while submitted and len(futures) < workers:
+					submitted = False
+					for sync in syncs[turn:] + syncs[:turn]:
+						if len(futures) >= workers:
+							break
+						if sync.can_fetch():
+							futures[pool.submit(sync.fetch)] = sync
+							sync.in_flight = True
+							submitted = True
+					turn = (turn + 1) % len(syncs)
+
+				if not futures:
+					break
+
+				done, _pending = wait(futures, return_when=FIRST_COMPLETED)
+				for future in done:
+					sync = futures.pop(future)
+					sync.in_flight = False
+					try:
+						sync.add_page(future.result())
+					except Exception:
+						frappe.db.rollback()
+						sync.failed = True
+						frappe.log_error(frappe.get_traceback(), "WooCommerce Order Sync Error")
+
+	finally:
+		for sync in syncs:
+			sync.finish()
+
+	return {sync.name: sync.counts for sync in syncs}
+
+
+class SiteSync:
+	"""State of one site within a sync run."""
+
+	def __init__(self, site_name):
+		site = frappe.db.get_value(
+			"WordPress Site",
+			site_name,
+			["site_url", "consumer_key", "sync_cursor", "sync_requests_per_second"],
+			as_dict=True
+		)
+
+		self.name = site_name
+		self.wp_site = get_site_config_by_name(site_name)
+		self.store_url = get_store_url(site.site_url)
+		self.auth = (site.consumer_key, get_decrypted_password("WordPress Site", site_name, "consumer_secret"))
+		self.rate_limiter = RateLimiter(flt(site.sync_requests_per_second))
+
+		self.started = datetime.datetime.utcnow().replace(microsecond=0)
+		self.cursor = get_datetime(site.sync_cursor) if site.sync_cursor else \
+			self.started - datetime.timedelta(days=SYNC_INITIAL_DAYS)
+
+		# Page of the current modified_after filter (see add_page)
+		self.page = 1
+		self.pages_fetched = 0
+		self.in_flight = False
+		self.caught_up = False
+		self.failed = False
+		self.counts = frappe._dict(received=0, duplicates=0, failed=0)
+
+	@property
+	def modified_after(self):
+		"""Filter of the next request: the cursor minus the overlap."""
+		return self.cursor - datetime.timedelta(seconds=SYNC_CURSOR_OVERLAP)
+
+	def can_fetch(self):
+		"""Whether the next page may be requested now (it depends on the previous one)."""
+		if self.failed or self.caught_up or self.in_flight:
+			return False
+		return self.pages_fetched < SYNC_MAX_PAGES_PER_RUN
+
+	def fetch(self):
+		"""Fetch the next page (runs on a pool thread: HTTP only)."""
+		self.rate_limiter.wait()
+		return fetch_orders_page(self.store_url, self.auth, self.modified_after, self.page)
+
+	def add_page(self, orders):
+		"""Receive a fetched page and move the filter of the next request past it."""
+		self.pages_fetched += 1
+		previous_cursor = self.cursor
+		self.receive_page(orders)
+
+		if len(orders) < SYNC_PAGE_SIZE:
+			self.caught_up = True
+		elif self.cursor > previous_cursor:
+			self.page = 1
+		else:
+			# A full page of orders modified within the overlap: the cursor
+			# cannot move past them, so page on under the same filter
+			self.page += 1
+
+	def receive_page(self, orders):
+		"""Receive the orders of a page and commit the advanced cursor."""
+		for order_data in orders:
+			self.cursor = max(self.cursor, get_datetime(order_data.get("date_modified_gmt")) or self.cursor)
+			try:
+				result = receive_woocommerce_order(self.wp_site, order_data, SYNC_TOPIC, any_topic=True)
+				self.counts["duplicates" if result.get("duplicate") else "received"] += 1
+			except Exception:
+				# The order's log is marked Failed and retried like a webhook's
+				self.counts.failed += 1
+
+		frappe.db.set_value("WordPress Site", self.name, "sync_cursor", self.cursor, update_modified=False)
+		frappe.db.commit()
+
+	def finish(self):
+		"""Record the lag of the site and release its lock."""
+		caught_up = self.caught_up and not self.failed
+		lag = 0 if caught_up else max(int((self.started - self.cursor).total_seconds()), 0)
+
+		try:
+			frappe.db.set_value(
+				"WordPress Site",
+				self.name,
+				{"last_synced_at": now(), "sync_lag_seconds": lag},
+				update_modified=False
+			)
+			frappe.db.commit()
+			set_gauge("customer_api_order_sync_lag_seconds", [({"site": self.name}, lag)])
+			set_gauge("customer_api_order_sync_last_run", [({"site": self.name}, int(time.time()))])
+		except Exception:
+			frappe.db.rollback()
+			frappe.log_error(frappe.get_traceback(), "WooCommerce Order Sync Error")
+		finally:
+			release_sync_lock(self.name)
+
+
+class RateLimiter:
+	"""Spaces out calls from several threads to at most `rate` per second (0: no limit)."""
+
+	def __init__(self, rate):
+		self.interval = 1 / rate if rate > 0 else 0
+		self.next_slot = 0.0
+		self.lock = threading.Lock()
+
+	def wait(self):
+		"""Block until the caller's slot."""
+		if not self.interval:
+			return
+
+		with self.lock:
+			current = time.monotonic()
+			slot = max(current, self.next_slot)
+			self.next_slot = slot + self.interval
+
+		time.sleep(slot - current)
+
+
+def acquire_sync_lock(site_name):
+	"""Take the Redis lock that keeps two jobs from syncing the same site."""
+	cache = frappe.cache()
+	return cache.set(cache.make_key(f"{SYNC_LOCK_KEY}:{site_name}"), 1, nx=True, ex=SYNC_LOCK_TIMEOUT)
+
+
+def release_sync_lock(site_name):
+	"""Release a site's sync lock."""
+	cache = frappe.cache()
+	cache.delete(cache.make_key(f"{SYNC_LOCK_KEY}:{site_name}"))
+
+
+@frappe.whitelist()
+def get_order_sync_status():
+	"""
+	Return the sync state of every site with order sync enabled.
+
+	Returns:
+		list: site, cursor, last sync, lag in seconds at the end of the last
+		run and seconds since the last sync
+	"""
+	frappe.only_for("System Manager")
+
+	sites = frappe.get_all(
+		"WordPress Site",
+		filters={"sync_enabled": 1},
+		fields=["name", "enabled", "sync_cursor", "last_synced_at", "sync_lag_seconds"]
+	)
+	for site in sites:
+		site.seconds_since_sync = (
+			int((frappe.utils.now_datetime() - get_datetime(site.last_synced_at)).total_seconds())
+			if site.last_synced_at else None
+		)
+
+	return sites
+
+
+def fetch_orders_page(site_url, auth, modified_after, page):
+	"""
+	Fetch one page of orders modified after a GMT datetime, oldest first.
+
+	Returns:
+		list: WooCommerce orders
+	"""
+	response = get_session().get(
+		f"{get_store_url(site_url)}/wp-json/wc/v3/orders",
+		params={
+			"modified_after": modified_after.isoformat(),
+			"dates_are_gmt": "true",
+			"orderby": "modified",
+			"order": "asc",
+			"per_page": SYNC_PAGE_SIZE,
+			"page": page
+		},
+		auth=auth,
+		timeout=SYNC_REQUEST_TIMEOUT
+	)
+	response.raise_for_status()
+
+	return response.json()
+
+
+def get_store_url(site_url):
+	"""Return the base URL of a shop, defaulting to https."""
+	site_url = (site_url or "").strip().rstrip("/")
+	return site_url if "://" in site_url else f"https://{site_url}"
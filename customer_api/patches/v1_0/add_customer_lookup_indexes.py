@@ -0,0 +1,19 @@
+import frappe
+
+
+def execute():
+	"""
+	Index the Customer columns used by the registration checks.
+
+	customer_name is not the primary key, so check_customer_registered
+	scanned the table; the composite index covers its projection so it is
+	answered from the index alone. email_id and mobile_no back the email and
+	mobile lookups of check_customers_registered.
+	"""
+	frappe.db.add_index(
+		"Customer",
+		["customer_name", "customer_group", "territory", "customer_type", "disabled"],
+		index_name="customer_name_registration_index"
+	)
+	frappe.db.add_index("Customer", ["email_id"], index_name="customer_email_id_index")
+	frappe.db.add_index("Customer", ["mobile_no"], index_name="customer_mobile_no_index")
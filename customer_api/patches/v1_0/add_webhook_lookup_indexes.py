@@ -0,0 +1,17 @@
+import frappe
+
+
+def execute():
+	"""
+	Add the composite indexes of WordPress Site, WordPress Webhook Log and
+	WooCommerce Item Mapping.
+
+	The doctypes' on_doctype_update only runs when their JSON changes, so
+	existing sites get the indexes from this patch.
+	"""
+	from customer_api.customer_api.doctype.woocommerce_item_mapping import woocommerce_item_mapping
+	from customer_api.customer_api.doctype.wordpress_site import wordpress_site
+	from customer_api.customer_api.doctype.wordpress_webhook_log import wordpress_webhook_log
+
+	for controller in (wordpress_site, wordpress_webhook_log, woocommerce_item_mapping):
+		controller.on_doctype_update()
@@ -0,0 +1,37 @@
+import frappe
+
+from customer_api.customer_lookup import LOOKUP_DOCTYPE, insert_keys, normalize_email, normalize_phone
+
+
+# Keys inserted per statement
+INSERT_CHUNK_SIZE = 1000
+
+
+def execute():
+	"""
+	Build the Customer Lookup Keys of all existing Contacts linked to a
+	Customer. Afterwards the Contact doc_events keep them current.
+	"""
+	frappe.reload_doc("customer_api", "doctype", "customer_lookup_key")
+	frappe.db.delete(LOOKUP_DOCTYPE)
+
+	keys = set()
+	for key_type, child_table, field, normalize in (
+		("Email", "Contact Email", "email_id", normalize_email),
+		("Phone", "Contact Phone", "phone", normalize_phone)
+	):
+		for value, customer, contact in frappe.db.sql(f"""
+			select child.`{field}`, link.link_name, child.parent
+			from `tab{child_table}` child
+			inner join `tabDynamic Link` link
+				on link.parent = child.parent
+				and link.parenttype = 'Contact'
+				and link.link_doctype = 'Customer'
+			where child.parenttype = 'Contact'
+		"""):
+			if normalize(value):
+				keys.add((key_type, normalize(value), customer, contact))
+
+	keys = sorted(keys)
+	for start in range(0, len(keys), INSERT_CHUNK_SIZE):
+		insert_keys(keys[start:start + INSERT_CHUNK_SIZE])
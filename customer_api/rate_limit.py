@@ -0,0 +1,191 @@
+"""
+Rate limiting and load shedding of the WooCommerce webhook listener.
+
+Every delivery takes a token from a Redis token bucket keyed by WordPress
+Site and client IP, so a misbehaving sender (or one spoofing a shop's
+source URL) only exhausts its own bucket. The bucket is refilled at the
+site's "Rate Limit (Requests/Second)" up to "Rate Limit Burst"; deliveries
+for unknown sources share per-IP buckets with the site config limits
+`woocommerce_rate_limit_per_second` / `woocommerce_rate_limit_burst`.
+Refill and take happen atomically in one Lua script, so concurrent
+workers never oversell a bucket. Rejected deliveries get HTTP 429 with a
+Retry-After header.
+
+WooCommerce does not retry webhook deliveries: a 429 is logged as a failed
+delivery (the order is lost unless the order sync picks it up) and the
+webhook is disabled after 5 failures in a row. The limit of registered
+sites is therefore off by default; it guards against floods, while bursts
+of genuine orders are absorbed by load shedding.
+
+Load shedding: the listener requests in flight are tracked in a Redis
+sorted set (entries expire, so a crashed worker cannot leak them). When
+they reach `woocommerce_shed_threshold` (default: 75% of
+`gunicorn_workers`), or while `woocommerce_load_shedding` is set,
+Synchronous sites are answered with HTTP 202 and their orders processed
+on the background queue, freeing web workers.
+
+Redis errors never reject a delivery: the limiter and the load tracking
+fail open.
+"""
+
+import json
+import math
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint, flt
+from redis.exceptions import RedisError
+from werkzeug.wrappers import Response
+
+
+RATE_LIMIT_KEY = "customer_api:webhook_rate_limit"
+IN_FLIGHT_KEY = "customer_api:webhook_in_flight"
+
+# Limits of deliveries whose source is not a registered site
+DEFAULT_RATE_PER_SECOND = 5
+DEFAULT_BURST = 10
+
+# Share of the web workers busy with the listener at which load is shed
+SHED_UTILIZATION = 0.75
+
+# In-flight entries older than this are dropped (crashed or hung workers)
+IN_FLIGHT_TTL = 120
+
+# KEYS[1]: bucket; ARGV: refill rate per second, capacity, now (seconds)
+# Returns {allowed (0/1), seconds until a token is available}
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+	tokens = tokens - 1
+	allowed = 1
+else
+	retry_after = (1 - tokens) / rate
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 1)
+
+return {allowed, tostring(retry_after)}
+"""
+
+# Registered script per process (EVALSHA, falling back to EVAL once)
+_token_bucket = None
+
+
+def check_rate_limit(wp_site, client_ip):
+	"""
+	Take a token for a delivery from the bucket of its site and client IP.
+
+	Args:
+		wp_site (dict): Cached WordPress Site settings, or None for an unknown source
+		client_ip (str): Address of the sender
+
+	Returns:
+		float: Seconds to wait before retrying if the delivery is over the
+		limit, otherwise None
+	"""
+	if wp_site:
+		rate, burst = flt(wp_site.rate_limit_per_second), cint(wp_site.rate_limit_burst)
+		key = f"{RATE_LIMIT_KEY}:{wp_site.name}:{client_ip}"
+	else:
+		rate = flt(frappe.conf.get("woocommerce_rate_limit_per_second") or DEFAULT_RATE_PER_SECOND)
+		burst = cint(frappe.conf.get("woocommerce_rate_limit_burst") or DEFAULT_BURST)
+		key = f"{RATE_LIMIT_KEY}:unknown:{client_ip}"
+
+	if rate <= 0:
+		return None
+
+	try:
+		allowed, retry_after = take_token(key, rate, max(burst, 1))
+	except RedisError:
+		return None
+
+	return None if allowed else retry_after
+
+
+def take_token(key, rate, capacity):
+	"""Run the token bucket script; returns (allowed, seconds until the next token)."""
+	global _token_bucket
+	cache = frappe.cache()
+	if _token_bucket is None:
+		_token_bucket = cache.register_script(TOKEN_BUCKET_SCRIPT)
+
+	allowed, retry_after = _token_bucket(keys=[cache.make_key(key)], args=[rate, capacity, time.time()], client=cache)
+	return bool(int(allowed)), float(retry_after)
+
+
+def too_many_requests(retry_after):
+	"""HTTP 429 response with Retry-After (whole seconds, at least 1)."""
+	retry_after = max(math.ceil(retry_after), 1)
+	return Response(
+		json.dumps({"message": {"success": False, "message": "Rate limit exceeded", "retry_after": retry_after}}),
+		status=429,
+		content_type="application/json",
+		headers={"Retry-After": str(retry_after)}
+	)
+
+
+def get_shed_threshold():
+	"""Listener requests in flight at which load is shed (0: never)."""
+	threshold = cint(frappe.conf.get("woocommerce_shed_threshold"))
+	if threshold:
+		return threshold
+
+	workers = cint(frappe.conf.get("gunicorn_workers"))
+	return max(int(workers * SHED_UTILIZATION), 1) if workers else 0
+
+
+@contextmanager
+def track_listener_load():
+	"""
+	Count the current request as in flight for its duration.
+
+	Yields:
+		bool: whether load should be shed (processing deferred to the queue)
+	"""
+	request_id = frappe.generate_hash(length=12)
+	shed = bool(cint(frappe.conf.get("woocommerce_load_shedding")))
+	cache = frappe.cache()
+	key = cache.make_key(IN_FLIGHT_KEY)
+	tracked = False
+
+	try:
+		now = time.time()
+		pipe = cache.pipeline()
+		pipe.zremrangebyscore(key, "-inf", now - IN_FLIGHT_TTL)
+		pipe.zadd(key, {request_id: now})
+		pipe.zcard(key)
+		pipe.expire(key, IN_FLIGHT_TTL)
+		in_flight = pipe.execute()[2]
+		tracked = True
+
+		threshold = get_shed_threshold()
+		shed = shed or bool(threshold and in_flight > threshold)
+	except RedisError:
+		pass
+
+	try:
+		yield shed
+	finally:
+		if tracked:
+			try:
+				cache.zrem(key, request_id)
+			except RedisError:
+				pass
+
+
+def get_client_ip():
+	"""Address of the sender (behind the proxy headers Frappe trusts)."""
+	return getattr(frappe.local, "request_ip", None) or frappe.request.remote_addr or "unknown"
@@ -0,0 +1,169 @@
+"""
+Retention of WordPress Webhook Logs.
+
+prune_webhook_logs (scheduled daily) prunes the Success and Failed logs
+older than the retention days of their WordPress Site. Logs are pruned in
+chunks of LOG_PRUNE_CHUNK_SIZE with a commit after each chunk, so the job
+never holds long locks on the table the webhook listener writes to.
+Pending and Processing logs are never pruned.
+
+Success logs are the record of the invoice created for an order, which
+deduplication (get_duplicate_delivery, get_existing_invoice) and the order
+sync rely on; they are kept as tombstones: only the payload, its File and
+the performance breakdown are dropped and the log is marked Payload
+Pruned. Failed logs are deleted.
+
+When the site archives pruned logs, every chunk is first appended to a
+gzip-compressed NDJSON file (one log per line, payload decoded) under
+private/files/webhook_log_archive/<site>/.
+"""
+
+import gzip
+import os
+
+import frappe
+from frappe.utils import add_days, cint, now_datetime
+
+
+LOG_PRUNE_CHUNK_SIZE = 1000
+
+# Archive files are kept per site
+ARCHIVE_FOLDER = "webhook_log_archive"
+
+# status -> WordPress Site retention field
+RETENTION_FIELDS = {
+	"Success": "success_log_retention_days",
+	"Failed": "failed_log_retention_days"
+}
+
+
+def prune_webhook_logs():
+	"""Scheduler job: prune the expired logs of every WordPress Site."""
+	sites = frappe.get_all(
+		"WordPress Site",
+		fields=["name", "archive_pruned_logs", *RETENTION_FIELDS.values()]
+	)
+
+	for site in sites:
+		for status, field in RETENTION_FIELDS.items():
+			days = cint(site.get(field))
+			if days <= 0:
+				continue
+
+			try:
+				prune_site_logs(site.name, status, days, archive=cint(site.archive_pruned_logs))
+			except Exception:
+				frappe.db.rollback()
+				frappe.log_error(frappe.get_traceback(), "WordPress Webhook Log Retention Error")
+
+
+def prune_site_logs(wp_site_name, status, days, archive=True, chunk_size=LOG_PRUNE_CHUNK_SIZE):
+	"""
+	Prune (and optionally archive) a site's logs of a status older than `days`.
+
+	Success logs are kept without their payload, Failed logs are deleted.
+
+	Returns:
+		dict: pruned count and archive file path (None if not archived)
+	"""
+	cutoff = add_days(now_datetime(), -cint(days))
+	archive_path = get_archive_path(wp_site_name, status) if archive else None
+	filters = {"status": status, "wordpress_site": wp_site_name, "creation": ["<", cutoff]}
+	if status == "Success":
+		filters["payload_pruned"] = 0
+	pruned = 0
+
+	while True:
+		logs = frappe.get_all(
+			"WordPress Webhook Log",
+			filters=filters,
+			fields=["*"] if archive else ["name", "payload_encoding"],
+			order_by="creation asc",
+			limit=chunk_size
+		)
+		if not logs:
+			break
+
+		if archive_path:
+			append_to_archive(archive_path, logs)
+
+		if status == "Success":
+			clear_payloads(logs)
+		else:
+			delete_logs(logs)
+		frappe.db.commit()
+		pruned += len(logs)
+
+	return {"pruned": pruned, "archive": archive_path if pruned else None}
+
+
+def get_archive_path(wp_site_name, status):
+	"""Return the archive file for one pruning run of a site and status."""
+	folder = frappe.get_site_path("private", "files", ARCHIVE_FOLDER, frappe.scrub(wp_site_name))
+	os.makedirs(folder, exist_ok=True)
+
+	return os.path.join(folder, f"{status.lower()}-{now_datetime().strftime('%Y%m%d-%H%M%S')}.ndjson.gz")
+
+
+def append_to_archive(archive_path, logs):
+	"""Append logs as NDJSON lines (a new gzip member per chunk, read back as one stream)."""
+	with gzip.open(archive_path, "ab") as archive:
+		for log in logs:
+			row = {
+				field: value for field, value in log.items()
+				if field not in ("payload_encoding", "compressed_payload", "payload_file")
+			}
+			row["webhook_payload"] = get_archived_payload(log)
+
+			archive.write(frappe.as_json(row, indent=None, separators=(",", ":")).encode() + b"\n")
+
+
+def get_archived_payload(log):
+	"""Return the payload of a log, or None if its payload File is gone."""
+	try:
+		return frappe.get_doc(dict(log, doctype="WordPress Webhook Log")).get_payload()
+	except (frappe.DoesNotExistError, OSError):
+		frappe.clear_messages()
+		return None
+
+
+def clear_payloads(logs):
+	"""Keep a chunk of logs as tombstones: drop their payloads and payload Files."""
+	log_names = [log.name for log in logs]
+
+	delete_payload_files(logs)
+	frappe.db.set_value(
+		"WordPress Webhook Log",
+		{"name": ["in", log_names]},
+		{
+			"webhook_payload": None,
+			"compressed_payload": None,
+			"payload_file": None,
+			"payload_encoding": None,
+			"performance_breakdown": None,
+			"payload_pruned": 1
+		},
+		update_modified=False
+	)
+
+
+def delete_logs(logs):
+	"""Delete a chunk of logs and the payload Files of those stored in one."""
+	delete_payload_files(logs)
+	frappe.db.delete("WordPress Webhook Log", {"name": ["in", [log.name for log in logs]]})
+
+
+def delete_payload_files(logs):
+	"""Delete the payload Files of the logs stored in one (a File already gone is skipped)."""
+	if not any(log.payload_encoding == "File" for log in logs):
+		return
+
+	for file_name in frappe.get_all(
+		"File",
+		filters={"attached_to_doctype": "WordPress Webhook Log", "attached_to_name": ["in", [log.name for log in logs]]},
+		pluck="name"
+	):
+		try:
+			frappe.delete_doc("File", file_name, ignore_permissions=True, force=True)
+		except (frappe.DoesNotExistError, OSError):
+			frappe.clear_messages()
@@ -0,0 +1,128 @@
+"""
+Buffered WordPress Site statistics.
+
+Webhook counters are incremented atomically in Redis and written to the
+WordPress Site row by flush_site_stats (scheduled every minute) with one
+relative UPDATE per site, so concurrent webhooks of the same shop never
+load, save or lock the site document. The same pipeline increments the
+monotonic event counters of the metrics endpoint (customer_api.monitoring),
+which are never reset by the flush.
+"""
+
+import frappe
+from frappe.utils import now
+from redis.exceptions import RedisError
+
+from customer_api.monitoring import add_increment
+
+
+# stat type -> WordPress Site counter field
+STAT_FIELDS = {
+	"received": "total_webhooks_received",
+	"success": "successful_invoices",
+	"failed": "failed_webhooks"
+}
+
+# stat type -> `event` label of customer_api_webhook_events_total
+STAT_EVENTS = {
+	"received": "received",
+	"success": "succeeded",
+	"failed": "failed"
+}
+
+STATS_KEY_PREFIX = "customer_api:site_stats"
+STATS_SITES_KEY = "customer_api:site_stats_sites"
+
+
+def increment_site_stat(wp_site_name, stat_type):
+	"""Count a webhook event for a site in Redis, or directly in the database if Redis is down."""
+	field = STAT_FIELDS[stat_type]
+	last_received = now() if stat_type == "received" else None
+
+	try:
+		cache = frappe.cache()
+		key = cache.make_key(f"{STATS_KEY_PREFIX}:{wp_site_name}")
+
+		pipe = cache.pipeline()
+		pipe.hincrby(key, field, 1)
+		if last_received:
+			pipe.hset(key, "last_webhook_received", last_received)
+		pipe.sadd(cache.make_key(STATS_SITES_KEY), wp_site_name)
+		add_increment(pipe, "customer_api_webhook_events_total", {"site": wp_site_name, "event": STAT_EVENTS[stat_type]})
+		pipe.execute()
+
+	except RedisError:
+		write_site_stats(wp_site_name, {field: 1}, last_received)
+
+
+def flush_site_stats():
+	"""Scheduler job: move buffered counters from Redis to the WordPress Site rows."""
+	cache = frappe.cache()
+	sites_key = cache.make_key(STATS_SITES_KEY)
+
+	# RedisWrapper.smembers prefixes the key itself
+	for wp_site_name in cache.smembers(STATS_SITES_KEY):
+		wp_site_name = frappe.safe_decode(wp_site_name)
+		key = cache.make_key(f"{STATS_KEY_PREFIX}:{wp_site_name}")
+
+		# Read and reset atomically so no increment is counted twice or lost
+		pipe = cache.pipeline()
+		pipe.hgetall(key)
+		pipe.delete(key)
+		pipe.srem(sites_key, wp_site_name)
+		buffered = pipe.execute()[0]
+		if not buffered:
+			continue
+
+		buffered = {frappe.safe_decode(k): frappe.safe_decode(v) for k, v in buffered.items()}
+		last_received = buffered.pop("last_webhook_received", None)
+		counts = {field: int(value) for field, value in buffered.items() if field in STAT_FIELDS.values()}
+
+		try:
+			write_site_stats(wp_site_name, counts, last_received)
+			frappe.db.commit()
+		except Exception:
+			# Put the counts and timestamp back for the next flush
+			frappe.db.rollback()
+			restore_buffered(wp_site_name, counts, last_received)
+			frappe.log_error(frappe.get_traceback(), "WordPress Site Stats Flush Error")
+
+
+def restore_buffered(wp_site_name, counts, last_received=None):
+	"""
+	Add counts back to a site's buffered counters after a failed flush.
+
+	The last received timestamp is only restored if no webhook buffered a
+	newer one in the meantime.
+	"""
+	cache = frappe.cache()
+	key = cache.make_key(f"{STATS_KEY_PREFIX}:{wp_site_name}")
+
+	pipe = cache.pipeline()
+	for field, value in counts.items():
+		pipe.hincrby(key, field, value)
+	if last_received:
+		pipe.hsetnx(key, "last_webhook_received", last_received)
+	pipe.sadd(cache.make_key(STATS_SITES_KEY), wp_site_name)
+	pipe.execute()
+
+
+def write_site_stats(wp_site_name, counts, last_received=None):
+	"""Add counts to a site's counters with a single UPDATE (no document load, `modified` untouched)."""
+	assignments = [f"`{field}` = coalesce(`{field}`, 0) + %({field})s" for field in counts]
+	values = dict(counts, name=wp_site_name)
+
+	if last_received:
+		assignments.append(
+			"`last_webhook_received` = greatest(coalesce(`last_webhook_received`, %(last_received)s), %(last_received)s)"
+		)
+		values["last_received"] = last_received
+
+	if not assignments:
+		return
+
+	frappe.db.sql(f"""
+		update `tabWordPress Site`
+		set {", ".join(assignments)}
+		where name = %(name)s
+	""", values)
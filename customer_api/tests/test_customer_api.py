@@ -6,6 +6,9 @@ This test suite covers all endpoints in the Customer API:
 1. check_customer_registered - Check if customer exists
 2. create_customer - Create new customer with contact and address
 3. create_sales_invoice - Create sales invoice (with/without POS)
+4. create_customers_bulk - Create many customers in one call
+5. create_sales_invoices_bulk - Create many sales invoices in one call
+6. check_customers_registered - Check many customers at once
 
 Test Organization:
 - Each endpoint has its own test class
@@ -81,6 +84,128 @@ class TestCheckCustomerRegistered(unittest.TestCase):
 			check_customer_registered(None)
 		
 		print("✅ Test 3 Passed: Missing customer name validation")
+	
+	def test_04_check_customer_with_fields(self):
+		"""Test 4: Only the requested fields are returned"""
+		from customer_api.api import check_customer_registered, create_customer
+		
+		create_customer(
+			customer_name=self.test_customer_name,
+			customer_type="Company"
+		)
+		
+		result = check_customer_registered(self.test_customer_name, fields=["customer_type"])
+		
+		self.assertTrue(result["is_registered"])
+		self.assertEqual(result["customer_type"], "Company")
+		self.assertNotIn("territory", result)
+		
+		with self.assertRaises(Exception):
+			check_customer_registered(self.test_customer_name, fields=["no_such_field"])
+		
+		print("✅ Test 4 Passed: Customer check with fields")
+	
+	def test_05_cached_miss_invalidated_on_insert(self):
+		"""Test 5: A cached 'not registered' answer is dropped when the customer is created"""
+		from customer_api.api import check_customer_registered, create_customer
+		
+		self.assertFalse(check_customer_registered(self.test_customer_name)["is_registered"])
+		
+		create_customer(customer_name=self.test_customer_name)
+		
+		self.assertTrue(check_customer_registered(self.test_customer_name)["is_registered"])
+		
+		print("✅ Test 5 Passed: Customer cache invalidation")
+
+
+class TestCheckCustomersRegistered(unittest.TestCase):
+	"""
+	Test Suite for check_customers_registered endpoint
+	"""
+	
+	def setUp(self):
+		"""Set up test data"""
+		from customer_api.api import create_customer
+		
+		self.test_customer_name = f"Batch Check Customer {frappe.utils.now()}"
+		create_customer(customer_name=self.test_customer_name, customer_type="Individual")
+	
+	def tearDown(self):
+		"""Clean up test data"""
+		if frappe.db.exists("Customer", self.test_customer_name):
+			frappe.delete_doc("Customer", self.test_customer_name, force=True)
+		
+		frappe.db.commit()
+	
+	def test_01_check_many_names(self):
+		"""Test 1: Registered and unknown names are answered in request order"""
+		from customer_api.api import check_customers_registered
+		
+		results = check_customers_registered([self.test_customer_name, "Non Existent Customer 123456"])
+		
+		self.assertEqual(len(results), 2)
+		self.assertEqual(results[0]["customer_name"], self.test_customer_name)
+		self.assertTrue(results[0]["is_registered"])
+		self.assertIsNotNone(results[0]["customer_id"])
+		self.assertEqual(results[0]["disabled"], 0)
+		self.assertFalse(results[1]["is_registered"])
+		self.assertIsNone(results[1]["customer_id"])
+		
+		print("✅ Test 1 Passed: Batched name check")
+	
+	def test_02_check_unknown_email(self):
+		"""Test 2: Email lookups carry the checked email"""
+		from customer_api.api import check_customers_registered
+		
+		results = check_customers_registered(emails="nobody-123456@example.com")
+		
+		self.assertEqual(results[0]["email"], "nobody-123456@example.com")
+		self.assertFalse(results[0]["is_registered"])
+		
+		print("✅ Test 2 Passed: Batched email check")
+	
+	def test_03_check_without_values(self):
+		"""Test 3: Check without any value (error case)"""
+		from customer_api.api import check_customers_registered
+		
+		with self.assertRaises(Exception):
+			check_customers_registered()
+		
+		print("✅ Test 3 Passed: Missing values validation")
+
+
+class TestCustomerCache(unittest.TestCase):
+	"""
+	Test Suite for the cached customer lookups
+	"""
+	
+	def setUp(self):
+		"""Set up test data"""
+		self.test_customer_name = f"Cache Test Customer {frappe.utils.now()}"
+		self.email = f"cache.{frappe.generate_hash(length=8)}@example.com"
+	
+	def tearDown(self):
+		"""Clean up test data"""
+		for contact in frappe.get_all("Contact Email", filters={"email_id": self.email}, pluck="parent"):
+			frappe.delete_doc("Contact", contact, force=True)
+		if frappe.db.exists("Customer", self.test_customer_name):
+			frappe.delete_doc("Customer", self.test_customer_name, force=True)
+		frappe.db.commit()
+	
+	def test_01_deleted_customer_leaves_email_cache(self):
+		"""Test 1: Deleting a customer drops the cached email lookups of its contacts"""
+		from customer_api.api import create_customer
+		from customer_api.cache import get_customer_by_email
+		
+		result = create_customer(customer_name=self.test_customer_name, email=self.email)
+		self.assertEqual(get_customer_by_email(self.email), result["customer_id"])
+		
+		frappe.delete_doc("Customer", result["customer_id"], force=True)
+		frappe.db.commit()
+		
+		self.assertIsNone(get_customer_by_email(self.email))
+		
+		print("✅ Test 1 Passed: Email cache cleared on customer delete")
 
 
 class TestCreateCustomer(unittest.TestCase):
@@ -258,6 +383,200 @@ class TestCreateCustomer(unittest.TestCase):
 		self.assertEqual(result["customer_type"], "Company")
 		
 		print("✅ Test 6 Passed: Company type customer creation")
+	
+	def test_07_create_customer_with_existing_email(self):
+		"""Test 7: A customer with the same (differently written) email is found, not duplicated"""
+		from customer_api.api import create_customer
+		
+		stamp = frappe.generate_hash(length=8)
+		customer_name = f"Email Customer {stamp}"
+		self.test_customers.append(customer_name)
+		
+		result1 = create_customer(customer_name=customer_name, email=f"lookup.{stamp}@example.com")
+		self.assertTrue(result1["success"])
+		
+		# Without match_existing only the name is checked
+		self.test_customers.append(f"Same Email {stamp}")
+		self.assertTrue(create_customer(customer_name=f"Same Email {stamp}", email=f"lookup.{stamp}@example.com")["success"])
+		
+		result2 = create_customer(
+			customer_name=f"Other Name {stamp}",
+			email=f"  Lookup.{stamp}@Example.COM ",
+			match_existing=True
+		)
+		self.assertFalse(result2["success"])
+		self.assertEqual(result2["customer_id"], result1["customer_id"])
+		self.assertEqual(result2["matched_by"], "Email")
+		self.assertFalse(frappe.db.exists("Customer", {"customer_name": f"Other Name {stamp}"}))
+		
+		print("✅ Test 7 Passed: Duplicate prevention by normalized email")
+	
+	def test_08_create_customer_with_existing_phone(self):
+		"""Test 8: A customer with the same phone number in another format is found"""
+		from customer_api.api import create_customer
+		
+		stamp = frappe.generate_hash(length=8)
+		digits = str(int(stamp, 16))[-7:].rjust(7, "1")
+		customer_name = f"Phone Customer {stamp}"
+		self.test_customers.append(customer_name)
+		
+		result1 = create_customer(customer_name=customer_name, mobile=f"077 {digits}")
+		self.assertTrue(result1["success"])
+		
+		result2 = create_customer(customer_name=f"Other Name {stamp}", mobile=f"+94 (77) {digits}", match_existing=True)
+		self.assertFalse(result2["success"])
+		self.assertEqual(result2["customer_id"], result1["customer_id"])
+		self.assertEqual(result2["matched_by"], "Phone")
+		
+		# A different email wins over a shared phone number
+		self.test_customers.append(f"Shared Phone {stamp}")
+		result3 = create_customer(
+			customer_name=f"Shared Phone {stamp}",
+			email=f"shared.{stamp}@example.com",
+			mobile=f"077 {digits}",
+			match_existing=True
+		)
+		self.assertTrue(result3["success"])
+		self.assertNotEqual(result3["customer_id"], result1["customer_id"])
+		
+		print("✅ Test 8 Passed: Duplicate prevention by normalized phone")
+	
+	def test_09_lookup_keys_follow_contact(self):
+		"""Test 9: Lookup keys are updated with the contact and removed with it"""
+		from customer_api.api import create_customer
+		from customer_api.customer_lookup import find_customer
+		
+		stamp = frappe.generate_hash(length=8)
+		customer_name = f"Lookup Customer {stamp}"
+		self.test_customers.append(customer_name)
+		
+		result = create_customer(customer_name=customer_name, email=f"old.{stamp}@example.com")
+		self.assertEqual(find_customer(email=f"old.{stamp}@example.com"), result["customer_id"])
+		
+		contact = frappe.get_doc("Contact", result["contact_id"])
+		contact.email_ids[0].email_id = f"new.{stamp}@example.com"
+		contact.save(ignore_permissions=True)
+		self.assertIsNone(find_customer(email=f"old.{stamp}@example.com"))
+		self.assertEqual(find_customer(email=f"NEW.{stamp}@example.com"), result["customer_id"])
+		
+		frappe.delete_doc("Contact", contact.name, force=True)
+		self.assertIsNone(find_customer(email=f"new.{stamp}@example.com"))
+		self.assertFalse(frappe.db.exists("Customer Lookup Key", {"contact": contact.name}))
+		
+		print("✅ Test 9 Passed: Lookup keys follow contact changes")
+	
+	def test_10_normalize_lookup_values(self):
+		"""Test 10: Emails and phone numbers are normalized for matching"""
+		from customer_api.customer_lookup import normalize_email, normalize_phone
+		
+		self.assertEqual(normalize_email(" John.Doe@Example.com "), "john.doe@example.com")
+		self.assertIsNone(normalize_email("not an email"))
+		self.assertEqual(normalize_phone("+94 77 123 4567"), normalize_phone("077-123-4567"))
+		self.assertIsNone(normalize_phone("ext. 12"))
+		
+		print("✅ Test 10 Passed: Lookup value normalization")
+
+
+class TestCreateCustomersBulk(unittest.TestCase):
+	"""
+	Test Suite for create_customers_bulk endpoint
+	"""
+	
+	def setUp(self):
+		"""Set up test data"""
+		self.test_customers = []
+	
+	def tearDown(self):
+		"""Clean up test data"""
+		for customer_name in self.test_customers:
+			for parenttype in ("Contact", "Address"):
+				parents = frappe.get_all("Dynamic Link",
+					filters={"link_doctype": "Customer", "link_name": customer_name, "parenttype": parenttype},
+					pluck="parent")
+				for parent in parents:
+					if frappe.db.exists(parenttype, parent):
+						frappe.delete_doc(parenttype, parent, force=True)
+			
+			if frappe.db.exists("Customer", customer_name):
+				frappe.delete_doc("Customer", customer_name, force=True)
+		
+		frappe.db.commit()
+	
+	def test_01_create_multiple_customers(self):
+		"""Test 1: Create several customers in one call"""
+		from customer_api.api import create_customers_bulk
+		
+		names = [f"Bulk Customer {i} {frappe.utils.now()}" for i in range(3)]
+		self.test_customers.extend(names)
+		
+		result = create_customers_bulk([
+			{"customer_name": names[0]},
+			{"customer_name": names[1], "email": "bulk1@example.com"},
+			{"customer_name": names[2], "customer_type": "Company", "city": "Bulk City", "country": "United States"}
+		], chunk_size=2)
+		
+		self.assertTrue(result["success"])
+		self.assertEqual(result["total"], 3)
+		self.assertEqual(result["created"], 3)
+		self.assertEqual([row["row"] for row in result["results"]], [0, 1, 2])
+		self.assertIsNotNone(result["results"][1]["contact_id"])
+		self.assertIsNotNone(result["results"][2]["address_id"])
+		self.assertEqual(result["results"][2]["customer_type"], "Company")
+		
+		print("✅ Test 1 Passed: Bulk customer creation")
+	
+	def test_02_invalid_and_duplicate_rows(self):
+		"""Test 2: Invalid and existing rows are reported per row"""
+		from customer_api.api import create_customer, create_customers_bulk
+		
+		existing_name = f"Bulk Existing {frappe.utils.now()}"
+		new_name = f"Bulk New {frappe.utils.now()}"
+		self.test_customers.extend([existing_name, new_name])
+		create_customer(customer_name=existing_name)
+		
+		result = create_customers_bulk(json.dumps([
+			{"customer_name": existing_name},
+			{"customer_name": ""},
+			{"customer_name": new_name, "customer_type": "Invalid"},
+			{"customer_name": new_name},
+			{"customer_name": new_name}
+		]))
+		
+		self.assertFalse(result["success"])
+		self.assertEqual(result["created"], 1)
+		self.assertEqual(result["failed"], 4)
+		self.assertIn("already exists", result["results"][0]["message"].lower())
+		self.assertIsNotNone(result["results"][0]["customer_id"])
+		self.assertFalse(result["results"][1]["success"])
+		self.assertFalse(result["results"][2]["success"])
+		self.assertTrue(result["results"][3]["success"])
+		self.assertIn("repeated", result["results"][4]["message"].lower())
+		
+		print("✅ Test 2 Passed: Bulk row validation")
+	
+	def test_03_match_existing_email(self):
+		"""Test 3: With match_existing, rows with a known email are reported, like create_customer"""
+		from customer_api.api import create_customer, create_customers_bulk
+		
+		stamp = frappe.generate_hash(length=8)
+		names = [f"Bulk Match {i} {stamp}" for i in range(4)]
+		self.test_customers.extend(names)
+		existing = create_customer(customer_name=names[0], email=f"bulk.match.{stamp}@example.com")
+		
+		result = create_customers_bulk([
+			{"customer_name": names[1], "email": f"Bulk.Match.{stamp}@example.com"},
+			{"customer_name": names[2], "email": f"bulk.new.{stamp}@example.com"},
+			{"customer_name": names[3], "email": f"bulk.new.{stamp}@example.com"}
+		], match_existing=1)
+		
+		self.assertEqual(result["created"], 1)
+		self.assertEqual(result["results"][0]["customer_id"], existing["customer_id"])
+		self.assertEqual(result["results"][0]["matched_by"], "Email")
+		self.assertTrue(result["results"][1]["success"])
+		self.assertEqual(result["results"][2]["customer_id"], result["results"][1]["customer_id"])
+		self.assertEqual(result["results"][2]["matched_by"], "Email")
+		
+		print("✅ Test 3 Passed: Bulk matching by email")
 
 
 class TestCreateSalesInvoice(unittest.TestCase):
@@ -535,6 +854,124 @@ class TestCreateSalesInvoice(unittest.TestCase):
 			pass
 
 
+class TestCreateSalesInvoicesBulk(unittest.TestCase):
+	"""
+	Test Suite for create_sales_invoices_bulk endpoint
+	"""
+	
+	def setUp(self):
+		"""Set up test data"""
+		self.test_invoices = []
+		self.test_customers = []
+		self.test_items = []
+		
+		# Create a test customer
+		self.customer_name = f"Bulk Invoice Test Customer {frappe.utils.now()}"
+		self.test_customers.append(self.customer_name)
+		
+		from customer_api.api import create_customer
+		customer_result = create_customer(customer_name=self.customer_name)
+		self.assertTrue(customer_result["success"])
+		
+		# Create test items
+		self.item1 = self._create_test_item("Bulk Test Item 1")
+		self.item2 = self._create_test_item("Bulk Test Item 2")
+		self.test_items.extend([self.item1, self.item2])
+	
+	def _create_test_item(self, item_name):
+		"""Helper method to create test items"""
+		full_item_name = f"{item_name} {frappe.utils.now()}"
+		
+		frappe.get_doc({
+			"doctype": "Item",
+			"item_code": full_item_name,
+			"item_name": full_item_name,
+			"item_group": "Products",
+			"stock_uom": "Nos",
+			"is_stock_item": 1
+		}).insert(ignore_permissions=True)
+		frappe.db.commit()
+		
+		return full_item_name
+	
+	def tearDown(self):
+		"""Clean up test data"""
+		for invoice_name in self.test_invoices:
+			if frappe.db.exists("Sales Invoice", invoice_name):
+				doc = frappe.get_doc("Sales Invoice", invoice_name)
+				if doc.docstatus == 1:
+					doc.cancel()
+				frappe.delete_doc("Sales Invoice", invoice_name, force=True)
+		
+		for item_name in self.test_items:
+			if frappe.db.exists("Item", item_name):
+				frappe.delete_doc("Item", item_name, force=True)
+		
+		for customer_name in self.test_customers:
+			if frappe.db.exists("Customer", customer_name):
+				frappe.delete_doc("Customer", customer_name, force=True)
+		
+		frappe.db.commit()
+	
+	def test_01_create_multiple_invoices(self):
+		"""Test 1: Create several invoices in one call"""
+		from customer_api.api import create_sales_invoices_bulk
+		
+		result = create_sales_invoices_bulk([
+			{"customer": self.customer_name, "items": [{"item_code": self.item1, "qty": 2, "rate": 100}]},
+			{"customer": self.customer_name, "items": [
+				{"item_code": self.item1, "qty": 1, "rate": 50},
+				{"item_code": self.item2, "qty": 3, "rate": 10}
+			]}
+		])
+		self.test_invoices.extend(row["invoice_id"] for row in result["results"] if row["success"])
+		
+		self.assertTrue(result["success"])
+		self.assertEqual(result["created"], 2)
+		self.assertEqual(result["results"][0]["grand_total"], 200)
+		self.assertEqual(result["results"][1]["grand_total"], 80)
+		self.assertEqual(result["results"][1]["status"], "Draft")
+		
+		print("✅ Test 1 Passed: Bulk invoice creation")
+	
+	def test_02_invalid_invoices_reported_per_row(self):
+		"""Test 2: Unknown customers and items only fail their own invoice"""
+		from customer_api.api import create_sales_invoices_bulk
+		
+		result = create_sales_invoices_bulk([
+			{"customer": "Non Existent Customer 999999", "items": [{"item_code": self.item1, "qty": 1}]},
+			{"customer": self.customer_name, "items": [{"item_code": "Non Existent Item 999999", "qty": 1}]},
+			{"customer": self.customer_name, "items": []},
+			{"customer": self.customer_name, "items": [{"item_code": self.item1, "qty": 1, "rate": 100}]}
+		])
+		self.test_invoices.extend(row["invoice_id"] for row in result["results"] if row["success"])
+		
+		self.assertFalse(result["success"])
+		self.assertEqual(result["created"], 1)
+		self.assertEqual(result["failed"], 3)
+		self.assertIn("does not exist", result["results"][0]["message"])
+		self.assertIn("does not exist", result["results"][1]["message"])
+		self.assertFalse(result["results"][2]["success"])
+		self.assertTrue(result["results"][3]["success"])
+		
+		print("✅ Test 2 Passed: Bulk invoice validation")
+	
+	def test_03_submit_phase(self):
+		"""Test 3: Invoices are submitted in a second phase"""
+		from customer_api.api import create_sales_invoices_bulk
+		
+		result = create_sales_invoices_bulk([
+			{"customer": self.customer_name, "update_stock": 0, "items": [{"item_code": self.item1, "qty": 1, "rate": 100}]}
+		], submit=1)
+		self.test_invoices.extend(row["invoice_id"] for row in result["results"] if row["success"])
+		
+		self.assertTrue(result["success"])
+		self.assertEqual(result["submitted"], 1)
+		self.assertEqual(result["results"][0]["status"], "Submitted")
+		
+		print("✅ Test 3 Passed: Bulk invoice submission")
+
+
 def run_all_tests():
 	"""
 	Run all test suites and print summary
@@ -548,8 +985,46 @@ def run_all_tests():
 	
 	# Add test classes
 	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCheckCustomerRegistered))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCheckCustomersRegistered))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCustomerCache))
 	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCreateCustomer))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCreateCustomersBulk))
 	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCreateSalesInvoice))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCreateSalesInvoicesBulk))
+	
+	from customer_api.tests.test_woocommerce_webhook import (
+		TestBackgroundProcessing,
+		TestItemMappingIndex,
+		TestMonitoring,
+		TestOrderImport,
+		TestSingleTransactionProcessing,
+		TestSiteCache,
+		TestSiteStats,
+		TestWebhookBatchDrain,
+		TestWebhookBody,
+		TestWebhookDeduplication,
+		TestWebhookLogRetention,
+		TestWebhookPayloadStorage,
+		TestWebhookRateLimit,
+		TestWebhookRetry
+	)
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSiteCache))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSiteStats))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestWebhookDeduplication))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestItemMappingIndex))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestWebhookPayloadStorage))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestWebhookLogRetention))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestWebhookRetry))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestBackgroundProcessing))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestWebhookBatchDrain))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSingleTransactionProcessing))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestOrderImport))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMonitoring))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestWebhookBody))
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestWebhookRateLimit))
+	
+	from customer_api.tests.test_order_sync import TestOrderSync
+	suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestOrderSync))
 	
 	# Run tests
 	runner = unittest.TextTestRunner(verbosity=2)
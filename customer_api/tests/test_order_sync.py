@@ -0,0 +1,207 @@
+"""
+Test Suite for the WooCommerce order pull sync
+==============================================
+
+Runs the sync against a fake WooCommerce REST API served from a local
+http.server in a background thread.
+"""
+
+import base64
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import frappe
+
+from customer_api.tests.test_woocommerce_webhook import create_test_wordpress_site, delete_test_wordpress_site
+
+
+class FakeWooCommerce(BaseHTTPRequestHandler):
+	"""Minimal /wp-json/wc/v3/orders: modified_after filter, modified ordering, paging and basic auth."""
+
+	orders = []
+	credentials = ("ck_test", "cs_test")
+	requests = []
+
+	def do_GET(self):
+		url = urlsplit(self.path)
+		params = {key: values[0] for key, values in parse_qs(url.query).items()}
+		type(self).requests.append(params)
+
+		expected = "Basic " + base64.b64encode(":".join(self.credentials).encode()).decode()
+		if not url.path.endswith("/wp-json/wc/v3/orders") or self.headers.get("Authorization") != expected:
+			self.send_response(401)
+			self.end_headers()
+			return
+
+		orders = sorted(
+			(order for order in self.orders if order["date_modified_gmt"] > params.get("modified_after", "")),
+			key=lambda order: order["date_modified_gmt"]
+		)
+		per_page, page = int(params.get("per_page", 10)), int(params.get("page", 1))
+		body = json.dumps(orders[(page - 1) * per_page:page * per_page]).encode()
+
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("X-WP-TotalPages", str(max(-(-len(orders) // per_page), 1)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class TestOrderSync(unittest.TestCase):
+	"""
+	Test Suite for pulling orders from the WooCommerce REST API
+	"""
+
+	@classmethod
+	def setUpClass(cls):
+		"""Start the fake WooCommerce server"""
+		cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeWooCommerce)
+		threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+	@classmethod
+	def tearDownClass(cls):
+		"""Stop the fake WooCommerce server"""
+		cls.server.shutdown()
+		cls.server.server_close()
+
+	def setUp(self):
+		"""Set up test data"""
+		from customer_api import order_sync
+
+		FakeWooCommerce.orders = [
+			{"id": 7000 + i, "date_modified_gmt": f"2026-10-18T08:00:0{i}", "billing": {}, "line_items": []}
+			for i in range(3)
+		]
+		FakeWooCommerce.requests = []
+		self.page_size = order_sync.SYNC_PAGE_SIZE
+		order_sync.SYNC_PAGE_SIZE = 2
+
+		self.wp_site = create_test_wordpress_site(
+			site_url=f"http://127.0.0.1:{self.server.server_port}",
+			processing_mode="Batch Queue",
+			sync_enabled=1,
+			consumer_key=FakeWooCommerce.credentials[0],
+			consumer_secret=FakeWooCommerce.credentials[1],
+			sync_cursor="2026-10-18 07:00:00"
+		)
+
+	def tearDown(self):
+		"""Clean up test data"""
+		from customer_api import order_sync
+
+		order_sync.SYNC_PAGE_SIZE = self.page_size
+		delete_test_wordpress_site(self.wp_site)
+
+	def test_01_sync_pages_and_advances_cursor(self):
+		"""Test 1: All pages are pulled, every order is logged once and the cursor advances"""
+		from customer_api.order_sync import SYNC_TOPIC, sync_site_orders
+
+		counts = sync_site_orders(self.wp_site.name)
+
+		self.assertEqual(counts.received, 3)
+		# Keyset paging: every request starts after the last received order (minus the overlap)
+		self.assertEqual(
+			[(params["modified_after"], params["page"]) for params in FakeWooCommerce.requests],
+			[("2026-10-18T06:59:59", "1"), ("2026-10-18T08:00:00", "1"), ("2026-10-18T08:00:01", "1")]
+		)
+		self.assertEqual(
+			frappe.db.count("WordPress Webhook Log", {"wordpress_site": self.wp_site.name, "webhook_topic": SYNC_TOPIC}),
+			3
+		)
+		self.assertEqual(
+			str(frappe.db.get_value("WordPress Site", self.wp_site.name, "sync_cursor")),
+			"2026-10-18 08:00:02"
+		)
+
+		print("✅ Test 1 Passed: Paged order sync")
+
+	def test_02_resync_skips_known_orders(self):
+		"""Test 2: A second sync only pulls the overlap and skips known orders"""
+		from customer_api.api import create_webhook_log
+		from customer_api.order_sync import sync_site_orders
+
+		# The first order already came in by webhook
+		create_webhook_log(self.wp_site, FakeWooCommerce.orders[0], topic="order.created")
+
+		# The overlap fetches the last order of the first page again
+		counts = sync_site_orders(self.wp_site.name)
+		self.assertEqual((counts.received, counts.duplicates), (2, 2))
+
+		counts = sync_site_orders(self.wp_site.name)
+		self.assertEqual((counts.received, counts.duplicates), (0, 1))
+		self.assertEqual(frappe.db.count("WordPress Webhook Log", {"wordpress_site": self.wp_site.name}), 3)
+
+		print("✅ Test 2 Passed: Resync deduplication")
+
+	def test_03_sync_sites_concurrently(self):
+		"""Test 3: Several sites are synced in one run and their lag is recorded"""
+		from customer_api.order_sync import run_sync
+
+		other_site = create_test_wordpress_site(
+			site_url=f"http://127.0.0.1:{self.server.server_port}/other",
+			processing_mode="Batch Queue",
+			sync_enabled=1,
+			sync_requests_per_second=0,
+			consumer_key=FakeWooCommerce.credentials[0],
+			consumer_secret=FakeWooCommerce.credentials[1],
+			sync_cursor="2026-10-18 07:00:00"
+		)
+		try:
+			counts = run_sync([self.wp_site.name, other_site.name])
+
+			self.assertEqual(counts[self.wp_site.name].received, 3)
+			self.assertEqual(counts[other_site.name].received, 3)
+			self.assertEqual(frappe.db.get_value("WordPress Site", other_site.name, "sync_lag_seconds"), 0)
+		finally:
+			delete_test_wordpress_site(other_site)
+
+		print("✅ Test 3 Passed: Concurrent multi-site sync")
+
+	def test_04_rate_limiter_spaces_requests(self):
+		"""Test 4: The rate limiter spaces out calls from several threads"""
+		import time
+		from concurrent.futures import ThreadPoolExecutor
+		from customer_api.order_sync import RateLimiter
+
+		limiter = RateLimiter(20)
+		started = time.monotonic()
+		with ThreadPoolExecutor(max_workers=4) as pool:
+			list(pool.map(lambda _i: limiter.wait(), range(5)))
+
+		self.assertGreaterEqual(time.monotonic() - started, 4 / 20 - 0.01)
+
+		print("✅ Test 4 Passed: Per-site rate limiting")
+
+	def test_05_order_modified_during_sync_is_not_skipped(self):
+		"""Test 5: An order modified between two pages is pulled after the cursor moves past it"""
+		from customer_api import order_sync
+
+		fetch_orders_page = order_sync.fetch_orders_page
+
+		def fetch_and_modify(*args, **kwargs):
+			orders = fetch_orders_page(*args, **kwargs)
+			if len(FakeWooCommerce.requests) == 1:
+				# The first order of the first page changes while it is received
+				FakeWooCommerce.orders[0] = dict(FakeWooCommerce.orders[0], date_modified_gmt="2026-10-18T08:00:05")
+			return orders
+
+		order_sync.fetch_orders_page = fetch_and_modify
+		try:
+			counts = order_sync.sync_site_orders(self.wp_site.name)
+		finally:
+			order_sync.fetch_orders_page = fetch_orders_page
+
+		self.assertEqual(counts.received, 3)
+		self.assertEqual(frappe.db.count("WordPress Webhook Log", {"wordpress_site": self.wp_site.name}), 3)
+		self.assertEqual(
+			str(frappe.db.get_value("WordPress Site", self.wp_site.name, "sync_cursor")),
+			"2026-10-18 08:00:05"
+		)
+
+		print("✅ Test 5 Passed: Modified order not skipped")
@@ -0,0 +1,1241 @@
+"""
+Test Suite for the WooCommerce webhook pipeline
+===============================================
+
+Covers the helpers behind woocommerce_webhook_listener that do not need an
+HTTP request: webhook logs, duplicate detection, item mapping and order
+processing; body handling is tested with werkzeug requests.
+"""
+
+import json
+
+import frappe
+import unittest
+
+
+def create_test_wordpress_site(**kwargs):
+	"""Helper to create an enabled WordPress Site for tests"""
+	site_name = f"Test Shop {frappe.generate_hash(length=8)}"
+	site = frappe.get_doc({
+		"doctype": "WordPress Site",
+		"site_name": site_name,
+		"site_url": f"https://{site_name.lower().replace(' ', '-')}.example.com",
+		"enabled": 1,
+		**kwargs
+	})
+	site.insert(ignore_permissions=True)
+	frappe.db.commit()
+	return site
+
+
+def delete_test_wordpress_site(site):
+	"""Helper to delete a test WordPress Site and its logs"""
+	frappe.db.delete("WordPress Webhook Log", {"wordpress_site": site.name})
+	frappe.delete_doc("WordPress Site", site.name, force=True)
+	frappe.db.commit()
+
+
+class TestSiteCache(unittest.TestCase):
+	"""
+	Test Suite for resolving and caching WordPress Site settings
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.wp_site = create_test_wordpress_site()
+		self.sub_site = create_test_wordpress_site(site_url=f"{self.wp_site.site_url}/de")
+
+	def tearDown(self):
+		"""Clean up test data"""
+		delete_test_wordpress_site(self.sub_site)
+		delete_test_wordpress_site(self.wp_site)
+
+	def test_01_normalize_site_url(self):
+		"""Test 1: Scheme, www, default ports, trailing slashes and case are ignored"""
+		from customer_api.cache import normalize_site_url
+
+		self.assertEqual(normalize_site_url("https://www.Shop.example.com/"), "shop.example.com")
+		self.assertEqual(normalize_site_url("http://shop.example.com:80/store/"), "shop.example.com/store")
+		self.assertEqual(normalize_site_url("https://shop.example.com:8443"), "shop.example.com:8443")
+		self.assertEqual(normalize_site_url("shop.example.com/store"), "shop.example.com/store")
+		self.assertEqual(normalize_site_url(" "), "")
+		self.assertEqual(normalize_site_url(None), "")
+
+		print("✅ Test 1 Passed: Site URL normalization")
+
+	def test_02_longest_registered_url_wins(self):
+		"""Test 2: A shop in a sub-directory is told apart from the shop on the same host"""
+		from customer_api.cache import get_site_config
+
+		host = self.wp_site.site_url.split("://", 1)[1]
+
+		self.assertEqual(get_site_config(f"https://www.{host}/de/").name, self.sub_site.name)
+		self.assertEqual(get_site_config(f"http://{host}/de/shop").name, self.sub_site.name)
+		self.assertEqual(get_site_config(f"https://{host}/fr").name, self.wp_site.name)
+		self.assertEqual(get_site_config(f"https://{host}").name, self.wp_site.name)
+		self.assertIsNone(get_site_config(f"https://de.{host}"))
+		self.assertIsNone(get_site_config(""))
+
+		print("✅ Test 2 Passed: Longest prefix match")
+
+	def test_03_save_invalidates_cache(self):
+		"""Test 3: Saving a site refreshes its cached settings"""
+		from customer_api.cache import get_site_config, get_site_config_by_name
+
+		self.assertEqual(get_site_config_by_name(self.wp_site.name).max_retry_attempts, self.wp_site.max_retry_attempts)
+
+		self.wp_site.reload()
+		self.wp_site.max_retry_attempts = 7
+		self.wp_site.enabled = 0
+		self.wp_site.save(ignore_permissions=True)
+		frappe.db.commit()
+
+		self.assertEqual(get_site_config_by_name(self.wp_site.name).max_retry_attempts, 7)
+		self.assertIsNone(get_site_config(self.wp_site.site_url))
+
+		print("✅ Test 3 Passed: Cache invalidated on save")
+
+	def test_04_rename_invalidates_cache(self):
+		"""Test 4: A renamed site is cached under its new name only"""
+		from customer_api.cache import get_site_config, get_site_config_by_name
+
+		old_name = self.sub_site.name
+		self.assertIsNotNone(get_site_config_by_name(old_name))
+
+		new_name = frappe.rename_doc("WordPress Site", old_name, f"{old_name} Renamed", force=True)
+		frappe.db.commit()
+		self.sub_site = frappe.get_doc("WordPress Site", new_name)
+
+		self.assertIsNone(get_site_config_by_name(old_name))
+		self.assertEqual(get_site_config_by_name(new_name).name, new_name)
+		self.assertEqual(get_site_config(self.sub_site.site_url).name, new_name)
+
+		print("✅ Test 4 Passed: Cache invalidated on rename")
+
+
+class TestSiteStats(unittest.TestCase):
+	"""
+	Test Suite for the buffered WordPress Site statistics
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.wp_site = create_test_wordpress_site()
+
+	def tearDown(self):
+		"""Clean up test data"""
+		from customer_api.stats import STATS_KEY_PREFIX
+
+		frappe.cache().delete_value(f"{STATS_KEY_PREFIX}:{self.wp_site.name}")
+		delete_test_wordpress_site(self.wp_site)
+
+	def _buffered(self, *fields):
+		"""Helper to read raw buffered fields of the test site"""
+		from customer_api.stats import STATS_KEY_PREFIX
+
+		cache = frappe.cache()
+		values = cache.hmget(cache.make_key(f"{STATS_KEY_PREFIX}:{self.wp_site.name}"), list(fields))
+		return [frappe.safe_decode(value) if value is not None else None for value in values]
+
+	def _site_stats(self):
+		"""Helper to read the counters stored on the test site"""
+		return frappe.db.get_value(
+			"WordPress Site",
+			self.wp_site.name,
+			["total_webhooks_received", "successful_invoices", "failed_webhooks", "last_webhook_received"],
+			as_dict=True
+		)
+
+	def test_01_flush_writes_counters(self):
+		"""Test 1: Buffered counters are added to the site row and cleared from Redis"""
+		from customer_api.stats import flush_site_stats, increment_site_stat
+
+		increment_site_stat(self.wp_site.name, "received")
+		increment_site_stat(self.wp_site.name, "received")
+		increment_site_stat(self.wp_site.name, "success")
+		self.assertEqual(self._buffered("total_webhooks_received", "successful_invoices"), ["2", "1"])
+
+		flush_site_stats()
+
+		stats = self._site_stats()
+		self.assertEqual(stats.total_webhooks_received, 2)
+		self.assertEqual(stats.successful_invoices, 1)
+		self.assertEqual(stats.failed_webhooks, 0)
+		self.assertIsNotNone(stats.last_webhook_received)
+		self.assertEqual(self._buffered("total_webhooks_received", "last_webhook_received"), [None, None])
+
+		print("✅ Test 1 Passed: Buffered stats flushed")
+
+	def test_02_failed_flush_rebuffers(self):
+		"""Test 2: Counters and the last received timestamp of a failed flush are kept for the next one"""
+		from unittest.mock import patch
+
+		from customer_api.stats import flush_site_stats, increment_site_stat
+
+		increment_site_stat(self.wp_site.name, "received")
+		increment_site_stat(self.wp_site.name, "failed")
+		last_received = self._buffered("last_webhook_received")[0]
+
+		with patch("customer_api.stats.write_site_stats", side_effect=Exception("Lock wait timeout exceeded")):
+			flush_site_stats()
+
+		self.assertEqual(
+			self._buffered("total_webhooks_received", "failed_webhooks", "last_webhook_received"),
+			["1", "1", last_received]
+		)
+		self.assertEqual(self._site_stats().total_webhooks_received, 0)
+
+		flush_site_stats()
+
+		stats = self._site_stats()
+		self.assertEqual(stats.total_webhooks_received, 1)
+		self.assertEqual(stats.failed_webhooks, 1)
+		self.assertIsNotNone(stats.last_webhook_received)
+
+		print("✅ Test 2 Passed: Failed flush re-buffered")
+
+	def test_03_restore_keeps_newer_timestamp(self):
+		"""Test 3: Re-buffering does not overwrite a timestamp buffered since the failed flush"""
+		from customer_api.stats import increment_site_stat, restore_buffered
+
+		increment_site_stat(self.wp_site.name, "received")
+		newer = self._buffered("last_webhook_received")[0]
+
+		restore_buffered(self.wp_site.name, {"total_webhooks_received": 3}, "2000-01-01 00:00:00")
+
+		self.assertEqual(self._buffered("total_webhooks_received", "last_webhook_received"), ["4", newer])
+
+		print("✅ Test 3 Passed: Newer timestamp kept")
+
+
+class TestWebhookDeduplication(unittest.TestCase):
+	"""
+	Test Suite for idempotent webhook handling
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.wp_site = create_test_wordpress_site()
+		self.order_data = {"id": 1001, "billing": {"first_name": "Dedupe", "last_name": "Test"}}
+
+	def tearDown(self):
+		"""Clean up test data"""
+		delete_test_wordpress_site(self.wp_site)
+
+	def test_01_new_order_is_not_duplicate(self):
+		"""Test 1: An unknown order is not reported as duplicate"""
+		from customer_api.api import get_duplicate_delivery
+
+		self.assertIsNone(get_duplicate_delivery(self.wp_site.name, 1001, "order.created"))
+
+		print("✅ Test 1 Passed: New order detection")
+
+	def test_02_repeated_topic_is_duplicate(self):
+		"""Test 2: A second delivery of the same topic returns the existing log"""
+		from customer_api.api import create_webhook_log, get_duplicate_delivery
+
+		log = create_webhook_log(self.wp_site, self.order_data, topic="order.created")
+
+		result = get_duplicate_delivery(self.wp_site.name, 1001, "order.created")
+		self.assertTrue(result["duplicate"])
+		self.assertEqual(result["log_id"], log.name)
+
+		# A different topic of an order without invoice is processed normally
+		self.assertIsNone(get_duplicate_delivery(self.wp_site.name, 1001, "order.updated"))
+
+		print("✅ Test 2 Passed: Repeated topic deduplication")
+
+	def test_03_invoiced_order_returns_invoice(self):
+		"""Test 3: Any event of an invoiced order returns the existing invoice"""
+		from customer_api.api import create_webhook_log, get_duplicate_delivery
+
+		log = create_webhook_log(self.wp_site, self.order_data, topic="order.created")
+		log.db_set({"status": "Success", "created_invoice": "ACC-SINV-TEST-0001"})
+
+		result = get_duplicate_delivery(self.wp_site.name, 1001, "order.updated")
+		self.assertTrue(result["success"])
+		self.assertEqual(result["invoice_id"], "ACC-SINV-TEST-0001")
+
+		print("✅ Test 3 Passed: Invoiced order short-circuit")
+
+	def test_04_unique_site_order_topic(self):
+		"""Test 4: The database rejects a second log for the same site, order and topic"""
+		from customer_api.api import create_webhook_log
+
+		create_webhook_log(self.wp_site, self.order_data, topic="order.created")
+
+		with self.assertRaises((frappe.DuplicateEntryError, frappe.UniqueValidationError)):
+			create_webhook_log(self.wp_site, self.order_data, topic="order.created")
+		frappe.db.rollback()
+
+		print("✅ Test 4 Passed: Unique site/order/topic constraint")
+
+	def test_05_topics_of_one_order_are_serialized(self):
+		"""Test 5: order.created and order.updated of one order never both create an invoice"""
+		from unittest.mock import patch
+
+		from customer_api import api
+		from customer_api.cache import get_site_config_by_name
+
+		wp_site = get_site_config_by_name(self.wp_site.name)
+		created = api.create_webhook_log(self.wp_site, self.order_data, topic="order.created")
+		updated = api.create_webhook_log(self.wp_site, self.order_data, topic="order.updated")
+
+		# order.created is in progress on another worker: order.updated waits, then fails for a retry
+		lock = api.lock_order(self.wp_site.name, 1001)
+		try:
+			with patch.object(api, "ORDER_LOCK_WAIT", 0.1), self.assertRaises(frappe.ValidationError):
+				api.process_woocommerce_order(self.order_data, wp_site, updated)
+		finally:
+			api.release_order_lock(lock)
+		self.assertEqual(frappe.db.get_value("WordPress Webhook Log", updated.name, "status"), "Failed")
+
+		# Once order.created is invoiced, order.updated returns its invoice
+		created.db_set({"status": "Success", "created_invoice": "ACC-SINV-TEST-0002"})
+		frappe.db.commit()
+		result = api.process_woocommerce_order(self.order_data, wp_site, updated)
+		self.assertTrue(result["duplicate"])
+		self.assertEqual(result["invoice_id"], "ACC-SINV-TEST-0002")
+
+		print("✅ Test 5 Passed: Per-order serialization")
+
+
+class TestItemMappingIndex(unittest.TestCase):
+	"""
+	Test Suite for the per-site item mapping index
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.wp_site = create_test_wordpress_site(item_mapping_method="Custom Mapping")
+		self.item_code = f"WC Index Item {frappe.generate_hash(length=8)}"
+		frappe.get_doc({
+			"doctype": "Item",
+			"item_code": self.item_code,
+			"item_name": self.item_code,
+			"item_group": "Products",
+			"stock_uom": "Nos"
+		}).insert(ignore_permissions=True)
+		frappe.db.commit()
+
+	def tearDown(self):
+		"""Clean up test data"""
+		frappe.db.delete("WooCommerce Item Mapping", {"wordpress_site": self.wp_site.name})
+		frappe.delete_doc("Item", self.item_code, force=True)
+		delete_test_wordpress_site(self.wp_site)
+
+	def test_01_map_order_items(self):
+		"""Test 1: SKU and product name resolve in one pass, unknown products map to None"""
+		from customer_api.item_mapping import map_order_items
+
+		result = map_order_items([
+			{"product_id": 1, "sku": self.item_code.lower()},
+			{"product_id": 2, "name": self.item_code},
+			{"product_id": 3, "sku": "NO-SUCH-SKU"}
+		], self.wp_site)
+
+		self.assertEqual(result, [self.item_code, self.item_code, None])
+
+		print("✅ Test 1 Passed: Batch item mapping")
+
+	def test_02_mapping_invalidates_index(self):
+		"""Test 2: A new WooCommerce Item Mapping is used after a cached miss"""
+		from customer_api.item_mapping import map_order_items
+
+		line_items = [{"product_id": 42, "sku": "NO-SUCH-SKU"}]
+		self.assertEqual(map_order_items(line_items, self.wp_site), [None])
+
+		frappe.get_doc({
+			"doctype": "WooCommerce Item Mapping",
+			"wordpress_site": self.wp_site.name,
+			"woocommerce_product_id": "42",
+			"erp_item_code": self.item_code,
+			"enabled": 1
+		}).insert(ignore_permissions=True)
+		frappe.db.commit()
+
+		self.assertEqual(map_order_items(line_items, self.wp_site), [self.item_code])
+
+		print("✅ Test 2 Passed: Index invalidation on mapping change")
+
+	def test_03_redis_errors_fall_back_to_queries(self):
+		"""Test 3: Items are mapped from the database while Redis is unavailable"""
+		from unittest.mock import patch
+
+		from redis.exceptions import RedisError
+
+		from customer_api import item_mapping
+
+		frappe.get_doc({
+			"doctype": "WooCommerce Item Mapping",
+			"wordpress_site": self.wp_site.name,
+			"woocommerce_product_id": "43",
+			"erp_item_code": self.item_code,
+			"enabled": 1
+		}).insert(ignore_permissions=True)
+		frappe.db.commit()
+
+		with patch.object(item_mapping, "get_index_values", side_effect=RedisError):
+			result = item_mapping.map_order_items([
+				{"product_id": 43},
+				{"product_id": 44, "sku": self.item_code},
+				{"product_id": 45, "sku": "NO-SUCH-SKU"}
+			], self.wp_site)
+
+		self.assertEqual(result, [self.item_code, self.item_code, None])
+
+		print("✅ Test 3 Passed: Redis fallback")
+
+	def test_04_item_save_keeps_index(self):
+		"""Test 4: Saving an item without renaming it keeps the index entries"""
+		from customer_api.item_mapping import ITEM_INDEX_KEY, map_order_items
+
+		line_items = [{"product_id": 46, "sku": self.item_code}]
+		self.assertEqual(map_order_items(line_items, self.wp_site), [self.item_code])
+
+		cache = frappe.cache()
+		key = cache.make_key(f"{ITEM_INDEX_KEY}:{self.wp_site.name}")
+		field = f"c:{self.item_code.lower()}"
+		item = frappe.get_doc("Item", self.item_code)
+		item.description = "Updated description"
+		item.save(ignore_permissions=True)
+		self.assertEqual(frappe.safe_decode(cache.hmget(key, [field])[0]), self.item_code)
+
+		item.item_name = f"{self.item_code} Renamed"
+		item.save(ignore_permissions=True)
+		self.assertIsNone(cache.hmget(key, [field])[0])
+
+		print("✅ Test 4 Passed: Index kept on unrelated item changes")
+
+
+class TestWebhookPayloadStorage(unittest.TestCase):
+	"""
+	Test Suite for compact and compressed webhook payloads
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.wp_site = create_test_wordpress_site()
+
+	def tearDown(self):
+		"""Clean up test data"""
+		frappe.conf.pop("woocommerce_payload_compress_threshold", None)
+		delete_test_wordpress_site(self.wp_site)
+
+	def test_01_small_payload_is_compact(self):
+		"""Test 1: A small payload is stored as compact JSON"""
+		from customer_api.api import create_webhook_log
+
+		order_data = {"id": 2001, "billing": {"first_name": "Compact"}}
+		log = create_webhook_log(self.wp_site, order_data, topic="order.created")
+
+		stored = frappe.db.get_value("WordPress Webhook Log", log.name, "webhook_payload")
+		self.assertNotIn("\n", stored)
+		self.assertEqual(frappe.get_doc("WordPress Webhook Log", log.name).get_payload(), order_data)
+
+		print("✅ Test 1 Passed: Compact payload storage")
+
+	def test_02_large_payload_is_compressed(self):
+		"""Test 2: A payload above the threshold is compressed and read back transparently"""
+		from customer_api.api import create_webhook_log
+
+		frappe.conf.woocommerce_payload_compress_threshold = 100
+		order_data = {"id": 2002, "line_items": [{"name": f"Product {i}", "quantity": 1} for i in range(50)]}
+		log = create_webhook_log(self.wp_site, order_data, topic="order.created")
+
+		log_doc = frappe.get_doc("WordPress Webhook Log", log.name)
+		self.assertEqual(log_doc.payload_encoding, "zlib")
+		self.assertFalse(log_doc.webhook_payload)
+		self.assertEqual(log_doc.get_payload(), order_data)
+
+		# Desk shows the decompressed payload
+		log_doc.run_method("onload")
+		self.assertEqual(frappe.parse_json(log_doc.webhook_payload), order_data)
+
+		print("✅ Test 2 Passed: Compressed payload storage")
+
+
+class TestWebhookLogRetention(unittest.TestCase):
+	"""
+	Test Suite for pruning and archiving old webhook logs
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.wp_site = create_test_wordpress_site()
+
+	def tearDown(self):
+		"""Clean up test data"""
+		delete_test_wordpress_site(self.wp_site)
+
+	def _create_old_log(self, order_id, status, days_old):
+		"""Helper to create a log backdated by some days"""
+		from customer_api.api import create_webhook_log
+
+		log = create_webhook_log(self.wp_site, {"id": order_id}, topic="order.created")
+		frappe.db.set_value(
+			"WordPress Webhook Log",
+			log.name,
+			{"status": status, "creation": frappe.utils.add_days(frappe.utils.now_datetime(), -days_old)},
+			update_modified=False
+		)
+		frappe.db.commit()
+		return log.name
+
+	def test_01_prune_and_archive_expired_logs(self):
+		"""Test 1: Expired logs are archived and kept without payload, recent and failed ones are untouched"""
+		import gzip
+		from customer_api.api import get_duplicate_delivery
+		from customer_api.retention import prune_site_logs
+
+		expired = self._create_old_log(3001, "Success", 40)
+		recent = self._create_old_log(3002, "Success", 5)
+		failed = self._create_old_log(3003, "Failed", 40)
+		frappe.db.set_value("WordPress Webhook Log", expired, "created_invoice", "ACC-SINV-TEST-0003", update_modified=False)
+		frappe.db.commit()
+
+		result = prune_site_logs(self.wp_site.name, "Success", 30, archive=True, chunk_size=1)
+
+		self.assertEqual(result["pruned"], 1)
+		self.assertTrue(frappe.db.get_value("WordPress Webhook Log", expired, "payload_pruned"))
+		self.assertIsNone(frappe.get_doc("WordPress Webhook Log", expired).get_payload())
+		self.assertFalse(frappe.db.get_value("WordPress Webhook Log", recent, "payload_pruned"))
+		self.assertTrue(frappe.db.exists("WordPress Webhook Log", failed))
+
+		# The pruned log still answers later events of its order
+		self.assertEqual(get_duplicate_delivery(self.wp_site.name, 3001, "order.updated")["invoice_id"], "ACC-SINV-TEST-0003")
+
+		# Tombstones are not pruned again
+		self.assertEqual(prune_site_logs(self.wp_site.name, "Success", 30, archive=False)["pruned"], 0)
+
+		with gzip.open(result["archive"], "rt") as archive:
+			archived = [frappe.parse_json(line) for line in archive]
+		self.assertEqual([log["name"] for log in archived], [expired])
+		self.assertEqual(archived[0]["webhook_payload"], {"id": 3001})
+
+		print("✅ Test 1 Passed: Log pruning and archival")
+
+	def test_02_failed_logs_deleted_with_missing_file(self):
+		"""Test 2: Expired failed logs are deleted, also when their payload File is already gone"""
+		from customer_api.retention import prune_site_logs
+
+		frappe.conf.woocommerce_payload_file_threshold = 1
+		try:
+			failed = self._create_old_log(3004, "Failed", 100)
+		finally:
+			frappe.conf.pop("woocommerce_payload_file_threshold", None)
+
+		self.assertEqual(frappe.db.get_value("WordPress Webhook Log", failed, "payload_encoding"), "File")
+		frappe.db.delete("File", {"attached_to_doctype": "WordPress Webhook Log", "attached_to_name": failed})
+		frappe.db.commit()
+
+		result = prune_site_logs(self.wp_site.name, "Failed", 90, archive=True)
+
+		self.assertEqual(result["pruned"], 1)
+		self.assertFalse(frappe.db.exists("WordPress Webhook Log", failed))
+
+		print("✅ Test 2 Passed: Missing payload File tolerated")
+
+
+class TestWebhookRetry(unittest.TestCase):
+	"""
+	Test Suite for retrying failed webhook logs
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.wp_site = create_test_wordpress_site(max_retry_attempts=3)
+
+	def tearDown(self):
+		"""Clean up test data"""
+		delete_test_wordpress_site(self.wp_site)
+
+	def test_01_backoff_schedule(self):
+		"""Test 1: Retries back off exponentially and stop at max attempts"""
+		from frappe.utils import now_datetime, time_diff_in_seconds
+		from customer_api.api import RETRY_BASE_DELAY, get_next_retry_at
+
+		first = get_next_retry_at(1, 3)
+		second = get_next_retry_at(2, 3)
+
+		self.assertAlmostEqual(time_diff_in_seconds(first, now_datetime()), RETRY_BASE_DELAY, delta=5)
+		self.assertAlmostEqual(time_diff_in_seconds(second, now_datetime()), RETRY_BASE_DELAY * 2, delta=5)
+		self.assertIsNone(get_next_retry_at(3, 3))
+		self.assertIsNone(get_next_retry_at(1, 0))
+
+		print("✅ Test 1 Passed: Retry backoff schedule")
+
+	def test_02_due_retries_are_requeued(self):
+		"""Test 2: Failed logs due for a retry go back to Pending, others stay Failed"""
+		from frappe.utils import add_to_date, now_datetime
+		from customer_api.api import create_webhook_log
+		from customer_api.webhook_queue import requeue_due_retries
+
+		due = create_webhook_log(self.wp_site, {"id": 4001}, topic="order.created")
+		later = create_webhook_log(self.wp_site, {"id": 4002}, topic="order.created")
+		due.db_set({"status": "Failed", "attempts": 1, "next_retry_at": add_to_date(now_datetime(), minutes=-1)})
+		later.db_set({"status": "Failed", "attempts": 1, "next_retry_at": add_to_date(now_datetime(), minutes=10)})
+		frappe.db.commit()
+
+		requeue_due_retries()
+
+		self.assertEqual(frappe.db.get_value("WordPress Webhook Log", due.name, "status"), "Pending")
+		self.assertEqual(frappe.db.get_value("WordPress Webhook Log", later.name, "status"), "Failed")
+
+		print("✅ Test 2 Passed: Due retries requeued")
+
+
+class TestBackgroundProcessing(unittest.TestCase):
+	"""
+	Test Suite for sites that process orders as background jobs
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.secret = frappe.generate_hash(length=20)
+		self.wp_site = create_test_wordpress_site(
+			processing_mode="Background Job", webhook_secret=self.secret, max_retry_attempts=0
+		)
+
+	def tearDown(self):
+		"""Clean up test data"""
+		frappe.local.request = None
+		frappe.local.response = frappe._dict(docs=[])
+		delete_test_wordpress_site(self.wp_site)
+
+	def test_01_listener_queues_order(self):
+		"""Test 1: The listener stores a Pending log, enqueues its job and answers HTTP 202"""
+		import base64
+		import hashlib
+		import hmac
+		from unittest.mock import patch
+
+		from werkzeug.test import EnvironBuilder
+		from werkzeug.wrappers import Request
+
+		from customer_api.api import woocommerce_webhook_listener
+
+		body = json.dumps({"id": 4201, "billing": {}, "line_items": []}).encode()
+		signature = base64.b64encode(hmac.new(self.secret.encode(), body, hashlib.sha256).digest()).decode()
+		frappe.local.request = Request(EnvironBuilder(
+			method="POST",
+			data=body,
+			content_type="application/json",
+			headers={"X-WC-Webhook-Source": self.wp_site.site_url, "X-WC-Webhook-Signature": signature}
+		).get_environ())
+		frappe.local.response = frappe._dict(docs=[])
+
+		with patch.object(frappe, "enqueue") as enqueue:
+			result = woocommerce_webhook_listener()
+
+		self.assertTrue(result["queued"])
+		self.assertEqual(frappe.local.response.http_status_code, 202)
+		self.assertEqual(frappe.db.get_value("WordPress Webhook Log", result["log_id"], "status"), "Pending")
+		enqueue.assert_called_once()
+		self.assertEqual(enqueue.call_args.args[0], "customer_api.api.process_webhook_log")
+		self.assertEqual(enqueue.call_args.kwargs["log_name"], result["log_id"])
+
+		print("✅ Test 1 Passed: Background order queued")
+
+	def test_02_job_processes_claimed_log(self):
+		"""Test 2: The job claims and processes its log; a duplicate job finds it claimed and does nothing"""
+		from customer_api.api import claim_webhook_log, create_webhook_log, process_webhook_log
+
+		log = create_webhook_log(self.wp_site, {"id": 4202, "billing": {}, "line_items": []}, topic="order.created")
+		frappe.db.commit()
+
+		process_webhook_log(log.name)
+
+		processed = frappe.db.get_value(
+			"WordPress Webhook Log", log.name, ["status", "error_message", "attempts", "claimed_at"], as_dict=True
+		)
+		self.assertEqual(processed.status, "Failed")
+		self.assertEqual(processed.error_message, "No items in order")
+		self.assertEqual(processed.attempts, 1)
+		self.assertIsNotNone(processed.claimed_at)
+
+		# A second job for the same log leaves it alone
+		self.assertIsNone(claim_webhook_log(log.name))
+		process_webhook_log(log.name)
+		self.assertEqual(frappe.db.get_value("WordPress Webhook Log", log.name, "attempts"), 1)
+
+		print("✅ Test 2 Passed: Background job claims once")
+
+	def test_03_claim_is_exclusive(self):
+		"""Test 3: Only the first claim of a Pending log moves it to Processing"""
+		from customer_api.api import claim_webhook_log, create_webhook_log
+
+		log = create_webhook_log(self.wp_site, {"id": 4203}, topic="order.created")
+		frappe.db.commit()
+
+		claimed = claim_webhook_log(log.name)
+		self.assertEqual(claimed.name, log.name)
+		self.assertEqual(frappe.db.get_value("WordPress Webhook Log", log.name, "status"), "Processing")
+		self.assertIsNone(claim_webhook_log(log.name))
+
+		print("✅ Test 3 Passed: Exclusive claim")
+
+
+class TestWebhookBatchDrain(unittest.TestCase):
+	"""
+	Test Suite for the batch drainer of pending webhook logs
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.wp_site = create_test_wordpress_site(processing_mode="Batch Queue", max_retry_attempts=3)
+		self.sync_site = create_test_wordpress_site()
+
+	def tearDown(self):
+		"""Clean up test data"""
+		delete_test_wordpress_site(self.wp_site)
+		delete_test_wordpress_site(self.sync_site)
+
+	def test_01_unreadable_log_fails_alone(self):
+		"""Test 1: A log whose payload cannot be loaded fails on its own, the batch is kept"""
+		from customer_api.api import create_webhook_log
+		from customer_api.webhook_queue import claim_pending_logs, process_log_batch
+
+		frappe.conf.woocommerce_payload_file_threshold = 1
+		try:
+			unreadable = create_webhook_log(self.wp_site, {"id": 4101}, topic="order.created")
+		finally:
+			frappe.conf.pop("woocommerce_payload_file_threshold", None)
+		frappe.db.delete("File", {"attached_to_doctype": "WordPress Webhook Log", "attached_to_name": unreadable.name})
+		no_items = create_webhook_log(self.wp_site, {"id": 4102, "billing": {}, "line_items": []}, topic="order.created")
+		frappe.db.commit()
+
+		claimed = claim_pending_logs(batch_size=500)
+		self.assertIn(unreadable.name, claimed)
+		self.assertIn(no_items.name, claimed)
+
+		process_log_batch(claimed)
+
+		for log_name in (unreadable.name, no_items.name):
+			log = frappe.db.get_value("WordPress Webhook Log", log_name, ["status", "attempts", "next_retry_at"], as_dict=True)
+			self.assertEqual(log.status, "Failed")
+			self.assertEqual(log.attempts, 1)
+			self.assertIsNotNone(log.next_retry_at)
+
+		print("✅ Test 1 Passed: Unreadable log isolated")
+
+	def test_02_retried_logs_of_any_site_are_claimed(self):
+		"""Test 2: Retried logs of other sites are claimed, their first deliveries are not"""
+		from customer_api.api import create_webhook_log
+		from customer_api.webhook_queue import claim_pending_logs
+
+		first = create_webhook_log(self.sync_site, {"id": 4111}, topic="order.created")
+		retried = create_webhook_log(self.sync_site, {"id": 4112}, topic="order.created")
+		retried.db_set("attempts", 1)
+		frappe.db.commit()
+
+		claimed = claim_pending_logs(batch_size=500)
+
+		self.assertIn(retried.name, claimed)
+		self.assertNotIn(first.name, claimed)
+		self.assertEqual(frappe.db.get_value("WordPress Webhook Log", retried.name, "status"), "Processing")
+		self.assertEqual(frappe.db.get_value("WordPress Webhook Log", first.name, "status"), "Pending")
+
+		print("✅ Test 2 Passed: Retried logs claimed")
+
+	def test_03_logs_of_unknown_site_fail(self):
+		"""Test 3: Logs of a site missing from the site cache are marked Failed"""
+		from unittest.mock import patch
+
+		from customer_api.api import create_webhook_log
+		from customer_api.webhook_queue import claim_pending_logs, process_log_batch
+
+		log = create_webhook_log(self.wp_site, {"id": 4121}, topic="order.created")
+		frappe.db.commit()
+		claimed = claim_pending_logs(batch_size=500)
+		self.assertIn(log.name, claimed)
+
+		with patch("customer_api.webhook_queue.get_site_config_by_name", return_value=None):
+			process_log_batch(claimed)
+
+		failed = frappe.db.get_value("WordPress Webhook Log", log.name, ["status", "error_message"], as_dict=True)
+		self.assertEqual(failed.status, "Failed")
+		self.assertEqual(failed.error_message, "WordPress site not registered")
+
+		print("✅ Test 3 Passed: Unknown site fails its logs")
+
+	def test_04_batch_failure_requeues_logs(self):
+		"""Test 4: An unexpected batch-level error hands the claimed logs back to Pending"""
+		from unittest.mock import patch
+
+		from customer_api.api import create_webhook_log
+		from customer_api.webhook_queue import claim_pending_logs, process_log_batch
+
+		log = create_webhook_log(self.wp_site, {"id": 4131}, topic="order.created")
+		frappe.db.commit()
+		claimed = claim_pending_logs(batch_size=500)
+
+		with patch("customer_api.webhook_queue.get_site_config_by_name", side_effect=Exception("Cache unavailable")):
+			process_log_batch(claimed)
+
+		requeued = frappe.db.get_value("WordPress Webhook Log", log.name, ["status", "claimed_at", "attempts"], as_dict=True)
+		self.assertEqual(requeued.status, "Pending")
+		self.assertIsNone(requeued.claimed_at)
+		self.assertEqual(requeued.attempts, 0)
+		self.assertFalse(frappe.flags.customer_api_defer_commit)
+
+		print("✅ Test 4 Passed: Batch failure requeued")
+
+	def test_05_lost_transaction_requeues_batch(self):
+		"""Test 5: When the database rolls back the whole transaction, every log of the batch is requeued"""
+		from unittest.mock import patch
+
+		from customer_api.api import create_webhook_log
+		from customer_api.webhook_queue import claim_pending_logs, process_log_batch
+
+		logs = [
+			create_webhook_log(self.wp_site, {"id": 4141 + i, "billing": {}, "line_items": []}, topic="order.created")
+			for i in range(2)
+		]
+		frappe.db.commit()
+		claimed = claim_pending_logs(batch_size=500)
+
+		# A deadlock has rolled back everything, so the savepoint is gone
+		with patch("customer_api.api.rollback_to_savepoint", side_effect=lambda savepoint: frappe.db.rollback() or False):
+			process_log_batch(claimed)
+
+		for log in logs:
+			requeued = frappe.db.get_value("WordPress Webhook Log", log.name, ["status", "attempts"], as_dict=True)
+			self.assertEqual(requeued.status, "Pending")
+			self.assertEqual(requeued.attempts, 0)
+
+		print("✅ Test 5 Passed: Lost transaction requeued")
+
+
+class TestSingleTransactionProcessing(unittest.TestCase):
+	"""
+	Test Suite for processing an order in one transaction
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.wp_site = create_test_wordpress_site(single_transaction=1, max_retry_attempts=0)
+		self.customer_name = f"Single Txn {frappe.generate_hash(length=8)}"
+
+	def tearDown(self):
+		"""Clean up test data"""
+		for customer in frappe.get_all("Customer", filters={"customer_name": self.customer_name}, pluck="name"):
+			frappe.delete_doc("Customer", customer, force=True)
+		delete_test_wordpress_site(self.wp_site)
+
+	def test_01_failed_order_leaves_no_customer(self):
+		"""Test 1: A failing order rolls back its customer and only marks the log Failed"""
+		from customer_api.api import create_webhook_log, process_woocommerce_order
+		from customer_api.cache import get_site_config_by_name
+
+		first_name, last_name = self.customer_name.split(" ", 1)
+		order_data = {"id": 5001, "billing": {"first_name": first_name, "last_name": last_name}, "line_items": []}
+		log = create_webhook_log(self.wp_site, order_data, topic="order.created")
+
+		with self.assertRaises(Exception):
+			process_woocommerce_order(order_data, get_site_config_by_name(self.wp_site.name), log)
+
+		self.assertFalse(frappe.db.exists("Customer", {"customer_name": self.customer_name}))
+		self.assertEqual(frappe.db.get_value("WordPress Webhook Log", log.name, "status"), "Failed")
+		self.assertFalse(frappe.flags.customer_api_defer_commit)
+
+		print("✅ Test 1 Passed: Single-transaction rollback")
+
+	def test_02_default_is_single_transaction(self):
+		"""Test 2: New sites process orders in one transaction"""
+		wp_site = create_test_wordpress_site()
+		try:
+			self.assertEqual(wp_site.single_transaction, 1)
+		finally:
+			delete_test_wordpress_site(wp_site)
+
+		print("✅ Test 2 Passed: Single transaction by default")
+
+	def test_03_lost_transaction_fails_log(self):
+		"""Test 3: An order whose transaction the database rolled back is marked Failed for a retry"""
+		from unittest.mock import patch
+
+		from customer_api.api import TransactionLostError, create_webhook_log, process_woocommerce_order
+		from customer_api.cache import get_site_config_by_name
+
+		order_data = {"id": 5002, "billing": {}, "line_items": []}
+		log = create_webhook_log(self.wp_site, order_data, topic="order.created")
+
+		with patch("customer_api.api.rollback_to_savepoint", side_effect=lambda savepoint: frappe.db.rollback() or False):
+			with self.assertRaises(TransactionLostError):
+				process_woocommerce_order(order_data, get_site_config_by_name(self.wp_site.name), log)
+
+		failed = frappe.db.get_value("WordPress Webhook Log", log.name, ["status", "attempts"], as_dict=True)
+		self.assertEqual(failed.status, "Failed")
+		self.assertEqual(failed.attempts, 1)
+		self.assertFalse(frappe.flags.customer_api_defer_commit)
+
+		print("✅ Test 3 Passed: Lost transaction marks log Failed")
+
+
+class TestOrderImport(unittest.TestCase):
+	"""
+	Test Suite for the streaming WooCommerce order import
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		import tempfile
+
+		self.wp_site = create_test_wordpress_site(max_retry_attempts=0)
+		self.orders = [{"id": 6000 + i, "billing": {"first_name": "Import", "last_name": f"Test {i}"}} for i in range(3)]
+		self.tmp = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+
+	def tearDown(self):
+		"""Clean up test data"""
+		import os
+
+		os.remove(self.tmp.name)
+		delete_test_wordpress_site(self.wp_site)
+
+	def _write(self, content):
+		"""Helper to write the import file"""
+		self.tmp.write(content)
+		self.tmp.close()
+		return self.tmp.name
+
+	def test_01_parse_json_array_and_resume(self):
+		"""Test 1: A JSON array is parsed incrementally and can be resumed from an offset"""
+		from customer_api.order_import import iter_orders
+
+		path = self._write(frappe.as_json(self.orders))
+
+		parsed = list(iter_orders(path))
+		self.assertEqual([order for order, offset in parsed], self.orders)
+		self.assertEqual([order for order, offset in iter_orders(path, parsed[0][1])], self.orders[1:])
+
+		print("✅ Test 1 Passed: Incremental JSON array parsing")
+
+	def test_02_run_ndjson_import(self):
+		"""Test 2: An NDJSON import logs every order once and records its progress"""
+		from customer_api.order_import import get_import_state, run_import, start_import
+
+		# The last line repeats the first order; orders without items fail
+		lines = [frappe.as_json(order, indent=None) for order in self.orders + self.orders[:1]]
+		path = self._write("\n".join(lines) + "\n")
+
+		state = start_import(self.wp_site.name, path, batch_size=2)
+		run_import(state.import_id)
+
+		state = get_import_state(state.import_id)
+		self.assertEqual(state.status, "Completed")
+		self.assertEqual(state.offset, state.size)
+		self.assertEqual((state.processed, state.duplicates, state.failed), (4, 1, 3))
+		self.assertEqual(frappe.db.count("WordPress Webhook Log", {"wordpress_site": self.wp_site.name}), 3)
+
+		print("✅ Test 2 Passed: NDJSON order import")
+
+	def test_03_raw_body_is_saved(self):
+		"""Test 3: A raw request body is written to the import file, up to the size limit"""
+		import os
+
+		from werkzeug.test import EnvironBuilder
+		from werkzeug.wrappers import Request
+
+		from customer_api.order_import import save_import_file
+
+		body = "\n".join(frappe.as_json(order, indent=None) for order in self.orders).encode()
+		frappe.local.request = Request(EnvironBuilder(
+			method="POST", data=body, content_type="application/x-ndjson"
+		).get_environ())
+
+		try:
+			path = save_import_file()
+			with open(path, "rb") as f:
+				self.assertEqual(f.read(), body)
+			os.remove(path)
+
+			frappe.conf.woocommerce_import_max_body_size = len(body) - 1
+			with self.assertRaises(frappe.ValidationError):
+				save_import_file()
+		finally:
+			frappe.conf.pop("woocommerce_import_max_body_size", None)
+			frappe.local.request = None
+
+		print("✅ Test 3 Passed: Raw body import file")
+
+	def test_04_bad_rows_do_not_stop_import(self):
+		"""Test 4: Rows that are not orders are counted as failed and the import completes"""
+		from customer_api.order_import import get_import_state, run_import, start_import
+
+		lines = ["42", "\"not an order\"", frappe.as_json(self.orders[0], indent=None)]
+		path = self._write("\n".join(lines) + "\n")
+
+		state = start_import(self.wp_site.name, path, batch_size=10)
+		run_import(state.import_id)
+
+		state = get_import_state(state.import_id)
+		self.assertEqual(state.status, "Completed")
+		self.assertEqual(state.offset, state.size)
+		self.assertEqual((state.processed, state.failed), (3, 3))
+		self.assertEqual(frappe.db.count("WordPress Webhook Log", {"wordpress_site": self.wp_site.name}), 1)
+
+		print("✅ Test 4 Passed: Bad rows skipped")
+
+	def test_05_values_split_across_chunks(self):
+		"""Test 5: A value cut off at a read chunk boundary is only decoded once complete"""
+		from unittest.mock import patch
+
+		from customer_api.order_import import iter_orders
+
+		path = self._write("123\n4567\n89")
+
+		with patch("customer_api.order_import.IMPORT_READ_SIZE", 2):
+			parsed = list(iter_orders(path))
+
+		self.assertEqual(parsed, [(123, 3), (4567, 8), (89, 11)])
+
+		print("✅ Test 5 Passed: Chunk boundaries")
+
+	def test_06_orders_received_by_webhook_are_duplicates(self):
+		"""Test 6: An order already logged under another topic is not imported again"""
+		from customer_api.api import create_webhook_log
+		from customer_api.order_import import get_import_state, run_import, start_import
+
+		create_webhook_log(self.wp_site, self.orders[0], topic="order.created")
+		frappe.db.commit()
+		path = self._write(frappe.as_json(self.orders[:1], indent=None))
+
+		state = start_import(self.wp_site.name, path)
+		run_import(state.import_id)
+
+		state = get_import_state(state.import_id)
+		self.assertEqual((state.processed, state.duplicates, state.created), (1, 1, 0))
+		self.assertEqual(frappe.db.count("WordPress Webhook Log", {"wordpress_site": self.wp_site.name}), 1)
+
+		print("✅ Test 6 Passed: Webhook orders skipped")
+
+
+class TestMonitoring(unittest.TestCase):
+	"""
+	Test Suite for the stage timing and query-count instrumentation
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.wp_site = create_test_wordpress_site(max_retry_attempts=0)
+		self.customer_name = f"Traced Order {frappe.generate_hash(length=8)}"
+		frappe.conf.customer_api_trace_sample_rate = 1
+
+	def tearDown(self):
+		"""Clean up test data"""
+		frappe.conf.pop("customer_api_trace_sample_rate", None)
+		for customer in frappe.get_all("Customer", filters={"customer_name": self.customer_name}, pluck="name"):
+			for contact in frappe.get_all(
+				"Dynamic Link", filters={"link_name": customer, "parenttype": "Contact"}, pluck="parent"
+			):
+				frappe.delete_doc("Contact", contact, force=True)
+			frappe.delete_doc("Customer", customer, force=True)
+		delete_test_wordpress_site(self.wp_site)
+
+	def test_01_stage_counts_queries(self):
+		"""Test 1: A stage records its SQL statements"""
+		from customer_api.monitoring import finish_trace, stage, start_trace
+
+		trace = start_trace("test")
+		with stage("outer"):
+			frappe.db.sql("select 1")
+			with stage("inner"):
+				frappe.db.sql("select 2")
+		finish_trace(trace)
+
+		self.assertEqual([(name, queries) for name, _seconds, queries in trace.stages], [("inner", 1), ("outer", 2)])
+		self.assertEqual(trace.queries, 2)
+
+		print("✅ Test 1 Passed: Stage query counting")
+
+	def test_02_breakdown_stored_on_log(self):
+		"""Test 2: The stage breakdown of a sampled order is stored on its log and in the histograms"""
+		from customer_api.api import create_webhook_log, process_woocommerce_order
+		from customer_api.cache import get_site_config_by_name
+		from customer_api.monitoring import render_metrics
+
+		first_name, last_name = self.customer_name.split(" ", 1)
+		order_data = {
+			"id": 8001,
+			"billing": {"first_name": first_name, "last_name": last_name, "email": f"{last_name}@example.com"},
+			"line_items": []
+		}
+		log = create_webhook_log(self.wp_site, order_data, topic="order.created")
+
+		with self.assertRaises(Exception):
+			process_woocommerce_order(order_data, get_site_config_by_name(self.wp_site.name), log)
+
+		breakdown = json.loads(frappe.db.get_value("WordPress Webhook Log", log.name, "performance_breakdown"))
+		self.assertEqual(breakdown["trace"], "process_woocommerce_order")
+		self.assertIn("customer", [row["stage"] for row in breakdown["stages"]])
+		self.assertGreater(breakdown["queries"], 0)
+		self.assertIn('customer_api_stage_duration_seconds_bucket{stage="customer",le="+Inf"}', render_metrics())
+
+		print("✅ Test 2 Passed: Sampled breakdown and histograms")
+
+	def test_03_event_counters(self):
+		"""Test 3: Received and deduplicated orders are counted per site"""
+		from customer_api.api import receive_woocommerce_order
+		from customer_api.cache import get_site_config_by_name
+		from customer_api.monitoring import render_metrics
+
+		wp_site = get_site_config_by_name(self.wp_site.name)
+		wp_site.processing_mode = "Batch Queue"
+		order_data = {"id": 8002, "billing": {}, "line_items": []}
+
+		receive_woocommerce_order(wp_site, order_data, "order.created")
+		receive_woocommerce_order(wp_site, order_data, "order.created")
+
+		metrics = render_metrics()
+		self.assertIn(f'customer_api_webhook_events_total{{event="received",site="{self.wp_site.name}"}} 1', metrics)
+		self.assertIn(f'customer_api_webhook_events_total{{event="deduped",site="{self.wp_site.name}"}} 1', metrics)
+
+		print("✅ Test 3 Passed: Per-site event counters")
+
+	def test_04_queue_depth_snapshot(self):
+		"""Test 4: The queue depth gauge is a snapshot taken by the scheduler, not by the scrape"""
+		from customer_api.api import create_webhook_log
+		from customer_api.monitoring import render_metrics
+		from customer_api.webhook_queue import record_queue_depth
+
+		create_webhook_log(self.wp_site, {"id": 8003}, topic="order.created")
+		self.assertNotIn(f'customer_api_webhook_queue_depth{{site="{self.wp_site.name}",status="Pending"}} 1', render_metrics())
+
+		record_queue_depth()
+		metrics = render_metrics()
+		self.assertIn(f'customer_api_webhook_queue_depth{{site="{self.wp_site.name}",status="Pending"}} 1', metrics)
+		self.assertIn(f'customer_api_webhook_queue_depth{{site="{self.wp_site.name}",status="Processing"}} 0', metrics)
+		# Unlabeled series have no braces
+		self.assertRegex(metrics, r"(?m)^customer_api_webhook_queue_depth_updated \d+$")
+
+		print("✅ Test 4 Passed: Queue depth snapshot")
+
+
+class TestWebhookBody(unittest.TestCase):
+	"""
+	Test Suite for reading, verifying and parsing the webhook body
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.secret = frappe.generate_hash(length=20)
+		self.wp_site = create_test_wordpress_site(webhook_secret=self.secret, max_payload_size_kb=1)
+
+	def tearDown(self):
+		"""Clean up test data"""
+		frappe.local.request = None
+		frappe.local.response = frappe._dict(docs=[])
+		delete_test_wordpress_site(self.wp_site)
+
+	def _post(self, body, signature=None):
+		"""Helper to call the listener with a raw body"""
+		import base64
+		import hashlib
+		import hmac
+
+		from werkzeug.test import EnvironBuilder
+		from werkzeug.wrappers import Request
+
+		from customer_api.api import woocommerce_webhook_listener
+
+		if signature is None:
+			signature = base64.b64encode(hmac.new(self.secret.encode(), body, hashlib.sha256).digest()).decode()
+
+		frappe.local.request = Request(EnvironBuilder(
+			method="POST",
+			data=body,
+			content_type="application/json",
+			headers={"X-WC-Webhook-Source": self.wp_site.site_url, "X-WC-Webhook-Signature": signature}
+		).get_environ())
+		frappe.local.response = frappe._dict(docs=[])
+		return woocommerce_webhook_listener()
+
+	def test_01_oversized_body_is_rejected(self):
+		"""Test 1: A body above the site's limit gets HTTP 413"""
+		result = self._post(json.dumps({"id": 9001, "note": "x" * 2048}).encode())
+
+		self.assertFalse(result["success"])
+		self.assertEqual(frappe.local.response.http_status_code, 413)
+		self.assertFalse(frappe.db.exists("WordPress Webhook Log", {"wordpress_site": self.wp_site.name}))
+
+		print("✅ Test 1 Passed: Oversized body rejected")
+
+	def test_02_signature_checked_before_parsing(self):
+		"""Test 2: A forged body is rejected by its signature, an authentic one by its JSON"""
+		self.assertEqual(self._post(b"{not json", signature="forged")["message"], "Invalid signature")
+		self.assertEqual(self._post(b"{not json")["message"], "Invalid JSON payload")
+
+		print("✅ Test 2 Passed: Signature verified before parsing")
+
+
+class TestWebhookRateLimit(unittest.TestCase):
+	"""
+	Test Suite for webhook rate limiting and load shedding
+	"""
+
+	def setUp(self):
+		"""Set up test data"""
+		self.wp_site = create_test_wordpress_site(rate_limit_per_second=0.01, rate_limit_burst=2)
+
+	def tearDown(self):
+		"""Clean up test data"""
+		from customer_api.rate_limit import RATE_LIMIT_KEY
+
+		frappe.conf.pop("woocommerce_load_shedding", None)
+		frappe.cache().delete_keys(f"{RATE_LIMIT_KEY}:{self.wp_site.name}")
+		frappe.local.request = None
+		frappe.local.response = frappe._dict(docs=[])
+		delete_test_wordpress_site(self.wp_site)
+
+	def _post(self, remote_addr="203.0.113.10"):
+		"""Helper to call the listener from a client IP"""
+		from werkzeug.test import EnvironBuilder
+		from werkzeug.wrappers import Request
+
+		from customer_api.api import woocommerce_webhook_listener
+
+		frappe.local.request = Request(EnvironBuilder(
+			method="POST",
+			data=b"{not json",
+			content_type="application/json",
+			headers={"X-WC-Webhook-Source": self.wp_site.site_url},
+			environ_base={"REMOTE_ADDR": remote_addr}
+		).get_environ())
+		frappe.local.request_ip = remote_addr
+		frappe.local.response = frappe._dict(docs=[])
+		return woocommerce_webhook_listener()
+
+	def test_01_over_limit_gets_429(self):
+		"""Test 1: Deliveries beyond the burst get HTTP 429 with Retry-After, per client IP"""
+		self.assertEqual(self._post()["message"], "Invalid JSON payload")
+		self.assertEqual(self._post()["message"], "Invalid JSON payload")
+
+		response = self._post()
+		self.assertEqual(response.status_code, 429)
+		self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+		self.assertEqual(json.loads(response.get_data())["message"]["message"], "Rate limit exceeded")
+
+		# Another sender has its own bucket
+		self.assertEqual(self._post(remote_addr="203.0.113.11")["message"], "Invalid JSON payload")
+
+		print("✅ Test 1 Passed: Rate limit per site and client IP")
+
+	def test_02_shed_load_is_queued(self):
+		"""Test 2: While shedding load, orders of synchronous sites are queued"""
+		from customer_api.api import receive_woocommerce_order
+		from customer_api.cache import get_site_config_by_name
+		from customer_api.rate_limit import track_listener_load
+
+		frappe.conf.woocommerce_load_shedding = 1
+		with track_listener_load() as shed_load:
+			self.assertTrue(shed_load)
+
+		wp_site = get_site_config_by_name(self.wp_site.name)
+		self.assertEqual(wp_site.processing_mode, "Synchronous")
+		result = receive_woocommerce_order(wp_site, {"id": 9101, "billing": {}, "line_items": []}, "order.created", defer=True)
+
+		self.assertTrue(result["queued"])
+		self.assertEqual(frappe.db.get_value("WordPress Webhook Log", result["log_id"], "status"), "Pending")
+
+		print("✅ Test 2 Passed: Shed load queued")
@@ -0,0 +1,352 @@
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import add_to_date, cint, now_datetime
+
+from customer_api.api import (
+	WEBHOOK_QUEUE,
+	TransactionLostError,
+	enqueue_webhook_log,
+	get_configured_queue,
+	get_next_retry_at,
+	process_woocommerce_order,
+	update_site_stat
+)
+from customer_api.cache import get_site_config_by_name
+from customer_api.monitoring import set_gauge
+
+
+# Logs claimed (and committed) together
+DRAIN_BATCH_SIZE = 50
+
+# A drain job stops claiming new batches after this many seconds so the
+# next scheduler tick can take over
+DRAIN_TIME_BUDGET = 50
+
+# Logs stuck in Processing for longer than this are handed back to the queue
+STALE_CLAIM_MINUTES = 30
+
+
+def schedule_drain():
+	"""
+	Scheduler entry point: start the configured number of drain jobs.
+
+	Every job claims its own batches with SKIP LOCKED, so running several in
+	parallel never processes a log twice. Configure with the
+	`woocommerce_drain_workers` and `woocommerce_drain_batch_size` site
+	config keys.
+	"""
+	release_stale_claims()
+	requeue_due_retries()
+	record_queue_depth()
+
+	if not get_batch_sites() and not has_pending_retries():
+		return
+
+	enqueue_drain_jobs()
+
+
+def enqueue_drain_jobs(workers=None):
+	"""Enqueue `workers` drain jobs (default: `woocommerce_drain_workers`, at least one)."""
+	workers = max(cint(workers or frappe.conf.get("woocommerce_drain_workers")), 1)
+	queue = get_configured_queue(WEBHOOK_QUEUE)
+
+	for _i in range(workers):
+		frappe.enqueue(
+			"customer_api.webhook_queue.drain_pending_webhook_logs",
+			queue=queue,
+			timeout=DRAIN_TIME_BUDGET * 10,
+			batch_size=cint(frappe.conf.get("woocommerce_drain_batch_size")) or DRAIN_BATCH_SIZE
+		)
+
+	return workers
+
+
+def drain_pending_webhook_logs(batch_size=DRAIN_BATCH_SIZE, max_batches=None, time_budget=DRAIN_TIME_BUDGET):
+	"""
+	Claim and process Pending logs of "Batch Queue" sites and retried logs
+	of any site in batches.
+
+	Args:
+		batch_size (int): Logs claimed and committed per batch
+		max_batches (int): Stop after this many batches (optional)
+		time_budget (int): Stop claiming new batches after this many seconds
+
+	Returns:
+		int: Number of logs processed
+	"""
+	started = time.monotonic()
+	processed = 0
+	batches = 0
+
+	while True:
+		log_names = claim_pending_logs(batch_size)
+		if not log_names:
+			break
+
+		process_log_batch(log_names)
+		processed += len(log_names)
+		batches += 1
+
+		if max_batches and batches >= cint(max_batches):
+			break
+		if time.monotonic() - started >= time_budget:
+			break
+
+	return processed
+
+
+def get_batch_sites():
+	"""Return the enabled WordPress Sites drained by the batch worker."""
+	return frappe.get_all(
+		"WordPress Site",
+		filters={"enabled": 1, "processing_mode": "Batch Queue"},
+		pluck="name"
+	)
+
+
+def claim_pending_logs(batch_size=DRAIN_BATCH_SIZE):
+	"""
+	Claim up to `batch_size` Pending logs by moving them to Processing.
+
+	Takes the logs of Batch Queue sites and, for every site, logs queued
+	again after a failure (attempts > 0). First deliveries of Synchronous
+	and Background Job sites are left to their request or job. Rows locked
+	by another drain job are skipped rather than waited on.
+	"""
+	log_names = frappe.db.sql("""
+		select name
+		from `tabWordPress Webhook Log`
+		where status = 'Pending' and (wordpress_site in %(sites)s or attempts > 0)
+		order by creation
+		limit %(limit)s
+		for update skip locked
+	""", {"sites": tuple(get_batch_sites()) or ("",), "limit": cint(batch_size)}, pluck=True)
+
+	if log_names:
+		frappe.db.sql("""
+			update `tabWordPress Webhook Log`
+			set status = 'Processing', claimed_at = %(now)s
+			where name in %(names)s
+		""", {"names": tuple(log_names), "now": now_datetime()})
+
+	frappe.db.commit()
+	return log_names
+
+
+def process_log_batch(log_names):
+	"""
+	Process claimed logs with one commit for the whole batch.
+
+	Logs are grouped by site so the site settings, selling defaults and
+	company are resolved once per batch. Each order runs inside its own
+	savepoint (see process_woocommerce_order), so a failing order is marked
+	Failed without affecting the rest of the batch; so is a log that cannot
+	be loaded (e.g. its payload File is gone). If the database rolls back
+	the whole transaction (deadlock, lock wait timeout), every log of the
+	batch goes back to Pending.
+	"""
+	logs = frappe.get_all(
+		"WordPress Webhook Log",
+		filters={"name": ["in", log_names]},
+		fields=["name", "wordpress_site"],
+		order_by="creation asc"
+	)
+
+	logs_by_site = {}
+	for log in logs:
+		logs_by_site.setdefault(log.wordpress_site, []).append(log.name)
+
+	frappe.flags.customer_api_defer_commit = True
+	try:
+		for site_name, site_log_names in logs_by_site.items():
+			wp_site = get_site_config_by_name(site_name)
+			if not wp_site:
+				mark_logs_failed(site_log_names, "WordPress site not registered")
+				continue
+
+			for log_name in site_log_names:
+				log_doc = None
+				try:
+					log_doc = frappe.get_doc("WordPress Webhook Log", log_name)
+					order_data = log_doc.get_payload()
+					process_woocommerce_order(order_data, wp_site, log_doc)
+				except TransactionLostError:
+					# The earlier orders of the batch are undone as well
+					raise
+				except Exception as e:
+					# The order's writes are rolled back and its log is marked Failed;
+					# a log that could not be loaded is marked here
+					frappe.log_error(frappe.get_traceback(), "WooCommerce Webhook Error")
+					if not log_doc or log_doc.status != "Failed":
+						mark_log_failed(log_name, wp_site, str(e))
+
+		frappe.db.commit()
+
+	except Exception:
+		# Unexpected batch-level failure: hand the logs back to the queue
+		frappe.db.rollback()
+		frappe.db.sql("""
+			update `tabWordPress Webhook Log`
+			set status = 'Pending', claimed_at = null
+			where name in %(names)s and status = 'Processing'
+		""", {"names": tuple(log_names)})
+		frappe.db.commit()
+		frappe.log_error(frappe.get_traceback(), "WooCommerce Batch Processing Error")
+
+	finally:
+		frappe.flags.customer_api_defer_commit = False
+
+
+def mark_logs_failed(log_names, error_message):
+	"""Mark claimed logs as Failed without processing them."""
+	frappe.db.sql("""
+		update `tabWordPress Webhook Log`
+		set status = 'Failed', error_message = %(error)s
+		where name in %(names)s
+	""", {"names": tuple(log_names), "error": error_message})
+
+
+def mark_log_failed(log_name, wp_site, error_message):
+	"""Mark a claimed log that could not be processed as Failed and schedule its retry."""
+	attempts = cint(frappe.db.get_value("WordPress Webhook Log", log_name, "attempts")) + 1
+	frappe.db.set_value(
+		"WordPress Webhook Log",
+		log_name,
+		{
+			"status": "Failed",
+			"error_message": error_message,
+			"attempts": attempts,
+			"next_retry_at": get_next_retry_at(attempts, wp_site.max_retry_attempts)
+		}
+	)
+	update_site_stat(wp_site.name, "failed")
+
+
+def release_stale_claims():
+	"""Return logs stuck in Processing (e.g. after a worker crash) to Pending."""
+	cutoff = add_to_date(now_datetime(), minutes=-STALE_CLAIM_MINUTES)
+	stale_logs = frappe.get_all(
+		"WordPress Webhook Log",
+		filters={"status": "Processing", "claimed_at": ["<", cutoff]},
+		fields=["name", "wordpress_site"]
+	)
+	if not stale_logs:
+		return
+
+	frappe.db.sql("""
+		update `tabWordPress Webhook Log`
+		set status = 'Pending', claimed_at = null
+		where name in %(names)s and status = 'Processing'
+	""", {"names": tuple(log.name for log in stale_logs)})
+	frappe.db.commit()
+
+	# Logs of Background Job sites need a new job; Batch Queue logs are drained
+	for log in stale_logs:
+		wp_site = get_site_config_by_name(log.wordpress_site)
+		if wp_site and wp_site.processing_mode == "Background Job":
+			enqueue_webhook_log(wp_site, log.name)
+
+
+# ==================== RETRIES ====================
+
+def has_pending_retries():
+	"""Return whether retried logs are waiting for a drain job."""
+	return bool(frappe.db.exists("WordPress Webhook Log", {"status": "Pending", "attempts": [">", 0]}))
+
+
+def requeue_due_retries():
+	"""Move Failed logs whose next_retry_at has passed back to Pending for the drain jobs."""
+	log_names = frappe.get_all(
+		"WordPress Webhook Log",
+		filters={"status": "Failed", "next_retry_at": ["<=", now_datetime()]},
+		pluck="name"
+	)
+	if not log_names:
+		return 0
+
+	frappe.db.sql("""
+		update `tabWordPress Webhook Log`
+		set status = 'Pending', next_retry_at = null, claimed_at = null
+		where name in %(names)s and status = 'Failed'
+	""", {"names": tuple(log_names)})
+	frappe.db.commit()
+
+	return len(log_names)
+
+
+@frappe.whitelist()
+def reprocess_logs(log_names=None, wordpress_site=None, workers=None):
+	"""
+	Reprocess Failed webhook logs from their stored payload.
+
+	The logs are queued again and cleared by parallel drain jobs, e.g. after
+	fixing the item mappings that made a backlog of orders fail.
+
+	Args:
+		log_names (list): Logs to reprocess (JSON list accepted)
+		wordpress_site (str): Reprocess every Failed log of this site instead
+		workers (int): Drain jobs to start (default: `woocommerce_drain_workers`)
+
+	Returns:
+		dict: Number of logs queued and drain jobs started
+	"""
+	frappe.only_for("System Manager")
+
+	filters = {"status": "Failed"}
+	if log_names:
+		filters["name"] = ["in", frappe.parse_json(log_names)]
+	elif wordpress_site:
+		filters["wordpress_site"] = wordpress_site
+	else:
+		frappe.throw(_("Select the webhook logs or the WordPress Site to reprocess"))
+
+	log_names = frappe.get_all("WordPress Webhook Log", filters=filters, pluck="name")
+	if not log_names:
+		return {"success": True, "queued": 0, "drain_jobs": 0}
+
+	# attempts > 0 makes the drain jobs pick the logs up whatever the site's processing mode
+	frappe.db.sql("""
+		update `tabWordPress Webhook Log`
+		set status = 'Pending', next_retry_at = null, claimed_at = null, attempts = greatest(attempts, 1)
+		where name in %(names)s and status = 'Failed'
+	""", {"names": tuple(log_names)})
+	frappe.db.commit()
+
+	return {
+		"success": True,
+		"queued": len(log_names),
+		"drain_jobs": enqueue_drain_jobs(workers)
+	}
+
+
+# ==================== METRICS ====================
+
+def record_queue_depth():
+	"""
+	Snapshot the Pending and Processing logs per site into the queue depth gauge.
+
+	Runs once a minute with the drain scheduler, so scraping the metrics
+	never counts rows. The grouped count only reads the (status,
+	wordpress_site, creation) index.
+	"""
+	depth = {
+		(wp_site_name, status): count
+		for wp_site_name, status, count in frappe.db.sql("""
+			select wordpress_site, status, count(*)
+			from `tabWordPress Webhook Log`
+			where status in ('Pending', 'Processing')
+			group by status, wordpress_site
+		""")
+	}
+	for wp_site_name in frappe.get_all("WordPress Site", filters={"enabled": 1}, pluck="name"):
+		for status in ("Pending", "Processing"):
+			depth.setdefault((wp_site_name, status), 0)
+
+	set_gauge(
+		"customer_api_webhook_queue_depth",
+		[({"site": wp_site_name, "status": status}, count) for (wp_site_name, status), count in depth.items()],
+		replace=True
+	)
+	set_gauge("customer_api_webhook_queue_depth_updated", [({}, int(time.time()))], replace=True)